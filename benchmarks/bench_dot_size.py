@@ -0,0 +1,33 @@
+#!/usr/bin/env python
+"""Compare DOT size and serialization time of ``build_graph`` and ``dotwriter``.
+
+Usage: python benchmarks/bench_dot_size.py [N_NODES] [EDGES_PER_NODE]
+"""
+import sys
+import time
+
+from easygv import dotwriter
+from easygv import easygv
+
+from common import synthetic_input, synthetic_attrs
+
+
+def main(n_nodes=20000, edges_per_node=3):
+    """Print the size of the DOT text produced by both serializers."""
+    graph_input = synthetic_input(n_nodes=n_nodes, edges_per_node=edges_per_node)
+    attrs = synthetic_attrs()
+
+    t0 = time.time()
+    full = easygv.build_graph(graph_input=graph_input, attrs=attrs).string()
+    t1 = time.time()
+    compact = dotwriter.dot_string(graph_input=graph_input, attrs=attrs)
+    t2 = time.time()
+
+    print("nodes={n} edges={e}".format(n=len(graph_input.Nodes), e=len(graph_input.Edges)))
+    print("build_graph: {size:>12,d} bytes  {t:6.2f}s".format(size=len(full.encode()), t=t1 - t0))
+    print("dotwriter:   {size:>12,d} bytes  {t:6.2f}s".format(size=len(compact.encode()), t=t2 - t1))
+    print("reduction:   {pct:6.1f}%".format(pct=100.0 * (1 - len(compact.encode()) / float(len(full.encode())))))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
@@ -0,0 +1,134 @@
+#!/usr/bin/env python
+"""Compare the wall-clock time of a sequential and a pipelined ``draw``.
+
+The sequential run loads the definition, then parses the attribute config,
+serializes the whole DOT text, saves it and renders one format after the
+other.  The pipelined run parses the config while the definition loads and
+feeds the DOT text into one graphviz process per format as it is written
+(``render.render_concurrently``).
+
+Usage: python benchmarks/bench_pipeline.py [N_NODES] [EDGES_PER_NODE] [JOBS]
+
+Needs the graphviz ``dot`` program.
+"""
+import sqlite3
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from easygv import dotwriter
+from easygv import easygv
+from easygv import render
+from easygv import sources
+
+from common import synthetic_input
+
+
+FORMATS = ['pdf', 'png', 'svg']
+
+ATTRS_YAML = """
+GRAPH:
+    fontname: Cantarell
+NODES:
+    BASE:
+        shape: box
+        style: rounded
+    ACTUAL:
+        analysis:
+            fillcolor: '#B83545'
+            style: filled,rounded
+        location:
+            fillcolor: '#86B835'
+            shape: box3d
+            style: filled
+        message:
+            fillcolor: '#B89235'
+            shape: egg
+            style: filled
+        mover:
+            fillcolor: '#3591B8'
+            shape: egg
+            style: filled
+EDGES:
+    BASE:
+        arrowsize: 0.7
+    ACTUAL:
+        flow:
+            color: '#3591B8'
+        control:
+            style: dashed
+CLUSTERS:
+    BASE:
+        color: grey
+    ACTUAL:
+        group:
+            style: rounded
+"""
+
+
+def write_database(graph_input, path):
+    """Save ``graph_input`` as a SQLite definition at ``path``."""
+    with sqlite3.connect(str(path)) as connection:
+        for name, table in graph_input.items():
+            table.to_sql(name, connection, index=False)
+
+
+def sequential(definition, attr_config, directory):
+    """Run the stages one after the other and return the time of each."""
+    times = []
+    t0 = time.time()
+    graph_input = sources.load_graph_input_sqlite(path=definition)
+    attrs = easygv.process_attrs(attr_config)
+    times.append(('load', time.time() - t0))
+
+    t0 = time.time()
+    gv_path = directory / 'sequential.gv'
+    render.save_text(text=dotwriter.dot_string(graph_input=graph_input, attrs=attrs), path=gv_path)
+    times.append(('write dot', time.time() - t0))
+
+    t0 = time.time()
+    for fmt in FORMATS:
+        render.render_file(gv_path=gv_path, fmt=fmt)
+    times.append(('render', time.time() - t0))
+    return times
+
+
+def pipelined(definition, attr_config, directory, jobs=None):
+    """Run the stages overlapped and return the time of each."""
+    times = []
+    t0 = time.time()
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        attrs_future = pool.submit(easygv.process_attrs, attr_config)
+        graph_input = sources.load_graph_input_sqlite(path=definition)
+        attrs = attrs_future.result()
+    times.append(('load', time.time() - t0))
+
+    t0 = time.time()
+    render.render_concurrently(chunks=dotwriter.iter_dot(graph_input=graph_input, attrs=attrs),
+                               gv_path=directory / 'pipelined.gv', formats=FORMATS, jobs=jobs)
+    times.append(('write dot + render', time.time() - t0))
+    return times
+
+
+def main(n_nodes=1000, edges_per_node=2, jobs=None):
+    """Print the stage and total times of both runs."""
+    with tempfile.TemporaryDirectory() as tmp:
+        directory = Path(tmp)
+        attr_config = render.save_text(text=ATTRS_YAML, path=directory / 'attrs.yaml')
+        definition = directory / 'graph.db'
+        write_database(graph_input=synthetic_input(n_nodes=n_nodes, edges_per_node=edges_per_node, n_clusters=10),
+                       path=definition)
+        print("nodes={n} edges={e} formats={f}".format(n=n_nodes, e=n_nodes * edges_per_node, f=','.join(FORMATS)))
+
+        runs = [('sequential', sequential, {}), ('pipelined', pipelined, dict(jobs=jobs))]
+        for name, run, kwargs in runs:
+            times = run(definition=definition, attr_config=attr_config, directory=directory, **kwargs)
+            stages = '  '.join('{stage} {t:6.2f}s'.format(stage=stage, t=t) for stage, t in times)
+            print("{name:<10}  total {total:6.2f}s  {stages}".format(name=name,
+                                                                     total=sum(t for _, t in times), stages=stages))
+
+
+if __name__ == '__main__':
+    main(*[int(a) for a in sys.argv[1:]])
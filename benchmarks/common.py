@@ -0,0 +1,48 @@
+"""Synthetic inputs shared by the benchmark scripts."""
+import numpy as np
+import pandas as pd
+
+from munch import Munch
+
+
+NODE_CLASSES = ['analysis', 'location', 'message', 'mover']
+
+
+def synthetic_input(n_nodes=20000, edges_per_node=3, n_clusters=50, seed=0):
+    """Return a random graph definition shaped like the output of ``load_graph_input``."""
+    rng = np.random.RandomState(seed)
+    names = np.array(['n{i}'.format(i=i) for i in range(n_nodes)])
+
+    nodes = pd.DataFrame({'name': names,
+                          'label': ['Node {i}'.format(i=i) for i in range(n_nodes)],
+                          'node_class': rng.choice(NODE_CLASSES, size=n_nodes),
+                          'cluster_name': ['cluster_c{i}'.format(i=i) for i in rng.randint(0, n_clusters, size=n_nodes)]})
+
+    n_edges = n_nodes * edges_per_node
+    edges = pd.DataFrame({'u_name': names[rng.randint(0, n_nodes, size=n_edges)],
+                          'v_name': names[rng.randint(0, n_nodes, size=n_edges)],
+                          'label': '',
+                          'edge_class': rng.choice(['flow', 'control'], size=n_edges)})
+
+    clusters = pd.DataFrame({'name': ['cluster_c{i}'.format(i=i) for i in range(n_clusters)],
+                             'label': ['Cluster {i}'.format(i=i) for i in range(n_clusters)],
+                             'cluster_class': 'group'})
+
+    return Munch(Nodes=nodes, Edges=edges, Clusters=clusters)
+
+
+def synthetic_attrs():
+    """Return an attribute tree resembling the factory ``attrs.yaml``."""
+    base = Munch(penwidth=2, fontcolor='black', fontsize=11, fontname='Cantarell', shape='box', style='rounded')
+    nodes = Munch(BASE=base,
+                  analysis=Munch(fillcolor='#B83545', fontcolor='#F5F5F5', shape='box', style='filled,rounded'),
+                  location=Munch(fillcolor='#86B835', shape='box3d', style='filled'),
+                  message=Munch(fillcolor='#B89235', fontcolor='#3C3F41', shape='egg', style='filled'),
+                  mover=Munch(fillcolor='#3591B8', fontcolor='#F5F5F5', shape='egg', style='filled'))
+    edges = Munch(BASE=Munch(arrowsize=0.7),
+                  flow=Munch(color='#3591B8', penwidth=1.5),
+                  control=Munch(color='#B83545', style='dashed'))
+    return Munch(graph=Munch(fontname='Cantarell', fontsize=12),
+                 nodes=nodes, edges=edges,
+                 clusters=Munch(group=Munch(style='rounded', color='grey')),
+                 rules=Munch(nodes=[], edges=[], clusters=[]))
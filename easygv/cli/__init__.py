@@ -6,6 +6,10 @@ import logzero
 from logzero import logger as log
 
 import os
+import functools
+import subprocess
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from pathlib import Path
 import appdirs
 
@@ -14,10 +18,20 @@ from munch import Munch
 
 import click
 
-import graphviz as gv
-
 from easygv.cli import config as _config
 from easygv import easygv
+from easygv import dotwriter
+from easygv import rules
+from easygv import sources
+from easygv import simplify as _simplify
+from easygv import render
+from easygv import focus as _focus
+from easygv import components
+from easygv import tiles as _tiles
+from easygv import daemon as _daemon
+from easygv import diff as _diff
+from easygv import preview as _preview
+from easygv import optimize as _optimize
 
 
 # Metadata
@@ -102,7 +116,81 @@ def config(ctx, generate_config, kind, prefix):
                                    prefix=prefix)
 
 
-draw_formats = ['all', 'pdf', 'png', 'svg']
+@main.group('daemon', short_help='Run easygv commands from a warm background process.')
+def daemon():
+    """Manage the background process that answers draw and config.
+
+    While the daemon is running, 'easygv draw' and 'easygv config' are sent to
+    it over a local Unix socket (EASYGV_SOCKET) and skip the start-up imports;
+    parsed DEFINITION and ATTR_CONFIG files are cached until they change.
+    Set EASYGV_NO_DAEMON to always run in-process.
+    """
+
+
+@daemon.command('start')
+def daemon_start():
+    """Start the daemon unless it is already running."""
+    if not _daemon.start():
+        raise click.ClickException("The daemon did not start; see {p}.".format(p=_daemon.socket_path().with_suffix('.log')))
+    log.info("easygv daemon running on {p}".format(p=_daemon.socket_path()))
+
+
+@daemon.command('stop')
+def daemon_stop():
+    """Stop the running daemon."""
+    if _daemon.stop():
+        log.info("Stopped the easygv daemon.")
+    else:
+        log.info("No easygv daemon was running.")
+
+
+@daemon.command('status')
+def daemon_status():
+    """Report whether the daemon is running."""
+    if _daemon.is_running():
+        click.echo("running on {p}".format(p=_daemon.socket_path()))
+    else:
+        click.echo("not running")
+
+
+def table_options(ctx, param, values):
+    """Parse repeated ``TABLE=SQL`` options into a dict keyed by table name."""
+    parsed = {}
+    for value in values:
+        table, sep, sql = value.partition('=')
+        if not sep or table not in sources.TABLE_COLUMNS:
+            raise click.BadParameter("expected TABLE=SQL with TABLE one of {tables}, not '{value}'.".format(
+                tables=', '.join(sources.TABLE_COLUMNS), value=value))
+        parsed[table] = sql
+    return parsed
+
+
+def is_database(definition):
+    """Return whether DEFINITION is a SQLite database rather than an Excel workbook."""
+    return definition.suffix.lower() in sources.SQLITE_SUFFIXES
+
+
+def load_definition(definition, query=None, where=None, columns=None):
+    """Return the graph_input tables of an Excel workbook or SQLite database.
+
+    ``columns`` are the further columns a database query selects, by table
+    (``rules.rule_columns``); workbooks are always read whole.
+    """
+    if is_database(definition):
+        return sources.load_graph_input_sqlite(path=definition, queries=query, where=where, columns=columns)
+    return easygv.load_graph_input(path=definition)
+
+
+def load_definitions(definition, query=None, where=None, columns=None):
+    """Return the graph_input of every graph in DEFINITION, keyed by graph name (`None` if only one)."""
+    if is_database(definition):
+        return {None: load_definition(definition=definition, query=query, where=where, columns=columns)}
+    return easygv.load_graph_inputs(path=definition)
+
+
+draw_formats = ['all', 'pdf', 'png', 'svg', 'svgmin', 'svgz', 'html', 'tiles']
+# What ``--formats all`` expands to; tile pyramids are only made on request.
+all_formats = ['pdf', 'png', 'svg']
 draw_layouts = ["dot", "neato", "fdp", "sfdp", "twopi", "circo"]
 
 
@@ -127,16 +215,133 @@ draw_layouts = ["dot", "neato", "fdp", "sfdp", "twopi", "circo"]
               help="""Which layout program?""",
               show_default=True,
               default='dot')
+@click.option('--compact/--no-compact',
+              help="Write per-class default blocks instead of copying class attributes onto every element.",
+              show_default=True,
+              default=False)
+@click.option('-e', '--edges',
+              type=click.Path(exists=True, dir_okay=False),
+              help="Read the Edges table from this CSV or Arrow IPC file in chunks instead of from DEFINITION. "
+              "Implies --compact.",
+              show_default=True,
+              default=None)
+@click.option('--chunksize',
+              type=click.INT,
+              help="Number of edge rows to read at a time with --edges.",
+              show_default=True,
+              default=100000)
+@click.option('--collapse-duplicates',
+              is_flag=True,
+              help="Merge parallel edges into one edge whose penwidth grows with the count.",
+              show_default=True,
+              default=False)
+@click.option('--transitive-reduction',
+              is_flag=True,
+              help="Drop edges implied by longer paths (DAGs only).",
+              show_default=True,
+              default=False)
+@click.option('--bundle-hubs',
+              type=click.INT,
+              help="Replace a hub's fan-out to at least this many leaf nodes of one class with a summary node.",
+              show_default=True,
+              default=None)
+@click.option('--save-layout',
+              is_flag=True,
+              help="Lay the graph out once, save the positioned graph as <NAME>.layout.gv and render every format from it.",
+              show_default=True,
+              default=False)
+@click.option('--reuse-layout',
+              type=click.Path(exists=True, dir_okay=False),
+              help="Skip the layout stage by rendering with the positions saved by --save-layout "
+              "(the graph's nodes and edges must be unchanged).",
+              show_default=True,
+              default=None)
+@click.option('-q', '--query',
+              multiple=True,
+              callback=table_options,
+              help="For a SQLite DEFINITION: TABLE=SQL giving the table name or SELECT statement for "
+              "Nodes, Edges or Clusters (repeatable).")
+@click.option('-w', '--where',
+              multiple=True,
+              callback=table_options,
+              help="For a SQLite DEFINITION: TABLE=CONDITION filtering Nodes, Edges or Clusters in the database "
+              "(repeatable).")
+@click.option('--focus',
+              type=click.STRING,
+              help="Only draw the neighborhood of these comma separated node names.",
+              show_default=True,
+              default=None)
+@click.option('--depth',
+              type=click.INT,
+              help="How many hops around the --focus nodes to include.",
+              show_default=True,
+              default=1)
+@click.option('--direction',
+              type=click.Choice(_focus.DIRECTIONS),
+              help="Which edges to follow from the --focus nodes.",
+              show_default=True,
+              default='both')
+@click.option('--split-components',
+              is_flag=True,
+              help="Lay out each connected component in a separate worker process and pack the results.",
+              show_default=True,
+              default=False)
+@click.option('-j', '--jobs',
+              type=click.INT,
+              help="Number of worker processes (or concurrent renders).  [default: number of CPUs]",
+              default=None)
+@click.option('--time-budget',
+              type=click.FLOAT,
+              help="Seconds allowed for layout and rendering.  Graphviz is killed when its share runs out "
+              "and the layout is retried with cheaper strategies (reduced mclimit, splines=line, no edge "
+              "labels, sfdp).",
+              show_default=True,
+              default=None)
+@click.option('--tile-size',
+              type=click.INT,
+              help="Edge in pixels of the PNG tiles made by --formats tiles.",
+              show_default=True,
+              default=256)
+@click.option('--preview',
+              is_flag=True,
+              help="Write a quick svg of a reduced graph (<NAME>.gv.svg) and return, then finish the full "
+              "render in a background process that replaces the preview when done.",
+              show_default=True,
+              default=False)
+@click.option('--optimize-png',
+              is_flag=True,
+              help="Recompress PNG outputs with oxipng or optipng (whichever is installed) and report the bytes "
+              "saved.",
+              show_default=True,
+              default=False)
 @click.argument('definition', type=click.Path(exists=True, dir_okay=False))
 @click.argument('attr_config', type=click.Path(exists=True, dir_okay=False))
 @click.pass_context
-def draw(ctx, formats, directory, name, layout, definition, attr_config):  # noqa: D301
+def draw(ctx, formats, directory, name, layout, compact, edges, chunksize,
+         collapse_duplicates, transitive_reduction, bundle_hubs, save_layout, reuse_layout,
+         query, where, focus, depth, direction, split_components, jobs, time_budget, tile_size, preview, optimize_png,
+         definition, attr_config):  # noqa: D301
     """Produce your graph and save results based on your input.
 
     \b
-    DEFINITION  = Excel file containing the definition of your nodes and edges
+    DEFINITION  = Excel file (or SQLite database) containing the definition
+                  of your nodes and edges
     ATTR_CONFIG = YAML file containing the attribute information for your
                   graph, node-, and edge-types
+
+    A workbook may define several graphs, with Nodes.<graph>/Edges.<graph>
+    sheets or a 'graph' column; each is drawn as <NAME>.<graph> by a pool of
+    --jobs worker processes.  The requested formats of a single graph are
+    rendered by up to --jobs graphviz processes at once, fed while the DOT
+    text is written.
+
+    svgmin is an svg without comments, default attributes and indentation,
+    written while graphviz is still drawing; svgz is the same, gzipped.
+    html is a standalone page that draws only what is in view, finds nodes
+    by name and highlights the neighbors of a clicked node.
+
+    With --preview the command returns after the quick preview; the full
+    render always includes svg so that the preview gets replaced.
     """
     log.info("Preparing your graph.")
     directory = Path(directory)
@@ -147,19 +352,305 @@ def draw(ctx, formats, directory, name, layout, definition, attr_config):  # noq
         name = 'easygv'
 
     if formats == 'all':
-        formats = draw_formats[1:]
+        formats = list(all_formats)
     else:
         formats = [formats]
 
-    graph_input = easygv.load_graph_input(path=definition)
+    if focus is not None and edges is not None:
+        raise click.UsageError("--focus needs the whole Edges table and cannot be used with --edges.")
+
+    if (query or where) and not is_database(definition):
+        raise click.UsageError("--query and --where only apply to a SQLite DEFINITION.")
+
+    # Parse ATTR_CONFIG while DEFINITION loads; database queries need the columns the rules test first
+    with ThreadPoolExecutor(max_workers=1) as pool:
+        attrs_future = pool.submit(easygv.process_attrs, attr_config)
+        columns = rules.rule_columns(attrs_future.result().rules) if is_database(definition) else None
+        # The tables a --focus run loads are cached with its index; they depend on these options too
+        focus_key = repr((sorted(query.items()), sorted(where.items()), columns))
+        cached = None if focus is None else _focus.cached_definition(definition=definition, key=focus_key)
+        if cached is not None:
+            graph_inputs = {None: cached.graph_input}
+        else:
+            graph_inputs = load_definitions(definition=definition, query=query, where=where, columns=columns)
+        attrs = attrs_future.result()
+
+    simplifying = collapse_duplicates or transitive_reduction or bundle_hubs
+    if simplifying and edges is not None:
+        raise click.UsageError("Graph simplification needs the whole Edges table and cannot be used with --edges.")
+
+    positioned_formats = [f for f in formats if f in ('html', 'tiles')]
+    if edges is not None and (save_layout or reuse_layout or split_components or positioned_formats):
+        raise click.UsageError("--save-layout, --reuse-layout, --split-components and --formats "
+                               "html/tiles cannot be used with --edges.")
+
+    if optimize_png and _optimize.png_optimizer() is None:
+        raise click.UsageError("--optimize-png requires 'oxipng' or 'optipng' on the PATH.")
+
+    if preview and edges is not None:
+        raise click.UsageError("--preview needs the whole Edges table and cannot be used with --edges.")
+
+    settings = Munch(formats=formats, directory=directory, layout=layout, compact=compact,
+                     edges=edges, chunksize=chunksize, collapse_duplicates=collapse_duplicates,
+                     transitive_reduction=transitive_reduction, bundle_hubs=bundle_hubs,
+                     save_layout=save_layout, reuse_layout=reuse_layout, focus=focus, depth=depth,
+                     direction=direction, split_components=split_components, jobs=jobs,
+                     time_budget=time_budget, tile_size=tile_size, optimize_png=optimize_png,
+                     definition=definition, focus_key=focus_key,
+                     focus_index=None if cached is None else cached.index)
+
+    if list(graph_inputs) == [None]:
+        jobs_ = [(graph_inputs[None], attrs, name, settings)]
+    else:
+        if edges is not None or reuse_layout is not None:
+            raise click.UsageError("--edges and --reuse-layout cannot be used with a workbook defining several "
+                                   "graphs.")
+
+        # The focus index cache belongs to a single graph per DEFINITION
+        settings.definition = None
+        jobs_ = [(graph_input, attrs, '{name}.{graph}'.format(name=name, graph=graph), settings)
+                 for graph, graph_input in graph_inputs.items()]
+        log.info("Drawing {n} graphs.".format(n=len(jobs_)))
+
+    if preview:
+        draw_previews(jobs=jobs_)
+        return
+
+    workers = jobs or os.cpu_count() or 1
+    if workers > 1 and len(jobs_) > 1:
+        # The workers already use the --jobs CPUs: each runs one graphviz process at a time
+        settings.jobs = 1
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            list(pool.map(_draw_graph_job, jobs_))
+    else:
+        for job in jobs_:
+            _draw_graph_job(job)
+
+
+def _draw_graph_job(job):
+    graph_input, attrs, name, settings = job
+    draw_graph(graph_input=graph_input, attrs=attrs, name=name, settings=settings)
+
+
+def draw_previews(jobs):
+    """Write the preview of every ``draw`` job and start their full render in the background."""
+    for graph_input, attrs, name, settings in jobs:
+        graph_input = prepare_graph_input(graph_input=graph_input, settings=settings)
+        preview_path = _preview.draw_preview(graph_input=graph_input, attrs=attrs, name=name,
+                                             directory=settings.directory)
+        log.info("Created preview: {p}".format(p=preview_path))
+
+    full = []
+    for graph_input, attrs, name, settings in jobs:
+        settings = Munch(settings)
+        if 'svg' not in settings.formats:
+            settings.formats = list(settings.formats) + ['svg']
+        full.append((graph_input, attrs, name, settings))
+
+    pid, log_path = _preview.start_full_render(jobs=full, directory=jobs[0][3].directory)
+    log.info("Full render running in the background (pid {pid}, log {p}).".format(pid=pid, p=log_path))
+
+
+def prepare_graph_input(graph_input, settings):
+    """Return ``graph_input`` focused and simplified as the ``draw`` options in ``settings`` ask."""
+    if settings.focus is not None:
+        if settings.get('focus_index') is not None:
+            index = settings.focus_index
+        elif settings.definition is not None:
+            index = _focus.cached_index(definition=settings.definition, graph_input=graph_input,
+                                        key=settings.get('focus_key', ''))
+        else:
+            index = _focus.build_index(nodes=graph_input.Nodes, edges=graph_input.Edges)
+        names = _focus.neighborhood(index=index, focus=settings.focus.split(','), depth=settings.depth,
+                                    direction=settings.direction)
+        graph_input = _focus.induced_subgraph(graph_input=graph_input, names=names)
+
+    if settings.collapse_duplicates or settings.transitive_reduction or settings.bundle_hubs:
+        graph_input, stats = _simplify.simplify(graph_input=graph_input,
+                                                collapse=settings.collapse_duplicates,
+                                                reduce=settings.transitive_reduction,
+                                                min_fanout=settings.bundle_hubs)
+        click.echo("Simplified the graph from {nodes_in} nodes and {edges_in} edges to {nodes_out} nodes and "
+                   "{edges_out} edges: {duplicates_removed} duplicate and {transitive_removed} transitive edges "
+                   "removed, {bundled_nodes_removed} nodes removed by hub bundling.".format(**stats))
+
+    return graph_input
+
+
+def created(fig_path, settings):
+    """Log the finished output ``fig_path``, recompressing it first if it is a PNG and --optimize-png was given."""
+    if settings.optimize_png and str(fig_path).endswith('.png'):
+        _optimize.optimize_png(path=fig_path)
+    log.info("Created: {p}".format(p=fig_path))
+
+
+def draw_graph(graph_input, attrs, name, settings):
+    """Run the ``draw`` pipeline for one graph and write its outputs as ``<name>.*``.
+
+    With ``settings.time_budget``, every layout and render shares one
+    deadline taken here, and running out of it ends the command cleanly.
+
+    Args:
+        graph_input (dict-like): the output from ``load_graph_input``.
+        attrs (dict-like): the output from ``process_attrs``.
+        name (str): Base name of the outputs.
+        settings (Munch): The ``draw`` options, by option name.
+    """
+    time_budget = settings.time_budget
+    deadline = None if time_budget is None else time.monotonic() + time_budget
+
+    try:
+        _draw_graph(graph_input=graph_input, attrs=attrs, name=name, settings=settings, deadline=deadline)
+    except subprocess.TimeoutExpired:
+        raise click.ClickException("Could not lay out and render {name} within {t} seconds.".format(name=name,
+                                                                                                    t=time_budget))
+
+
+def _draw_graph(graph_input, attrs, name, settings, deadline):
+    directory = settings.directory
+    formats = list(settings.formats)
+    layout = settings.layout
+    jobs = settings.jobs
+
+    graph_input = prepare_graph_input(graph_input=graph_input, settings=settings)
+
+    gv_path = directory / '{name}.gv'.format(name=name)
+
+    if settings.edges is not None:
+        # Stream the edges straight into graphviz and the .gv file
+        edge_chunks = functools.partial(sources.iter_edge_chunks, path=settings.edges, chunksize=settings.chunksize,
+                                        columns=rules.rule_columns(attrs.rules).Edges)
+        chunks = dotwriter.iter_dot(graph_input=graph_input, attrs=attrs, edge_chunks=edge_chunks)
+        if deadline is None:
+            fig_paths = render.render_concurrently(chunks=chunks, gv_path=gv_path, formats=formats, prog=layout,
+                                                   jobs=jobs)
+        else:
+            # Keep the DOT text on disk so that a timed out layout can be retried with cheaper strategies
+            with gv_path.open(mode='w') as saved:
+                for chunk in chunks:
+                    render.time_left(deadline)
+                    saved.write(chunk)
+            fig_paths = render.render_file_within_budget(gv_path=gv_path, formats=formats, prog=layout,
+                                                         timeout=render.time_left(deadline), jobs=jobs)
+        for fig_path in fig_paths:
+            created(fig_path=fig_path, settings=settings)
+        return
+
+    if settings.compact:
+        chunks = dotwriter.iter_dot(graph_input=graph_input, attrs=attrs)
+    else:
+        chunks = [easygv.build_graph(graph_input=graph_input, attrs=attrs).string()]
+
+    needs_layout = any((settings.reuse_layout is not None, settings.split_components, deadline is not None,
+                        settings.save_layout, 'tiles' in formats, 'html' in formats))
+    if not needs_layout:
+        # Nothing needs the whole DOT text first: feed it to every format's renderer as it is written
+        for fig_path in render.render_concurrently(chunks=chunks, gv_path=gv_path, formats=formats, prog=layout,
+                                                   jobs=jobs):
+            created(fig_path=fig_path, settings=settings)
+        return
+
+    source = ''.join(chunks)
+    positioned = None
+
+    if settings.reuse_layout is not None:
+        with Path(settings.reuse_layout).open() as saved:
+            positioned = render.transfer_layout(source=source, layout=saved.read())
+        if positioned is None:
+            log.warning("Could not reuse {p}; laying the graph out again.".format(p=settings.reuse_layout))
+
+    if positioned is None and settings.split_components:
+        positioned = components.layout_by_component(graph_input=graph_input, attrs=attrs, prog=layout,
+                                                    jobs=jobs, timeout=render.time_left(deadline))
+    elif positioned is None and deadline is not None:
+        positioned, strategy = render.layout_within_budget(source=source, prog=layout,
+                                                           budget=render.time_left(deadline))
+        log.info("Layout strategy: {s}".format(s=strategy))
+    elif positioned is None and (settings.save_layout or 'tiles' in formats or 'html' in formats):
+        positioned = render.compute_layout(source=source, prog=layout)
+
+    if positioned is not None and settings.save_layout:
+        saved_path = render.save_text(text=positioned, path=render.layout_path(directory=directory, name=name))
+        log.info("Saved layout: {p}".format(p=saved_path))
+
+    if 'tiles' in formats:
+        formats.remove('tiles')
+        dzi_path = _tiles.render_tiles(positioned=positioned, directory=directory, name=name,
+                                       tile_size=settings.tile_size, jobs=jobs, timeout=render.time_left(deadline))
+        log.info("Created: {p}".format(p=dzi_path))
+
+    if positioned is not None:
+        fig_paths = render.render_positioned(positioned=positioned, gv_path=gv_path, formats=formats,
+                                             timeout=render.time_left(deadline), jobs=jobs)
+    else:
+        fig_paths = render.render_concurrently(chunks=[source], gv_path=gv_path, formats=formats, prog=layout,
+                                               timeout=render.time_left(deadline), jobs=jobs)
+    for fig_path in fig_paths:
+        created(fig_path=fig_path, settings=settings)
+
+
+@main.command('diff', short_help='Draw the differences between two versions of a graph.')
+@click.option('-f', '--formats',
+              type=click.Choice(draw_formats[:-1]),
+              help="Which type of format should we produce?",
+              show_default=True,
+              default='all')
+@click.option('-d', '--directory',
+              type=click.Path(exists=True, file_okay=False),
+              help="""Path to a directory to write out the files.""",
+              show_default=True,
+              default='.')
+@click.option('-n', '--name',
+              type=click.STRING,
+              help="""A name for your figure.""",
+              show_default=True,
+              default='easygv_diff')
+@click.option('-l', '--layout',
+              type=click.Choice(draw_layouts),
+              help="""Which layout program lays out OLD?""",
+              show_default=True,
+              default='dot')
+@click.option('--old-layout',
+              type=click.Path(exists=True, dir_okay=False),
+              help="Positions of OLD saved by 'draw --save-layout'; OLD is laid out again if not given.",
+              show_default=True,
+              default=None)
+@click.argument('old', type=click.Path(exists=True, dir_okay=False))
+@click.argument('new', type=click.Path(exists=True, dir_okay=False))
+@click.argument('attr_config', type=click.Path(exists=True, dir_okay=False))
+@click.pass_context
+def diff(ctx, formats, directory, name, layout, old_layout, old, new, attr_config):
+    r"""Draw one graph showing what changed between two graph definitions.
+
+    OLD and NEW are the Excel files (or SQLite databases) with the two
+    versions; ATTR_CONFIG is the YAML file containing the attribute
+    information for your graph, node-, and edge-types.
+
+    Added, removed, changed and unchanged elements are colored by change
+    type on top of their usual styling, at their positions in OLD.
+    """
+    directory = Path(directory)
+    formats = list(all_formats) if formats == 'all' else [formats]
+
+    attrs = easygv.process_attrs(Path(attr_config))
+    columns = rules.rule_columns(attrs.rules)
+    old_input = load_definition(definition=Path(old), columns=columns)
+    new_input = load_definition(definition=Path(new), columns=columns)
+
+    merged, stats = _diff.diff_graph_input(old=old_input, new=new_input)
+
+    if old_layout is not None:
+        with Path(old_layout).open() as saved:
+            positioned = saved.read()
+    else:
+        positioned = render.compute_layout(source=easygv.build_graph(graph_input=old_input, attrs=attrs).string(),
+                                           prog=layout)
 
-    attrs = easygv.process_attrs(attr_config)
-    g = easygv.build_graph(graph_input=graph_input, attrs=attrs)
+    source = easygv.build_graph(graph_input=merged, attrs=_diff.diff_attrs(attrs)).string()
+    seeded = _diff.seed_layout(source=source, layout=positioned, graph_input=merged)
 
-    gvg = gv.Source(g.string(), engine=layout)
-    for f in formats:
-        gvg.format = f
-        fig_path = gvg.render(directory / '{name}.gv'.format(name=name))
+    gv_path = directory / '{name}.gv'.format(name=name)
+    for fig_path in render.render_positioned(positioned=seeded, gv_path=gv_path, formats=formats):
         log.info("Created: {p}".format(p=fig_path))
 
 
@@ -0,0 +1,306 @@
+# -*- coding: utf-8 -*-
+"""Lay out the weakly connected components of a graph in parallel and pack them.
+
+Graphviz layout time grows faster than linearly with graph size, so a forest
+of independent components is cheaper to lay out one component at a time.
+Components are found with a vectorized union-find over the Edges table,
+grouped into a few balanced batches, laid out in worker processes and then
+shelf-packed side by side (like ``gvpack``) into one positioned graph that
+``render.render_positioned`` draws with ``neato -n2``.
+"""
+import math
+import os
+import re
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from logzero import logger as log
+
+import numpy as np
+import pandas as pd
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import dotwriter
+from easygv import render
+from easygv import simplify
+
+
+# Space between packed components, in points.
+PACK_MARGIN = 18.0
+
+_POINT = re.compile(r'^(-?[0-9.eE+-]+),(-?[0-9.eE+-]+)(!?)$')
+
+
+def component_labels(n, u, v):
+    """Return the weakly connected component of each of ``n`` integer nodes.
+
+    Roots are hooked onto the smallest label across each edge with
+    ``np.minimum.at`` and the label forest is flattened by pointer jumping,
+    until no label changes.
+
+    Returns:
+        ndarray: Component id (``0..k-1``) of every node.
+    """
+    labels = np.arange(n)
+
+    while True:
+        lu = labels[u]
+        lv = labels[v]
+        low = np.minimum(lu, lv)
+
+        hooked = labels.copy()
+        np.minimum.at(hooked, lu, low)
+        np.minimum.at(hooked, lv, low)
+
+        while True:
+            jumped = hooked[hooked]
+            if np.array_equal(jumped, hooked):
+                break
+            hooked = jumped
+
+        if np.array_equal(hooked, labels):
+            break
+        labels = hooked
+
+    return np.unique(labels, return_inverse=True)[1]
+
+
+def cluster_links(nodes):
+    """Return extra ``(u, v)`` name arrays chaining together the members of each cluster.
+
+    Clusters are kept whole so that no cluster is split across layouts.
+    """
+    if 'cluster_name' not in nodes.columns:
+        return np.array([], dtype=object), np.array([], dtype=object)
+
+    clustered = nodes.loc[nodes['cluster_name'] != 'cluster_', ['name', 'cluster_name']]
+    first = clustered.groupby('cluster_name')['name'].transform('first')
+    return first.values, clustered['name'].values
+
+
+def split_components(graph_input, batches=1):
+    """Split ``graph_input`` into at most ``batches`` graph inputs of whole components.
+
+    Components are assigned largest first to the currently smallest batch,
+    so each batch has roughly the same number of nodes.
+
+    Returns:
+        list: ``graph_input``-like Munches, one per non-empty batch.
+    """
+    nodes = graph_input.Nodes
+    edges = graph_input.Edges
+
+    link_u, link_v = cluster_links(nodes)
+    linked = pd.DataFrame({'u_name': np.concatenate([edges['u_name'].values, link_u]),
+                           'v_name': np.concatenate([edges['v_name'].values, link_v])})
+    names, u, v = simplify.node_ids(nodes=nodes, edges=linked)
+    component = component_labels(n=len(names), u=u, v=v)
+
+    sizes = np.bincount(component)
+    log.info("Found {k} connected components.".format(k=len(sizes)))
+
+    load = np.zeros(max(1, min(batches, len(sizes))), dtype=np.int64)
+    batch_of = np.empty(len(sizes), dtype=np.int64)
+    for c in np.argsort(-sizes, kind='mergesort'):
+        b = int(np.argmin(load))
+        batch_of[c] = b
+        load[b] += sizes[c]
+
+    node_batch = dict(zip(names, batch_of[component]))
+    nodes_batch = nodes['name'].map(node_batch).values
+    edges_batch = edges['u_name'].map(node_batch).values
+
+    parts = []
+    for b in range(len(load)):
+        part = Munch(graph_input)
+        part.Nodes = nodes.loc[nodes_batch == b]
+        part.Edges = edges.loc[edges_batch == b]
+        if 'Clusters' in graph_input and 'cluster_name' in nodes.columns:
+            part.Clusters = graph_input.Clusters.loc[graph_input.Clusters['name'].isin(part.Nodes['cluster_name'])]
+        parts.append(part)
+
+    return parts
+
+
+def _shift_point(point, dx, dy):
+    match = _POINT.match(point.strip())
+    if match is None:
+        return point
+    x, y, pinned = match.groups()
+    return '{x:.2f},{y:.2f}{pinned}'.format(x=float(x) + dx, y=float(y) + dy, pinned=pinned)
+
+
+def shift_pos(pos, dx, dy):
+    """Return a node ``pos``, label position or edge spline moved by ``(dx, dy)``."""
+    splines = []
+    for spline in pos.split(';'):
+        tokens = []
+        for token in spline.split():
+            if token[:2] in ('e,', 's,'):
+                tokens.append(token[:2] + _shift_point(token[2:], dx, dy))
+            else:
+                tokens.append(_shift_point(token, dx, dy))
+        splines.append(' '.join(tokens))
+    return ';'.join(splines)
+
+
+def shift_bb(bb, dx, dy):
+    """Return a ``llx,lly,urx,ury`` bounding box moved by ``(dx, dy)``."""
+    llx, lly, urx, ury = [float(c) for c in bb.split(',')]
+    return '{a:.2f},{b:.2f},{c:.2f},{d:.2f}'.format(a=llx + dx, b=lly + dy, c=urx + dx, d=ury + dy)
+
+
+def bounding_box(g):
+    """Return the ``(llx, lly, urx, ury)`` floats of a positioned pygraphviz graph."""
+    return tuple(float(c) for c in g.graph_attr['bb'].split(','))
+
+
+def _shift_subgraphs(g, dx, dy):
+    for sub in g.subgraphs():
+        for key in ('bb', 'lp'):
+            value = sub.graph_attr.get(key)
+            if value:
+                sub.graph_attr[key] = shift_bb(value, dx, dy) if key == 'bb' else shift_pos(value, dx, dy)
+        _shift_subgraphs(sub, dx, dy)
+
+
+def shift_graph(g, dx, dy):
+    """Move every coordinate of the positioned pygraphviz graph ``g`` by ``(dx, dy)`` in place."""
+    for name in g.nodes():
+        attr = g.get_node(name).attr
+        if attr.get('pos'):
+            attr['pos'] = shift_pos(attr['pos'], dx, dy)
+        if attr.get('xlp'):
+            attr['xlp'] = shift_pos(attr['xlp'], dx, dy)
+
+    for u, v in g.edges():
+        attr = g.get_edge(u, v).attr
+        for key in render.EDGE_LAYOUT_ATTRS:
+            if attr.get(key):
+                attr[key] = shift_pos(attr[key], dx, dy)
+
+    for key in ('bb', 'lp'):
+        value = g.graph_attr.get(key)
+        if value:
+            g.graph_attr[key] = shift_bb(value, dx, dy) if key == 'bb' else shift_pos(value, dx, dy)
+
+    _shift_subgraphs(g, dx, dy)
+
+
+def shelf_offsets(boxes, margin=PACK_MARGIN):
+    """Return the ``(dx, dy)`` moves placing each bounding box in a packed arrangement.
+
+    Boxes are placed tallest first, left to right on shelves about as wide as
+    the square root of the total area.
+
+    Args:
+        boxes (list): ``(llx, lly, urx, ury)`` of each component.
+        margin (float): Space left between components.
+
+    Returns:
+        tuple: ``(moves, (width, height))``, the latter being the size of
+        the packed drawing.
+    """
+    sizes = [(urx - llx + margin, ury - lly + margin) for llx, lly, urx, ury in boxes]
+    target = math.sqrt(sum(w * h for w, h in sizes)) or 1.0
+
+    offsets = [None] * len(boxes)
+    shelves = []
+    x = 0.0
+    shelf_height = 0.0
+    for i in sorted(range(len(boxes)), key=lambda i: -sizes[i][1]):
+        w, h = sizes[i]
+        if x > 0 and x + w > target:
+            shelves.append(shelf_height)
+            x = 0.0
+            shelf_height = 0.0
+        offsets[i] = (x, sum(shelves))
+        x += w
+        shelf_height = max(shelf_height, h)
+    shelves.append(shelf_height)
+
+    width = max(o[0] + s[0] for o, s in zip(offsets, sizes)) - margin
+    height = sum(shelves) - margin
+
+    # graphviz's y axis points up: put the first shelf at the top
+    moves = []
+    for (llx, lly, urx, ury), (ox, oy) in zip(boxes, offsets):
+        moves.append((ox - llx, height - oy - (ury - lly) - lly))
+
+    return moves, (width, height)
+
+
+def pack(layouts, graph_attrs=None, strict=True):
+    """Return one positioned DOT graph with the positioned ``layouts`` packed side by side.
+
+    Args:
+        layouts (list): Positioned DOT texts, e.g. from ``render.compute_layout``.
+        graph_attrs (dict-like): Attributes for the packed root graph.
+        strict (bool): Emit a ``strict`` graph.
+
+    Returns:
+        str
+    """
+    graphs = [pgv.AGraph(string=text) for text in layouts]
+    moves, (width, height) = shelf_offsets([bounding_box(g) for g in graphs])
+
+    root = Munch(graph_attrs or {})
+    root.bb = '0,0,{w:.2f},{h:.2f}'.format(w=width, h=height)
+
+    lines = ['{strict}digraph "" {{\n'.format(strict='strict ' if strict else ''),
+             '\tgraph {attrs};\n'.format(attrs=dotwriter.format_attrs(root))]
+
+    for i, (g, (dx, dy)) in enumerate(zip(graphs, moves)):
+        shift_graph(g, dx, dy)
+        text = g.string()
+        body = text[text.index('{') + 1:text.rindex('}')]
+        lines.append('\tsubgraph component_{i} {{{body}\t}}\n'.format(i=i, body=body))
+
+    lines.append('}\n')
+    return ''.join(lines)
+
+
+def _layout_worker(job):
+    source, prog, deadline = job
+    return render.compute_layout(source=source, prog=prog, timeout=render.time_left(deadline))
+
+
+def layout_by_component(graph_input, attrs, prog='dot', jobs=None, timeout=None):
+    """Lay out the components of ``graph_input`` in parallel and return the packed positioned DOT.
+
+    Args:
+        graph_input (dict-like): the output from ``load_graph_input``.
+        attrs (dict-like): the output from ``process_attrs``.
+        prog (str): Layout program for each component.
+        jobs (int): Worker processes; defaults to the number of CPUs.
+        timeout (float): Seconds all batches together may take; batches
+            still queued when it runs out are not started.
+
+    Returns:
+        str: Positioned DOT text ready for ``render.render_positioned``.
+    """
+    if jobs is None:
+        jobs = os.cpu_count() or 1
+
+    # The graph label belongs to the packed drawing, not to every component
+    graph_attrs = Munch(attrs.get('graph') or {})
+    part_attrs = Munch(attrs)
+    part_attrs.graph = Munch(graph_attrs)
+    part_attrs.graph.pop('label', None)
+
+    # ``time.monotonic`` is system-wide, so the worker processes can share the deadline
+    deadline = None if timeout is None else time.monotonic() + timeout
+    parts = split_components(graph_input=graph_input, batches=jobs * 4)
+    sources = [(dotwriter.dot_string(graph_input=part, attrs=part_attrs), prog, deadline) for part in parts]
+
+    if jobs > 1 and len(sources) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as pool:
+            layouts = list(pool.map(_layout_worker, sources))
+    else:
+        layouts = [_layout_worker(job) for job in sources]
+
+    log.info("Laid out {n} component batches.".format(n=len(layouts)))
+    return pack(layouts=layouts, graph_attrs=graph_attrs)
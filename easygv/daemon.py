@@ -0,0 +1,417 @@
+# -*- coding: utf-8 -*-
+"""Serve ``easygv`` commands from a warm background process.
+
+``easygv daemon start`` runs ``serve`` in a background process that has
+pandas, pygraphviz and ruamel.yaml imported already and keeps parsed
+workbooks and attribute configs in memory.  The ``easygv`` entry point
+(``entry``) only imports this light module first: when the daemon's Unix
+socket answers, ``draw`` and ``config`` are forwarded to it, otherwise the
+command runs in-process as usual.
+
+Messages are JSON objects, one per line.  A request is
+``{"argv": [...], "cwd": "..."}`` (or ``{"ping": true}``/``{"stop": true}``)
+and the daemon answers with any number of ``{"stream": ..., "text": ...}``
+output messages followed by ``{"exit": code}``.
+
+The socket lives in a directory only its user can enter
+(``$XDG_RUNTIME_DIR`` or a 0700 directory in the temp directory) and a
+client only talks to a socket owned by its own user.  A running daemon
+holds an exclusive ``fcntl`` lock on ``<socket>.lock`` for its whole
+life, so a daemon busy with a long command is still known to be running
+and a second one never replaces its socket.
+"""
+import contextlib
+import fcntl
+import io
+import json
+import logging
+import os
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import traceback
+from pathlib import Path
+
+
+FORWARDED_COMMANDS = ('draw', 'diff', 'config')
+GLOBAL_OPTIONS = ('-v', '--verbosity')
+
+
+def socket_path():
+    """Return the daemon's socket path (``$EASYGV_SOCKET`` or one in the user's private runtime directory)."""
+    path = os.environ.get('EASYGV_SOCKET')
+    if path:
+        return Path(path)
+    runtime = os.environ.get('XDG_RUNTIME_DIR')
+    if runtime:
+        return Path(runtime) / 'easygv' / 'daemon.sock'
+    return Path(tempfile.gettempdir()) / 'easygv-{uid}'.format(uid=os.getuid()) / 'daemon.sock'
+
+
+def lock_path(path):
+    """Return the lock file held by the daemon serving the socket ``path``."""
+    return Path(path).with_suffix('.lock')
+
+
+def owned(path):
+    """Return `True` if ``path`` exists and belongs to the current user."""
+    try:
+        return os.lstat(str(path)).st_uid == os.getuid()
+    except OSError:
+        return False
+
+
+def private_directory(directory):
+    """Create ``directory`` for this user only (mode 0700) unless it exists, and return it.
+
+    Raises:
+        PermissionError: if ``directory`` belongs to another user.
+    """
+    directory = Path(directory)
+    if not directory.exists():
+        directory.mkdir(mode=0o700, parents=True)
+    if not owned(directory) or not directory.is_dir():
+        raise PermissionError("{d} is not a directory of this user.".format(d=directory))
+    return directory
+
+
+def command_name(argv):
+    """Return the subcommand named in the command line ``argv`` (without the program name)."""
+    args = iter(argv)
+    for arg in args:
+        if arg in GLOBAL_OPTIONS:
+            next(args, None)
+        elif not arg.startswith('-'):
+            return arg
+    return None
+
+
+def send(sock, message):
+    """Send ``message`` as one JSON line over ``sock``."""
+    sock.sendall(json.dumps(message).encode('utf-8') + b'\n')
+
+
+def request(message, path=None, timeout=None):
+    """Send ``message`` to the daemon and yield its answers up to the ``exit`` message.
+
+    Raises:
+        OSError: if no daemon is listening on ``path``.
+    """
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    sock.settimeout(timeout)
+    try:
+        sock.connect(str(path or socket_path()))
+        send(sock, message)
+        with sock.makefile('rb') as answers:
+            for line in answers:
+                answer = json.loads(line.decode('utf-8'))
+                yield answer
+                if 'exit' in answer:
+                    break
+    finally:
+        sock.close()
+
+
+def forward(argv, path=None):
+    """Run ``argv`` in the daemon, relaying its output.
+
+    Returns:
+        int: The command's exit code, or `None` if no daemon is running.
+    """
+    path = Path(path or socket_path())
+    if not path.exists():
+        return None
+    if not owned(path):
+        sys.stderr.write("Not using {p}: it belongs to another user.\n".format(p=path))
+        return None
+
+    try:
+        for answer in request({'argv': list(argv), 'cwd': os.getcwd()}, path=path):
+            if 'exit' in answer:
+                return answer['exit']
+            out = sys.stdout if answer['stream'] == 'stdout' else sys.stderr
+            out.write(answer['text'])
+            out.flush()
+    except (ConnectionRefusedError, FileNotFoundError):
+        return None
+
+    # The daemon went away mid-command
+    return 1
+
+
+def is_running(path=None):
+    """Return `True` if a daemon for the socket ``path`` is running, even if it is busy."""
+    try:
+        with lock_path(path or socket_path()).open(mode='a') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    except OSError:
+        return False
+    return False
+
+
+def is_ready(path=None, timeout=5):
+    """Return `True` if a daemon answers on ``path`` within ``timeout`` seconds."""
+    path = Path(path or socket_path())
+    if not owned(path):
+        return False
+    try:
+        return any('exit' in answer for answer in request({'ping': True}, path=path, timeout=timeout))
+    except OSError:
+        return False
+
+
+def entry():
+    """Run the ``easygv`` command line, through the daemon when one is running."""
+    argv = sys.argv[1:]
+    if command_name(argv) in FORWARDED_COMMANDS and os.environ.get('EASYGV_NO_DAEMON') is None:
+        code = forward(argv)
+        if code is not None:
+            sys.exit(code)
+
+    from easygv.cli import main
+    main()
+
+
+class MessageWriter(io.TextIOBase):
+    """A text stream sending everything written to it as output messages."""
+
+    def __init__(self, sock, name):
+        """Send the text written to this stream over ``sock`` as the ``name`` stream."""
+        self.sock = sock
+        self.name = name
+
+    def writable(self):
+        """Return `True`."""
+        return True
+
+    def write(self, text):
+        """Send ``text`` to the client and return its length."""
+        if isinstance(text, bytes):
+            text = text.decode('utf-8', 'replace')
+        if text:
+            send(self.sock, {'stream': self.name, 'text': text})
+        return len(text)
+
+
+@contextlib.contextmanager
+def captured_output(sock):
+    """Send ``sys.stdout``, ``sys.stderr`` and the log to the client on ``sock`` for the duration."""
+    from logzero import logger as log
+
+    out = MessageWriter(sock=sock, name='stdout')
+    err = MessageWriter(sock=sock, name='stderr')
+    handlers = [h for h in log.handlers if type(h) is logging.StreamHandler]
+    previous = [h.stream for h in handlers]
+
+    for handler in handlers:
+        handler.stream = err
+    try:
+        with contextlib.redirect_stdout(out), contextlib.redirect_stderr(err):
+            yield
+    finally:
+        for handler, old in zip(handlers, previous):
+            handler.stream = old
+
+
+def run_command(argv):
+    """Run the click command line ``argv`` in this process and return its exit code."""
+    import click
+    from munch import Munch
+    from easygv.cli import main
+
+    try:
+        main.main(args=list(argv), prog_name='easygv', standalone_mode=False, obj=Munch())
+    except click.exceptions.Exit as exc:
+        return exc.exit_code
+    except click.ClickException as exc:
+        exc.show()
+        return exc.exit_code
+    except click.Abort:
+        click.echo('Aborted!', err=True)
+        return 1
+    except SystemExit as exc:
+        return exc.code if isinstance(exc.code, int) else 1
+    except Exception:
+        traceback.print_exc()
+        return 1
+    return 0
+
+
+def stamp_cached(func, copy):
+    """Return ``func(path, **kwargs)`` memoized on the file's modification time and size.
+
+    Only the newest result is kept for each path, so a workbook saved again
+    replaces its cached copy instead of adding one.  Callers get
+    ``copy(result)`` so that cached values are never modified.
+    """
+    cache = {}
+
+    def cached(path, **kwargs):
+        stat = os.stat(str(path))
+        key = str(Path(path).resolve())
+        stamp = (stat.st_mtime, stat.st_size, repr(sorted(kwargs.items())))
+        if key not in cache or cache[key][0] != stamp:
+            # drop the stale copy before loading the new one
+            cache.pop(key, None)
+            cache[key] = (stamp, func(path, **kwargs))
+        return copy(cache[key][1])
+
+    cached.cache = cache
+    return cached
+
+
+def copy_graph_input(graph_input):
+    """Return a copy of ``graph_input`` with copies of its tables."""
+    from munch import Munch
+    return Munch((name, table.copy()) for name, table in graph_input.items())
+
+
+def copy_graph_inputs(graph_inputs):
+    """Return a copy of the ``{graph: graph_input}`` dict from ``load_graph_inputs``."""
+    return {graph: copy_graph_input(graph_input) for graph, graph_input in graph_inputs.items()}
+
+
+def install_caches():
+    """Memoize the workbook, database and attribute config loaders used by ``draw``."""
+    import copy
+    from easygv import easygv
+    from easygv import sources
+
+    easygv.load_graph_input = stamp_cached(easygv.load_graph_input, copy=copy_graph_input)
+    easygv.load_graph_inputs = stamp_cached(easygv.load_graph_inputs, copy=copy_graph_inputs)
+    sources.load_graph_input_sqlite = stamp_cached(sources.load_graph_input_sqlite, copy=copy_graph_input)
+    easygv.process_attrs = stamp_cached(easygv.process_attrs, copy=copy.deepcopy)
+
+
+def handle(connection):
+    """Answer one client ``connection``.
+
+    Returns:
+        bool: `False` once the client asked the daemon to stop.
+    """
+    with connection.makefile('rb') as requests:
+        message = json.loads(requests.readline().decode('utf-8') or '{}')
+
+    if message.get('stop'):
+        send(connection, {'exit': 0})
+        return False
+    if message.get('ping') or 'argv' not in message:
+        send(connection, {'exit': 0})
+        return True
+
+    cwd = os.getcwd()
+    try:
+        os.chdir(message.get('cwd') or cwd)
+        with captured_output(connection):
+            code = run_command(message['argv'])
+    finally:
+        os.chdir(cwd)
+
+    send(connection, {'exit': code})
+    return True
+
+
+def serve(path=None):
+    """Listen on the Unix socket ``path`` and run the commands sent to it, one at a time.
+
+    Returns at once, leaving the socket alone, if another daemon holds the
+    lock for ``path``.
+    """
+    from logzero import logger as log
+
+    path = Path(path or socket_path())
+    private_directory(path.parent)
+
+    lock = lock_path(path).open(mode='a')
+    try:
+        fcntl.flock(lock, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        lock.close()
+        log.warning("An easygv daemon is already running on {p}.".format(p=path))
+        return
+    lock.truncate(0)
+    lock.write('{pid}\n'.format(pid=os.getpid()))
+    lock.flush()
+
+    try:
+        _serve_locked(path=path)
+    finally:
+        lock.close()
+
+
+def _serve_locked(path):
+    from logzero import logger as log
+    import easygv.cli  # noqa: F401  (warm up the heavy imports)
+
+    install_caches()
+
+    # Holding the lock, any socket left at ``path`` is from a daemon that died
+    if path.exists():
+        path.unlink()
+
+    server = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    umask = os.umask(0o177)
+    try:
+        server.bind(str(path))
+    finally:
+        os.umask(umask)
+    server.listen(8)
+    log.info("easygv daemon listening on {p}".format(p=path))
+
+    try:
+        running = True
+        while running:
+            connection, _ = server.accept()
+            try:
+                running = handle(connection)
+            except (OSError, ValueError) as exc:
+                log.warning("Dropped a daemon request: {exc}".format(exc=exc))
+            finally:
+                connection.close()
+    finally:
+        server.close()
+        if path.exists():
+            path.unlink()
+
+
+def start(path=None, log_path=None, wait=30.0):
+    """Start ``serve`` in a detached background process and wait until it answers.
+
+    Returns:
+        bool: `True` if the daemon is running.
+    """
+    path = Path(path or socket_path())
+    if is_running(path=path):
+        return True
+
+    private_directory(path.parent)
+    log_path = log_path or path.with_suffix('.log')
+    with Path(log_path).open(mode='ab') as out:
+        subprocess.Popen([sys.executable, '-m', 'easygv.daemon', str(path)],
+                         stdin=subprocess.DEVNULL, stdout=out, stderr=out, start_new_session=True)
+
+    deadline = time.monotonic() + wait
+    while time.monotonic() < deadline:
+        if is_ready(path=path):
+            return True
+        time.sleep(0.1)
+    return False
+
+
+def stop(path=None):
+    """Ask the daemon on ``path`` to exit once its current command is done; return `False` if none was running."""
+    path = Path(path or socket_path())
+    if not is_running(path=path) or not owned(path):
+        return False
+    try:
+        return any('exit' in answer for answer in request({'stop': True}, path=path))
+    except OSError:
+        return False
+
+
+if __name__ == '__main__':
+    serve(path=sys.argv[1] if len(sys.argv) > 1 else None)
@@ -0,0 +1,288 @@
+# -*- coding: utf-8 -*-
+"""Compare two versions of a graph definition and draw the differences.
+
+Each table is compared with one hash join on its keys (``name`` or
+``u_name``/``v_name``), so finding additions, removals and attribute changes
+costs a single ``merge`` per table.  The old and new tables are merged into
+one graph whose elements carry a ``change`` column, styled by ``DIFF_RULES``
+through the usual ``RULES`` machinery, and positioned by seeding the old
+layout so that only new nodes and edges need placing.
+"""
+from logzero import logger as log
+
+import numpy as np
+import pandas as pd
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import render
+from easygv import rules
+
+
+CHANGE_COLUMN = 'change'
+CHANGES = ('added', 'removed', 'changed', 'unchanged')
+TABLE_KEYS = Munch(Nodes=('name',), Edges=('u_name', 'v_name'), Clusters=('name',))
+
+# Diff styling wins over the RULES in the attribute config.
+DIFF_PRIORITY = 1000
+CHANGE_ATTRS = Munch(added=Munch(color='#1A9850', fontcolor='#1A9850', penwidth=2),
+                     removed=Munch(color='#D73027', fontcolor='#D73027', style='dashed'),
+                     changed=Munch(color='#F46D43', fontcolor='#F46D43', penwidth=2),
+                     unchanged=Munch(color='#BBBBBB', fontcolor='#888888'))
+DIFF_RULES = [Munch(name='diff_{kind}_{change}'.format(kind=kind, change=change),
+                    applies_to=kind,
+                    priority=DIFF_PRIORITY,
+                    where={CHANGE_COLUMN: change},
+                    attrs=attrs)
+              for kind in rules.ELEMENT_KINDS
+              for change, attrs in CHANGE_ATTRS.items()]
+
+# Distance of a new node below its neighbours, in points.
+NODE_SPACING = 54.0
+# Space kept between a new node and every node already placed, in points.
+NODE_MARGIN = 9.0
+# Graphviz's default node size, in inches.
+DEFAULT_NODE_SIZE = (0.75, 0.5)
+# Space between a cluster's border and its nodes, in points (graphviz's default cluster margin).
+CLUSTER_MARGIN = 8.0
+
+_OCCURRENCE = '_occurrence'
+
+
+def diff_table(old, new, keys):
+    """Return the union of ``old`` and ``new`` rows with the ``change`` of each.
+
+    Rows are matched on ``keys``; repeated keys (parallel edges) are matched
+    in order of appearance.  Matched rows take the new values.
+
+    Args:
+        old (DataFrame): The old table.
+        new (DataFrame): The new table.
+        keys (tuple): Columns identifying a row.
+
+    Returns:
+        tuple: ``(table, changed_columns)`` where ``changed_columns`` maps each
+        compared column to the number of rows whose value changed.
+    """
+    keys = list(keys)
+    on = keys + [_OCCURRENCE]
+    old = old.assign(**{_OCCURRENCE: old.groupby(keys).cumcount()})
+    new = new.assign(**{_OCCURRENCE: new.groupby(keys).cumcount()})
+
+    merged = old.merge(new, on=on, how='outer', suffixes=('_old', '_new'), indicator=True)
+    side = merged['_merge'].values
+    both = side == 'both'
+    only_old = side == 'left_only'
+
+    columns = [c for c in new.columns if c not in on] + [c for c in old.columns if c not in on and c not in new.columns]
+    table = merged[keys].copy()
+    changed = np.zeros(len(merged), dtype=bool)
+    changed_columns = Munch()
+
+    for column in columns:
+        if column in old.columns and column in new.columns:
+            old_values = merged[column + '_old'].fillna('')
+            new_values = merged[column + '_new'].fillna('')
+            table[column] = new_values.where(~only_old, old_values).values
+            differs = both & (old_values.astype(str).values != new_values.astype(str).values)
+        else:
+            table[column] = merged[column].fillna('').values
+            differs = both & (table[column].astype(str).values != '')
+
+        changed_columns[column] = int(differs.sum())
+        changed |= differs
+
+    table[CHANGE_COLUMN] = np.select([side == 'right_only', only_old, changed],
+                                     ['added', 'removed', 'changed'], default='unchanged')
+    return table, changed_columns
+
+
+def diff_graph_input(old, new):
+    """Return the merged graph_input of two versions and what changed in each table.
+
+    Returns:
+        tuple: ``(graph_input, stats)``; ``stats`` holds, per table, the
+        number of rows of each change type and the ``changed_columns`` counts.
+    """
+    merged = Munch()
+    stats = Munch()
+
+    for name, keys in TABLE_KEYS.items():
+        if name not in old and name not in new:
+            continue
+        old_table = old.get(name, pd.DataFrame(columns=list(keys)))
+        new_table = new.get(name, pd.DataFrame(columns=list(keys)))
+
+        merged[name], changed_columns = diff_table(old=old_table, new=new_table, keys=keys)
+        counts = merged[name][CHANGE_COLUMN].value_counts()
+        stats[name] = Munch({change: int(counts.get(change, 0)) for change in CHANGES})
+        stats[name].changed_columns = changed_columns
+
+        log.info("{name}: {added} added, {removed} removed, {changed} changed.".format(name=name, **stats[name]))
+
+    return merged, stats
+
+
+def diff_attrs(attrs):
+    """Return a copy of ``attrs`` whose compiled rules end with ``DIFF_RULES``."""
+    styled = Munch(attrs)
+    compiled = attrs.get('rules') or Munch({kind: [] for kind in rules.ELEMENT_KINDS})
+    extra = rules.compile_rules(rules=DIFF_RULES, attrs=attrs)
+
+    styled.rules = Munch({kind: sorted(compiled.get(kind, []) + extra[kind], key=lambda r: r.priority)
+                          for kind in rules.ELEMENT_KINDS})
+    return styled
+
+
+def _point(pos):
+    x, y = pos.rstrip('!').split(',')[:2]
+    return float(x), float(y)
+
+
+def _size(attr):
+    """Return the ``(width, height)`` in points of a node with attributes ``attr``."""
+    width = attr.get('width') or DEFAULT_NODE_SIZE[0]
+    height = attr.get('height') or DEFAULT_NODE_SIZE[1]
+    return float(width) * 72.0, float(height) * 72.0
+
+
+def free_position(x, y, size, centres, sizes):
+    """Return ``(x, y)`` moved down until a node of ``size`` there overlaps none of the placed nodes.
+
+    Args:
+        x (float): Candidate centre.
+        y (float): Candidate centre.
+        size (tuple): ``(width, height)`` of the node being placed.
+        centres (ndarray): ``(n, 2)`` centres of the nodes already placed.
+        sizes (ndarray): ``(n, 2)`` widths and heights of those nodes.
+
+    Returns:
+        tuple
+    """
+    reach_x = (sizes[:, 0] + size[0]) / 2.0 + NODE_MARGIN
+    reach_y = (sizes[:, 1] + size[1]) / 2.0 + NODE_MARGIN
+    apart_x = np.abs(centres[:, 0] - x) >= reach_x
+
+    while True:
+        hits = ~apart_x & (np.abs(centres[:, 1] - y) < reach_y)
+        if not hits.any():
+            return x, y
+        # jump just below the lowest node in the way
+        y = float(np.min(centres[hits, 1] - reach_y[hits]))
+
+
+def placed_positions(names, edges, positions, bb, sizes):
+    """Return positions for the nodes in ``names`` that are missing from ``positions``.
+
+    A new node goes below the mean position of its already placed
+    neighbours; new nodes without placed neighbours are lined up under the
+    drawing.  Either way it is then moved down until its bounding box
+    overlaps none of the nodes placed before it, old or new.
+
+    Args:
+        names (list): All node names of the merged graph.
+        edges (DataFrame): ``u_name``/``v_name`` of the merged graph.
+        positions (dict): Name to ``(x, y)`` of the old layout.
+        bb (tuple): ``(llx, lly, urx, ury)`` of the old layout.
+        sizes (dict): Name to ``(width, height)`` in points of every node.
+
+    Returns:
+        dict: Name to ``(x, y)`` for every new node.
+    """
+    new = pd.Index([n for n in names if n not in positions])
+    if not len(new):
+        return {}
+
+    both_ways = pd.DataFrame({'node': np.concatenate([edges['u_name'].values, edges['v_name'].values]),
+                              'other': np.concatenate([edges['v_name'].values, edges['u_name'].values])})
+    anchored = both_ways.loc[both_ways['node'].isin(new) & both_ways['other'].isin(list(positions))].copy()
+    coords = np.array([positions[o] for o in anchored['other']]).reshape(-1, 2)
+    anchored['x'] = coords[:, 0]
+    anchored['y'] = coords[:, 1]
+    anchors = anchored.groupby('node')[['x', 'y']].mean()
+
+    candidates = [(name, x, y - NODE_SPACING) for name, x, y in zip(anchors.index, anchors['x'], anchors['y'])]
+    llx, lly, urx, ury = bb
+    loose = [n for n in new if n not in anchors.index]
+    candidates.extend((name, llx + i * NODE_SPACING * 1.5, lly - NODE_SPACING) for i, name in enumerate(loose))
+
+    centres = np.array(list(positions.values()), dtype=float).reshape(-1, 2)
+    boxes = np.array([sizes[name] for name in positions], dtype=float).reshape(-1, 2)
+
+    placed = {}
+    for name, x, y in candidates:
+        placed[name] = free_position(x=x, y=y, size=sizes[name], centres=centres, sizes=boxes)
+        centres = np.vstack([centres, placed[name]])
+        boxes = np.vstack([boxes, sizes[name]])
+
+    return placed
+
+
+def grown_bb(bb, boxes):
+    """Return the ``llx,lly,urx,ury`` box ``bb`` grown to hold ``((x, y), (width, height))`` nodes."""
+    llx, lly, urx, ury = [float(c) for c in bb.split(',')]
+    for (x, y), (width, height) in boxes:
+        llx = min(llx, x - width / 2.0 - CLUSTER_MARGIN)
+        lly = min(lly, y - height / 2.0 - CLUSTER_MARGIN)
+        urx = max(urx, x + width / 2.0 + CLUSTER_MARGIN)
+        ury = max(ury, y + height / 2.0 + CLUSTER_MARGIN)
+    return '{a:.2f},{b:.2f},{c:.2f},{d:.2f}'.format(a=llx, b=lly, c=urx, d=ury)
+
+
+def seed_layout(source, layout, graph_input):
+    """Return ``source`` positioned with the old ``layout`` plus positions for new nodes.
+
+    Nodes, edges and clusters found in ``layout`` keep their geometry; new
+    nodes are placed by ``placed_positions``, the box of a cluster they join
+    is grown to hold them, and new edges are left for ``neato -n2`` to
+    route.
+
+    Args:
+        source (str): DOT text of the merged, diff-styled graph.
+        layout (str): Positioned DOT text of the old graph.
+        graph_input (dict-like): The merged tables from ``diff_graph_input``.
+
+    Returns:
+        str: Positioned DOT text for ``render.render_positioned``.
+    """
+    g = pgv.AGraph(string=source)
+    old = pgv.AGraph(string=layout)
+    old_nodes = set(old.nodes())
+
+    positions = {}
+    sizes = {}
+    for name in g.nodes():
+        if name in old_nodes:
+            attr = old.get_node(name).attr
+            render.copy_layout_attrs(target=g.get_node(name).attr, source=attr, keys=render.NODE_LAYOUT_ATTRS)
+            if attr.get('pos'):
+                positions[str(name)] = _point(attr['pos'])
+        sizes[str(name)] = _size(g.get_node(name).attr)
+
+    bb = tuple(float(c) for c in old.graph_attr['bb'].split(','))
+    placed = placed_positions(names=[str(n) for n in g.nodes()], edges=graph_input.Edges, positions=positions, bb=bb,
+                              sizes=sizes)
+    for name, (x, y) in placed.items():
+        g.get_node(name).attr['pos'] = '{x:.2f},{y:.2f}'.format(x=x, y=y)
+
+    for u, v in g.edges():
+        if old.has_edge(u, v) and u in positions and v in positions:
+            render.copy_layout_attrs(target=g.get_edge(u, v).attr, source=old.get_edge(u, v).attr,
+                                     keys=render.EDGE_LAYOUT_ATTRS)
+
+    if not placed:
+        render.copy_layout_attrs(target=g.graph_attr, source=old.graph_attr, keys=render.GRAPH_LAYOUT_ATTRS)
+
+    for cluster in g.subgraphs():
+        saved = old.get_subgraph(cluster.name) if cluster.name else None
+        if saved is not None:
+            render.copy_layout_attrs(target=cluster.graph_attr, source=saved.graph_attr, keys=render.GRAPH_LAYOUT_ATTRS)
+            joined = [str(n) for n in cluster.nodes() if str(n) in placed]
+            if joined and cluster.graph_attr.get('bb'):
+                cluster.graph_attr['bb'] = grown_bb(bb=cluster.graph_attr['bb'],
+                                                    boxes=[(placed[n], sizes[n]) for n in joined])
+
+    log.info("Reused {n} old node positions and placed {k} new nodes.".format(n=len(positions), k=len(placed)))
+    return g.string()
@@ -0,0 +1,281 @@
+# -*- coding: utf-8 -*-
+"""Write compact DOT text directly from the graph input tables.
+
+``build_graph`` copies the merged class attributes onto every node and edge,
+so the DOT it produces repeats the same ``fillcolor``/``shape``/``style``
+strings on every element.  The writer here emits each class once as a
+default block inside an anonymous subgraph scope::
+
+    {
+        node [fillcolor="#B83545", shape=egg];
+        a [label=Alpha];
+        b [label=Beta];
+    }
+
+Only attributes that differ from the enclosing defaults (``BASE`` for class
+blocks, the class block for individual elements) are written out.
+"""
+import re
+
+from logzero import logger as log
+
+from munch import Munch
+
+from easygv import rules
+from easygv import sources
+from easygv.sources import EDGE_ATTR_COLUMNS
+
+
+_ID = re.compile(r'^([A-Za-z_\200-\377][A-Za-z_0-9\200-\377]*|-?(\.[0-9]+|[0-9]+(\.[0-9]*)?))$')
+_KEYWORDS = set(['node', 'edge', 'graph', 'digraph', 'subgraph', 'strict'])
+
+# Keys of the attribute config that are bookkeeping rather than graphviz attributes.
+NOT_ATTRS = set(['inherits_from'])
+
+
+def quote(value, html=False):
+    """Return ``value`` as a DOT ID, quoting and escaping it when needed.
+
+    With ``html``, a value in angle brackets is an HTML-like label and is
+    written as it is, like pygraphviz does.
+    """
+    s = str(value)
+    if _ID.match(s) and s.lower() not in _KEYWORDS:
+        return s
+    if html and s.startswith('<') and s.endswith('>'):
+        return s
+    return '"{s}"'.format(s=s.replace('"', '\\"'))
+
+
+def format_attrs(attrs):
+    """Return ``attrs`` as a DOT attribute list (``[k=v, ...]``) or an empty string."""
+    items = ['{k}={v}'.format(k=quote(k), v=quote(v, html=True))
+             for k, v in attrs.items() if k not in NOT_ATTRS]
+    if not items:
+        return ''
+    return '[{items}]'.format(items=', '.join(items))
+
+
+def attrs_diff(attrs, defaults):
+    """Return the items of ``attrs`` whose value differs from ``defaults``."""
+    if not attrs:
+        return Munch()
+    return Munch({k: v for k, v in attrs.items()
+                  if k not in NOT_ATTRS and str(defaults.get(k, '')) != str(v)})
+
+
+def class_attrs(attr_tree, kind):
+    """Return the class attributes of ``kind`` in ``attr_tree`` or an empty ``Munch``."""
+    if not kind or attr_tree is None or kind == 'BASE':
+        return Munch()
+    try:
+        return attr_tree[kind]
+    except KeyError:
+        return Munch()
+
+
+def _edge_op(directed):
+    return '->' if directed else '--'
+
+
+def iter_node_blocks(nodes, attrs, rule_attrs=None, indent='\t'):
+    """Yield DOT lines declaring ``nodes`` grouped into per-class default blocks.
+
+    Args:
+        nodes (DataFrame): The Nodes table.
+        attrs (dict-like): the output from ``process_attrs``.
+        rule_attrs (dict): Node name to attributes from ``rules.resolve_rule_attrs``.
+        indent (str): Leading whitespace for each emitted line.
+
+    Yields:
+        str
+    """
+    if rule_attrs is None:
+        rule_attrs = {}
+
+    node_tree = attrs.get('nodes', Munch())
+    base = node_tree.get('BASE', Munch())
+    classes = nodes['node_class'] if 'node_class' in nodes.columns else None
+
+    groups = [('', nodes)] if classes is None else nodes.groupby(classes, sort=False)
+
+    for kind, members in groups:
+        defaults = attrs_diff(attrs=class_attrs(node_tree, kind), defaults=base)
+        inner = indent
+        if defaults:
+            yield '{indent}{{\n'.format(indent=indent)
+            inner = indent + '\t'
+            yield '{inner}node {attrs};\n'.format(inner=inner, attrs=format_attrs(defaults))
+
+        scope = Munch(base)
+        scope.update(defaults)
+        for name, label in zip(members['name'], members['label']):
+            element = Munch(label=label)
+            element.update(attrs_diff(attrs=rule_attrs.get(name), defaults=scope))
+            yield '{inner}{name}\t{attrs};\n'.format(inner=inner, name=quote(name), attrs=format_attrs(element))
+
+        if defaults:
+            yield '{indent}}}\n'.format(indent=indent)
+
+
+def iter_edge_blocks(edges, attrs, rule_attrs=None, directed=True, indent='\t'):
+    """Yield DOT lines declaring ``edges`` grouped into per-class default blocks.
+
+    Args:
+        edges (DataFrame): The Edges table, or one chunk of it.
+        attrs (dict-like): the output from ``process_attrs``.
+        rule_attrs (dict): ``(u, v)`` to attributes from ``rules.resolve_rule_attrs``.
+        directed (bool): Whether to join nodes with ``->`` or ``--``.
+        indent (str): Leading whitespace for each emitted line.
+
+    Yields:
+        str
+    """
+    if rule_attrs is None:
+        rule_attrs = {}
+
+    edge_tree = attrs.get('edges', Munch())
+    base = edge_tree.get('BASE', Munch())
+    op = _edge_op(directed)
+    classes = edges['edge_class'] if 'edge_class' in edges.columns else None
+
+    groups = [('', edges)] if classes is None else edges.groupby(classes, sort=False)
+
+    for kind, members in groups:
+        defaults = attrs_diff(attrs=class_attrs(edge_tree, kind), defaults=base)
+        inner = indent
+        if defaults:
+            yield '{indent}{{\n'.format(indent=indent)
+            inner = indent + '\t'
+            yield '{inner}edge {attrs};\n'.format(inner=inner, attrs=format_attrs(defaults))
+
+        scope = Munch(base)
+        scope.update(defaults)
+        member_labels = members['label'] if 'label' in members.columns else [''] * len(members)
+        attr_columns = [c for c in EDGE_ATTR_COLUMNS if c in members.columns]
+        column_values = zip(*[members[c] for c in attr_columns]) if attr_columns else ((),) * len(members)
+
+        for u, v, label, values in zip(members['u_name'], members['v_name'], member_labels, column_values):
+            element = Munch()
+            if label != '':
+                element.label = label
+            element.update({c: value for c, value in zip(attr_columns, values) if value != ''})
+            element.update(attrs_diff(attrs=rule_attrs.get((u, v)), defaults=scope))
+            yield '{inner}{u} {op} {v}\t{attrs};\n'.format(inner=inner, u=quote(u), op=op, v=quote(v),
+                                                           attrs=format_attrs(element))
+
+        if defaults:
+            yield '{indent}}}\n'.format(indent=indent)
+
+
+def iter_cluster_blocks(nodes, clusters, attrs, rule_attrs=None, indent='\t'):
+    """Yield DOT ``subgraph cluster_*`` blocks listing the member node names.
+
+    Nodes are declared before the clusters, so listing them here only sets
+    membership and does not touch their attributes.
+    """
+    if rule_attrs is None:
+        rule_attrs = {}
+
+    cluster_tree = attrs.get('clusters', Munch())
+    members = nodes.loc[nodes['cluster_name'] != 'cluster_', ['name', 'cluster_name']]
+    members = members.drop_duplicates().groupby('cluster_name', sort=False)['name'].agg(list).to_dict()
+
+    for _, cluster in clusters.drop_duplicates('name').iterrows():
+        names = members.get(cluster['name'])
+        if not names:
+            continue
+
+        graph_attrs = Munch(label=cluster['label'])
+        graph_attrs.update(class_attrs(cluster_tree, cluster.get('cluster_class', '')))
+        graph_attrs.update(rule_attrs.get(cluster['name'], Munch()))
+
+        yield '{indent}subgraph {name} {{\n'.format(indent=indent, name=quote(cluster['name']))
+        yield '{indent}\tgraph {attrs};\n'.format(indent=indent, attrs=format_attrs(graph_attrs))
+        for name in names:
+            yield '{indent}\t{name};\n'.format(indent=indent, name=quote(name))
+        yield '{indent}}}\n'.format(indent=indent)
+
+
+def nodes_with_streamed_degrees(nodes, edge_chunks):
+    """Return ``nodes`` with degree columns counted over one pass of ``edge_chunks()``."""
+    degrees = sources.edge_degrees(chunks=edge_chunks())
+    nodes = nodes.copy()
+    nodes['out_degree'] = nodes['name'].map(degrees.out_degree).fillna(0).astype(int)
+    nodes['in_degree'] = nodes['name'].map(degrees.in_degree).fillna(0).astype(int)
+    nodes['degree'] = nodes['out_degree'] + nodes['in_degree']
+    return nodes
+
+
+def iter_dot(graph_input, attrs, name=None, strict=True, directed=True, edge_chunks=None):
+    """Yield the compact DOT text for ``graph_input`` styled by ``attrs``.
+
+    The result renders the same as ``build_graph(graph_input, attrs).string()``
+    but declares each node/edge class once instead of on every element.
+
+    Args:
+        graph_input (dict-like): the output from ``load_graph_input``.
+        attrs (dict-like): the output from ``process_attrs``.
+        name (str): Optional graph name.
+        strict (bool): Emit a ``strict`` graph, dropping duplicate edges.
+        directed (bool): Emit a ``digraph``.
+        edge_chunks (callable): Optional function returning an iterable of
+            Edges tables (e.g. ``sources.iter_edge_chunks``) used instead of
+            ``graph_input.Edges``.  Each chunk is written out as soon as it is
+            read; it is called a second time only when node rules need degrees.
+
+    Yields:
+        str: Consecutive chunks of DOT text.
+    """
+    compiled = attrs.get('rules') or Munch(nodes=[], edges=[], clusters=[])
+    nodes = graph_input.Nodes
+
+    if edge_chunks is not None and rules.needed_columns(compiled.nodes) & set(rules.DERIVED_COLUMNS['nodes']):
+        nodes = nodes_with_streamed_degrees(nodes=nodes, edge_chunks=edge_chunks)
+        graph_input = Munch(graph_input, Nodes=nodes)
+
+    yield '{strict}{kind} {name} {{\n'.format(strict='strict ' if strict else '',
+                                              kind='digraph' if directed else 'graph',
+                                              name=quote(name or ''))
+
+    for keyword, defaults in (('graph', attrs.get('graph')),
+                              ('node', attrs.get('nodes', Munch()).get('BASE')),
+                              ('edge', attrs.get('edges', Munch()).get('BASE'))):
+        formatted = format_attrs(defaults or Munch())
+        if formatted:
+            yield '\t{keyword} {attrs};\n'.format(keyword=keyword, attrs=formatted)
+
+    node_rules = rules.resolve_rule_attrs(kind='nodes', graph_input=graph_input, rules=compiled.nodes)
+    for line in iter_node_blocks(nodes=nodes, attrs=attrs, rule_attrs=node_rules):
+        yield line
+
+    chunks = [graph_input.Edges] if edge_chunks is None else edge_chunks()
+    for chunk in chunks:
+        edge_rules = rules.resolve_rule_attrs(kind='edges', graph_input=Munch(Nodes=nodes, Edges=chunk),
+                                              rules=compiled.edges)
+        for line in iter_edge_blocks(edges=chunk, attrs=attrs, rule_attrs=edge_rules, directed=directed):
+            yield line
+
+    if 'cluster_name' in nodes.columns.values and 'Clusters' in graph_input:
+        cluster_rules = rules.resolve_rule_attrs(kind='clusters', graph_input=graph_input, rules=compiled.clusters)
+        for line in iter_cluster_blocks(nodes=nodes, clusters=graph_input.Clusters,
+                                        attrs=attrs, rule_attrs=cluster_rules):
+            yield line
+
+    yield '}\n'
+    log.debug("finished writing compact DOT.")
+
+
+def dot_string(graph_input, attrs, **kwargs):
+    """Return the compact DOT text from ``iter_dot`` as a single string."""
+    return ''.join(iter_dot(graph_input=graph_input, attrs=attrs, **kwargs))
+
+
+def write_dot(graph_input, attrs, path, **kwargs):
+    """Write the compact DOT text from ``iter_dot`` to ``path`` and return the number of characters written."""
+    written = 0
+    with open(str(path), mode='w') as out:
+        for chunk in iter_dot(graph_input=graph_input, attrs=attrs, **kwargs):
+            out.write(chunk)
+            written += len(chunk)
+    return written
@@ -10,6 +10,9 @@ import ruamel.yaml as yaml
 import pygraphviz as pgv
 
 from easygv.cli.config import process_config
+from easygv import rules
+from easygv import sources
+from easygv.sources import EDGE_ATTR_COLUMNS, nan_to_str  # noqa: F401
 
 
 def update_pgv_element(element_attr_obj, attrs):
@@ -78,29 +81,74 @@ def style_the_graph(g, attrs):
             pass
 
 
+def apply_edge_attr_columns(g, edges):
+    """Copy non-empty ``EDGE_ATTR_COLUMNS`` values of ``edges`` onto the edges of ``g``.
+
+    These per-row values win over the class attributes but not over ``RULES``.
+
+    Returns:
+        `None`: Modifies ``g`` in place.
+    """
+    for column in EDGE_ATTR_COLUMNS:
+        if column not in edges.columns:
+            continue
+
+        rows = edges.loc[edges[column] != '', ['u_name', 'v_name', column]]
+        for u, v, value in zip(rows['u_name'], rows['v_name'], rows[column]):
+            g.get_edge(u, v).attr[column] = str(value)
+
+
+def apply_rules(g, graph_input, attrs):
+    """Apply the compiled ``RULES`` in ``attrs`` on top of the class styling of ``g``.
+
+    Args:
+        g (AGraph): A pygraphviz object already styled by ``style_the_graph``.
+        graph_input (dict-like): the output from ``load_graph_input``.
+        attrs (dict-like): Attribute discriptions including compiled ``rules``.
+
+    Returns:
+        `None`: Modifies ``g`` in place.
+    """
+    compiled = attrs.get('rules')
+    if not compiled:
+        return
+
+    getters = {'nodes': g.get_node,
+               'edges': lambda key: g.get_edge(*key),
+               'clusters': g.get_subgraph}
+
+    for kind, get_element in getters.items():
+        if kind == 'clusters' and 'Clusters' not in graph_input:
+            continue
+
+        matched = rules.resolve_rule_attrs(kind=kind, graph_input=graph_input, rules=compiled[kind])
+        for key, rule_attrs in matched.items():
+            element = get_element(key)
+            if element is None:
+                continue
+            attr_obj = element.graph_attr if kind == 'clusters' else element.attr
+            update_pgv_element(element_attr_obj=attr_obj, attrs=rule_attrs)
+
+
 def load_graph_input(path):
     """Return loaded/recoded graph_input dataframes for Nodes and Edges."""
     data = Munch({name: table for name, table in pd.read_excel(io=str(path), sheetname=None).items()})
 
-    # Do some Recoding
-    for name, table in data.items():
-        data[name] = table.applymap(nan_to_str)
+    return sources.recode_graph_input(data)
 
-    try:
-        data.Nodes["cluster_name"] = data.Nodes["cluster_name"].apply(lambda name: "cluster_{name}".format(name=name))
-        data.Clusters["name"] = data.Clusters["name"].apply(lambda name: "cluster_{name}".format(name=name))
-    except KeyError:
-        pass
 
-    return data
+def load_graph_inputs(path):
+    """Return the loaded/recoded graph_input of every graph defined in the workbook at ``path``.
+
+    The workbook is read once; see ``sources.split_graphs`` for how sheets
+    and rows are assigned to graphs.
 
+    Returns:
+        dict: Graph name (`None` for a single-graph workbook) to graph_input.
+    """
+    tables = Munch({name: table for name, table in pd.read_excel(io=str(path), sheetname=None).items()})
 
-def nan_to_str(x):
-    """Return empty string if pd.isnull(x): x otherwise."""
-    if pd.isnull(x):
-        return ''
-    else:
-        return x
+    return {graph: sources.recode_graph_input(data) for graph, data in sources.split_graphs(tables).items()}
 
 
 def add_clusters(g, nodes, clusters):
@@ -156,6 +204,8 @@ def build_graph(graph_input, attrs):
         add_clusters(g=g, nodes=graph_input.Nodes, clusters=graph_input.Clusters)
 
     style_the_graph(g=g, attrs=attrs)
+    apply_edge_attr_columns(g=g, edges=graph_input.Edges)
+    apply_rules(g=g, graph_input=graph_input, attrs=attrs)
 
     return g
 
@@ -215,7 +265,7 @@ def process_attrs(attr_config):
 
     attrs.graph = graph_base
 
-    not_graph = set(conf.keys()) - set(['GRAPH'])
+    not_graph = set(conf.keys()) - set(['GRAPH', 'RULES'])
 
     for name in not_graph:
         tree = conf[name]
@@ -229,4 +279,7 @@ def process_attrs(attr_config):
         attrs[attr_type] = attr_setup(entities=tree.ACTUAL)
         attrs[attr_type].BASE = base
 
+    # Rules are compiled last so they can inherit from the classes above
+    attrs.rules = rules.compile_rules(rules=conf.get('RULES'), attrs=attrs)
+
     return attrs
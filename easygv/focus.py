@@ -0,0 +1,267 @@
+# -*- coding: utf-8 -*-
+"""Extract the k-hop neighbourhood of a few nodes from a large graph definition.
+
+The Edges table is turned once into a CSR adjacency index over integer node
+ids (``simplify.csr``), which can be cached together with the parsed tables
+in the user's cache directory, so that repeated focus queries skip both
+parsing the definition and building the index.  A focus query is then a
+breadth-first search where each hop gathers the whole frontier's neighbours
+with NumPy, followed by a filter of the input tables.
+
+The cache is an ``.npz`` archive read with ``allow_pickle=False``: the
+index arrays as they are, each table column as a NumPy array (or as JSON
+when its values are of mixed types) and a JSON description of the rest.
+"""
+import hashlib
+import json
+import os
+import zipfile
+from pathlib import Path
+
+import appdirs
+
+from logzero import logger as log
+
+import numpy as np
+import pandas as pd
+
+from munch import Munch
+
+from easygv import simplify
+
+
+DIRECTIONS = ('in', 'out', 'both')
+
+# Where the focus indexes are cached, one file per definition.
+CACHE_DIR = Path(appdirs.user_cache_dir('easygv')) / 'focus'
+
+INDEX_ARRAYS = ('names', 'out_indptr', 'out_indices', 'in_indptr', 'in_indices')
+
+
+def build_index(nodes, edges):
+    """Return the out/in CSR adjacency index of a graph definition.
+
+    Returns:
+        Munch: ``names`` plus ``out_indptr``/``out_indices`` and
+        ``in_indptr``/``in_indices`` arrays.
+    """
+    names, u, v = simplify.node_ids(nodes=nodes, edges=edges)
+    n = len(names)
+    out_indptr, out_indices, _ = simplify.csr(n=n, u=u, v=v)
+    in_indptr, in_indices, _ = simplify.csr(n=n, u=v, v=u)
+
+    return Munch(names=names.astype(str),
+                 out_indptr=out_indptr, out_indices=out_indices,
+                 in_indptr=in_indptr, in_indices=in_indices)
+
+
+def index_path(definition):
+    """Return where the focus index for ``definition`` is cached."""
+    resolved = str(Path(definition).resolve()).encode('utf-8')
+    return CACHE_DIR / '{digest}.focus.npz'.format(digest=hashlib.sha1(resolved).hexdigest())
+
+
+def _stamp(definition, key=''):
+    stat = os.stat(str(definition))
+    digest = hashlib.sha1(str(key).encode('utf-8')).hexdigest()
+    return [stat.st_mtime, stat.st_size, digest]
+
+
+def _json_scalar(value):
+    if isinstance(value, np.generic):
+        return value.item()
+    raise TypeError("{v!r} cannot be cached.".format(v=value))
+
+
+def _encode_column(values):
+    """Return ``(kind, array)`` storing ``values`` without pickle; raise TypeError if they cannot be."""
+    values = np.asarray(values)
+    if values.dtype != object:
+        return 'array', values
+
+    items = values.tolist()
+    if all(isinstance(item, str) for item in items):
+        return 'str', np.array(items, dtype=str)
+    return 'json', np.array(json.dumps(items, default=_json_scalar))
+
+
+def _decode_column(kind, values):
+    if kind == 'array':
+        return values
+    if kind == 'str':
+        return values.astype(object)
+    items = json.loads(str(values))
+    decoded = np.empty(len(items), dtype=object)
+    decoded[:] = items
+    return decoded
+
+
+def _encode_tables(graph_input, arrays):
+    """Add the columns of ``graph_input`` to ``arrays`` and return their description."""
+    tables = {}
+    for name, table in graph_input.items():
+        kinds = []
+        for i, column in enumerate([table.index] + [table[c] for c in table.columns]):
+            kind, arrays['{name}/{i}'.format(name=name, i=i)] = _encode_column(column)
+            kinds.append(kind)
+        tables[name] = {'columns': [c if isinstance(c, (str, int)) else str(c) for c in table.columns],
+                        'kinds': kinds}
+    return tables
+
+
+def _decode_tables(tables, arrays):
+    graph_input = Munch()
+    for name, info in tables.items():
+        columns = [_decode_column(kind, arrays['{name}/{i}'.format(name=name, i=i)])
+                   for i, kind in enumerate(info['kinds'])]
+        graph_input[name] = pd.DataFrame(dict(zip(range(len(columns) - 1), columns[1:])), index=columns[0])
+        graph_input[name].columns = info['columns']
+    return graph_input
+
+
+def save_index(index, path, stamp, graph_input=None):
+    """Save ``index``, the tables it was built from and the definition ``stamp`` to ``path``.
+
+    Tables with values that cannot be stored without pickle are left out.
+    """
+    arrays = {'index/{key}'.format(key=key): np.asarray(index[key]) for key in INDEX_ARRAYS}
+    meta = {'stamp': stamp, 'tables': None}
+    if graph_input is not None:
+        tables = dict(arrays)
+        try:
+            meta['tables'] = _encode_tables(graph_input=graph_input, arrays=tables)
+            arrays = tables
+        except (TypeError, ValueError) as exc:
+            log.debug("not caching the tables with the focus index: {exc}".format(exc=exc))
+    arrays['meta'] = np.array(json.dumps(meta))
+
+    path = Path(path)
+    path.parent.mkdir(mode=0o700, parents=True, exist_ok=True)
+    partial = path.with_name('{name}.partial'.format(name=path.name))
+    with partial.open(mode='wb') as out:
+        np.savez(out, **arrays)
+    os.replace(str(partial), str(path))
+
+
+def load_index(path, stamp):
+    """Return the ``index`` and ``graph_input`` cached at ``path`` or `None` if missing or stale."""
+    path = Path(path)
+    if not path.exists():
+        return None
+
+    try:
+        with np.load(str(path), allow_pickle=False) as saved:
+            meta = json.loads(str(saved['meta']))
+            if meta.get('stamp') != stamp:
+                return None
+            index = Munch((key, saved['index/{key}'.format(key=key)]) for key in INDEX_ARRAYS)
+            graph_input = None if meta['tables'] is None else _decode_tables(tables=meta['tables'], arrays=saved)
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipFile) as exc:
+        log.debug("ignoring unreadable focus cache {p}: {exc}".format(p=path, exc=exc))
+        return None
+
+    return Munch(index=index, graph_input=graph_input)
+
+
+def cached_definition(definition, key=''):
+    """Return the cached ``index`` and ``graph_input`` of ``definition``, or `None`.
+
+    Args:
+        definition (Path): The definition file.
+        key (str): What else the loaded tables depend on (e.g. the database
+            queries); a cache saved with another key is stale.
+    """
+    cached = load_index(path=index_path(definition), stamp=_stamp(definition, key=key))
+    if cached is not None and cached.graph_input is not None:
+        log.debug("loaded {d} and its focus index from the cache.".format(d=Path(definition).name))
+        return cached
+    return None
+
+
+def cached_index(definition, graph_input, key=''):
+    """Return the focus index for ``graph_input``, reusing the cache of ``definition``.
+
+    The cache is invalidated when the definition file's modification time or
+    size changes, or when ``key`` differs from the one it was saved with.
+    ``graph_input`` is cached too, for ``cached_definition``.
+    """
+    path = index_path(definition)
+    stamp = _stamp(definition, key=key)
+
+    cached = load_index(path=path, stamp=stamp)
+    if cached is not None:
+        log.debug("loaded focus index from {p}.".format(p=path))
+        return cached.index
+
+    index = build_index(nodes=graph_input.Nodes, edges=graph_input.Edges)
+    try:
+        save_index(index=index, path=path, stamp=stamp, graph_input=graph_input)
+        log.debug("cached focus index as {p}.".format(p=path))
+    except (IOError, OSError) as exc:
+        log.warning("Could not cache the focus index: {exc}".format(exc=exc))
+
+    return index
+
+
+def neighborhood(index, focus, depth=1, direction='both'):
+    """Return the names of all nodes within ``depth`` hops of the ``focus`` nodes.
+
+    Args:
+        index (Munch): From ``build_index`` or ``cached_index``.
+        focus (list): Names of the nodes to centre on.
+        depth (int): Number of hops to follow.
+        direction (str): Follow ``out`` edges, ``in`` edges or ``both``.
+
+    Returns:
+        ndarray: Node names, focus nodes included.
+    """
+    if direction not in DIRECTIONS:
+        raise ValueError("direction must be one of {d}, not '{direction}'.".format(d=DIRECTIONS, direction=direction))
+
+    names = index['names']
+    ids = np.flatnonzero(np.isin(names, [str(f) for f in focus]))
+    missing = set(str(f) for f in focus) - set(names[ids])
+    if missing:
+        log.warning("Focus nodes not in the graph: {m}".format(m=', '.join(sorted(missing))))
+
+    adjacency = []
+    if direction in ('out', 'both'):
+        adjacency.append((index['out_indptr'], index['out_indices']))
+    if direction in ('in', 'both'):
+        adjacency.append((index['in_indptr'], index['in_indices']))
+
+    visited = np.zeros(len(names), dtype=bool)
+    visited[ids] = True
+    frontier = ids
+
+    for _ in range(depth):
+        if not len(frontier):
+            break
+        reached = np.concatenate([simplify.gather(indptr=indptr, indices=indices, frontier=frontier)
+                                  for indptr, indices in adjacency])
+        reached = np.unique(reached)
+        frontier = reached[~visited[reached]]
+        visited[frontier] = True
+
+    return names[visited]
+
+
+def induced_subgraph(graph_input, names):
+    """Return ``graph_input`` restricted to the nodes in ``names`` and the edges and clusters among them.
+
+    Names are compared as strings, so integer node names read from Excel match too.
+    """
+    keep = set(str(name) for name in names)
+    nodes = graph_input.Nodes
+    edges = graph_input.Edges
+
+    sub = Munch(graph_input)
+    sub.Nodes = nodes.loc[nodes['name'].astype(str).isin(keep)]
+    sub.Edges = edges.loc[edges['u_name'].astype(str).isin(keep) & edges['v_name'].astype(str).isin(keep)]
+
+    if 'Clusters' in graph_input and 'cluster_name' in nodes.columns:
+        clusters = graph_input.Clusters
+        sub.Clusters = clusters.loc[clusters['name'].isin(sub.Nodes['cluster_name'])]
+
+    log.info("Focused on {n} nodes and {e} edges.".format(n=len(sub.Nodes), e=len(sub.Edges)))
+    return sub
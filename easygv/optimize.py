@@ -0,0 +1,202 @@
+# -*- coding: utf-8 -*-
+"""Shrink rendered figures on their way to disk.
+
+The ``svgmin`` and ``svgz`` formats run graphviz with ``-Tsvg`` and pass its
+standard output line by line through ``minify_svg``, which drops comments,
+the DOCTYPE, attributes that only restate SVG defaults and indentation.
+``svgz`` gzips the minified lines as they are written, so neither format
+ever holds the whole drawing in memory.  PNG files can be recompressed in
+place by ``oxipng`` or ``optipng`` when one of them is installed.
+"""
+import gzip
+import io
+import os
+import re
+import shutil
+import subprocess
+import threading
+
+from logzero import logger as log
+
+from munch import Munch
+
+
+STREAMED_FORMATS = ('svgmin', 'svgz')
+# File name suffix of the formats whose name is not their suffix.
+FORMAT_SUFFIXES = Munch(svgmin='min.svg')
+
+# Markup that ``minify_svg`` drops, by opening token.
+SKIPPED = (('<!--', '-->'), ('<!DOCTYPE', '>'))
+# Attributes graphviz writes although their value is the SVG default (none
+# of graphviz's groups set a different value to inherit).
+DEFAULT_ATTRS = re.compile(r' (?:stroke="(?:none|transparent)"|fill="black"|text-anchor="start"|stroke-width="1")'
+                           r'(?=[ />])')
+
+# ``(program, arguments)`` recompressing a PNG file in place, in order of preference.
+PNG_OPTIMIZERS = (('oxipng', ('-o', '2', '--strip', 'safe', '-q')),
+                  ('optipng', ('-o2', '-quiet')))
+
+
+def suffix(fmt):
+    """Return the file name suffix used for the output format ``fmt``."""
+    return FORMAT_SUFFIXES.get(fmt, fmt)
+
+
+def _skip_markup(line, closing):
+    """Return ``line`` without the skipped markup in it and the token closing any still open."""
+    kept = []
+    while line:
+        if closing is not None:
+            end = line.find(closing)
+            if end < 0:
+                return ''.join(kept), closing
+            line = line[end + len(closing):]
+            closing = None
+            continue
+
+        starts = [(line.find(opener), opener, close) for opener, close in SKIPPED if opener in line]
+        if not starts:
+            kept.append(line)
+            break
+        start, opener, closing = min(starts)
+        kept.append(line[:start])
+        line = line[start + len(opener):]
+
+    return ''.join(kept), closing
+
+
+def minify_svg(lines):
+    """Yield the minified form of the graphviz SVG text ``lines``, one line at a time.
+
+    Comments and the DOCTYPE are dropped even when they span lines, default
+    valued attributes (``DEFAULT_ATTRS``) are removed and every line is
+    stripped; lines left empty are skipped.
+    """
+    closing = None
+    for line in lines:
+        line, closing = _skip_markup(line=line, closing=closing)
+        line = DEFAULT_ATTRS.sub('', line).strip()
+        if line:
+            yield line + '\n'
+
+
+def write_lines(lines, output, compress=False):
+    """Write the text ``lines`` to ``output``, gzipped if ``compress``.
+
+    Returns:
+        Munch: ``raw`` bytes of text written and ``written`` bytes on disk.
+    """
+    raw = 0
+    if compress:
+        out = gzip.open(str(output), mode='wt', encoding='utf-8', compresslevel=6)
+    else:
+        out = open(str(output), mode='w', encoding='utf-8')
+
+    with out:
+        for line in lines:
+            raw += len(line.encode('utf-8'))
+            out.write(line)
+
+    return Munch(raw=raw, written=os.path.getsize(str(output)))
+
+
+def report(path, before, after):
+    """Log how many bytes shrinking ``path`` saved."""
+    saved = before - after
+    log.info("{p}: {before:,} -> {after:,} bytes ({pct:.0f}% saved)".format(
+        p=path, before=before, after=after, pct=100.0 * saved / before if before else 0))
+
+
+def stream_svg(stream, output, compress=False):
+    """Write the minified form of the binary SVG ``stream`` to ``output`` as it is read.
+
+    Returns:
+        Munch: ``svg`` bytes read and bytes ``written``.
+    """
+    counted = Munch(svg=0)
+
+    def svg_lines():
+        for line in io.TextIOWrapper(stream, encoding='utf-8'):
+            counted.svg += len(line.encode('utf-8'))
+            yield line
+
+    sizes = write_lines(lines=minify_svg(svg_lines()), output=output, compress=compress)
+    return Munch(svg=counted.svg, written=sizes.written)
+
+
+def render_svg(cmd, output, compress=False, timeout=None):
+    """Run the graphviz ``-Tsvg`` command ``cmd`` and stream its minified output into ``output``.
+
+    Args:
+        cmd (list): Command line writing SVG to standard output.
+        output (Path): The ``.min.svg`` or ``.svgz`` file to write.
+        compress (bool): Gzip the output.
+        timeout (float): Seconds to wait before killing the process.
+
+    Returns:
+        Munch: ``svg`` bytes graphviz produced and bytes ``written``.
+
+    Raises:
+        subprocess.CalledProcessError: if the program fails.
+        subprocess.TimeoutExpired: if it runs longer than ``timeout``.
+    """
+    log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+    proc = subprocess.Popen(cmd, stdout=subprocess.PIPE)
+    killed = threading.Event()
+
+    def kill():
+        killed.set()
+        proc.kill()
+
+    timer = None if timeout is None else threading.Timer(timeout, kill)
+    if timer is not None:
+        timer.start()
+    try:
+        with proc.stdout:
+            sizes = stream_svg(stream=proc.stdout, output=output, compress=compress)
+        proc.wait()
+    finally:
+        if timer is not None:
+            timer.cancel()
+
+    if killed.is_set():
+        raise subprocess.TimeoutExpired(cmd, timeout)
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd)
+
+    report(path=output, before=sizes.svg, after=sizes.written)
+    return sizes
+
+
+def png_optimizer():
+    """Return the command line prefix of the first installed ``PNG_OPTIMIZERS`` program, or `None`."""
+    for prog, args in PNG_OPTIMIZERS:
+        path = shutil.which(prog)
+        if path is not None:
+            return [path] + list(args)
+    return None
+
+
+def optimize_png(path, optimizer=None):
+    """Recompress the PNG file ``path`` in place.
+
+    Args:
+        path (Path): The PNG file.
+        optimizer (list): Command line prefix; found with ``png_optimizer`` if not given.
+
+    Returns:
+        Munch: File size ``before`` and ``after``.
+
+    Raises:
+        ValueError: if no PNG optimizer is installed.
+    """
+    optimizer = optimizer or png_optimizer()
+    if optimizer is None:
+        raise ValueError("Optimizing PNG files requires 'oxipng' or 'optipng' on the PATH.")
+
+    before = os.path.getsize(str(path))
+    subprocess.check_call(list(optimizer) + [str(path)])
+    after = os.path.getsize(str(path))
+
+    report(path=path, before=before, after=after)
+    return Munch(before=before, after=after)
@@ -0,0 +1,221 @@
+# -*- coding: utf-8 -*-
+"""Draw a quick preview first and the full-quality figure in the background.
+
+``draw --preview`` reduces the graph (``preview_graph_input``: clusters
+collapsed into single nodes, then only the best connected nodes kept), lays
+it out with ``sfdp`` and straight edges and writes ``<name>.gv.svg`` right
+away.  ``start_full_render`` then pickles the ``draw`` jobs and runs them in
+a detached ``python -m easygv.preview JOB`` process.  That process renders
+into a scratch directory next to the outputs and moves every finished file
+into place with ``os.replace``, so the preview is swapped for the full
+figure in one step and readers never see a half written file.
+"""
+import os
+import pickle
+import shutil
+import subprocess
+import sys
+import tempfile
+import traceback
+from pathlib import Path
+
+from logzero import logger as log
+
+import pandas as pd
+
+from munch import Munch
+
+from easygv import dotwriter
+from easygv import focus
+from easygv import render
+from easygv import simplify
+
+
+# Largest number of nodes drawn in a preview.
+PREVIEW_NODES = 500
+PREVIEW_PROG = 'sfdp'
+PREVIEW_ARGS = ('-Gsplines=line', '-Goverlap=prism')
+PREVIEW_FORMAT = 'svg'
+
+SCRATCH_PREFIX = '.easygv-render-'
+JOB_FILE = 'job.pickle'
+LOG_FILE = 'render.log'
+
+
+def collapse_clusters(graph_input):
+    """Return ``graph_input`` with every cluster replaced by one node.
+
+    The cluster node takes the cluster's name and is labelled with the
+    cluster label and its number of nodes.  Edges are redirected to the
+    cluster nodes, edges inside a cluster are dropped and parallel edges are
+    merged with ``simplify.collapse_duplicates``.
+    """
+    nodes = graph_input.Nodes
+    if 'Clusters' not in graph_input or 'cluster_name' not in nodes.columns:
+        return graph_input
+
+    clusters = graph_input.Clusters
+    clustered = nodes['cluster_name'].isin(clusters['name'])
+    if not clustered.any():
+        return graph_input
+
+    owner = pd.Series(nodes.loc[clustered, 'cluster_name'].values,
+                      index=nodes.loc[clustered, 'name'].values)
+    owner = owner[~owner.index.duplicated()]
+    sizes = owner.value_counts()
+
+    members = clusters.loc[clusters['name'].isin(sizes.index)].drop_duplicates('name')
+    cluster_nodes = pd.DataFrame({'name': members['name'].values,
+                                  'label': ['{label} ({n})'.format(label=label, n=sizes[name]).strip()
+                                            for name, label in zip(members['name'], members['label'])],
+                                  'node_class': ''})
+
+    collapsed = Munch(graph_input)
+    collapsed.Nodes = pd.concat([nodes.loc[~clustered].drop('cluster_name', axis=1), cluster_nodes],
+                                ignore_index=True).fillna('')
+    del collapsed['Clusters']
+
+    edges = graph_input.Edges.copy()
+    edges['u_name'] = edges['u_name'].map(owner).fillna(edges['u_name'])
+    edges['v_name'] = edges['v_name'].map(owner).fillna(edges['v_name'])
+    edges = edges.loc[edges['u_name'] != edges['v_name']]
+    collapsed.Edges = simplify.collapse_duplicates(edges=edges)
+
+    return collapsed
+
+
+def sample_nodes(graph_input, max_nodes=PREVIEW_NODES):
+    """Return ``graph_input`` restricted to its ``max_nodes`` nodes with the most edges."""
+    nodes = graph_input.Nodes
+    if len(nodes) <= max_nodes:
+        return graph_input
+
+    edges = graph_input.Edges
+    degree = edges['u_name'].value_counts().add(edges['v_name'].value_counts(), fill_value=0)
+    degree = degree.reindex(nodes['name'].values).fillna(0).values
+
+    # stable sort keeps ties in table order, so the preview is reproducible
+    keep = nodes['name'].values[pd.Series(-degree).argsort(kind='mergesort').values[:max_nodes]]
+    return focus.induced_subgraph(graph_input=graph_input, names=keep)
+
+
+def preview_graph_input(graph_input, max_nodes=PREVIEW_NODES):
+    """Return a version of ``graph_input`` with at most ``max_nodes`` nodes that is cheap to lay out.
+
+    Graphs small enough already are returned unchanged; larger ones have
+    their clusters collapsed (``collapse_clusters``) and, if still too big,
+    are cut down to their best connected nodes (``sample_nodes``).
+    """
+    if len(graph_input.Nodes) <= max_nodes:
+        return graph_input
+
+    reduced = sample_nodes(graph_input=collapse_clusters(graph_input), max_nodes=max_nodes)
+    log.info("Preview shows {n} of {total} nodes.".format(n=len(reduced.Nodes), total=len(graph_input.Nodes)))
+    return reduced
+
+
+def preview_path(directory, name):
+    """Return the file the preview of figure ``name`` is written to (and later replaced)."""
+    return Path(directory) / '{name}.gv.{fmt}'.format(name=name, fmt=PREVIEW_FORMAT)
+
+
+def draw_preview(graph_input, attrs, name, directory, max_nodes=PREVIEW_NODES):
+    """Write the preview of figure ``name`` and return its path."""
+    reduced = preview_graph_input(graph_input=graph_input, max_nodes=max_nodes)
+    source = dotwriter.dot_string(graph_input=reduced, attrs=attrs)
+
+    path = preview_path(directory=directory, name=name)
+    partial = path.with_name('.{name}.partial'.format(name=path.name))
+    render.run_graphviz(source=source, prog=PREVIEW_PROG, fmt=PREVIEW_FORMAT, args=PREVIEW_ARGS, output=partial)
+    os.replace(str(partial), str(path))
+    return path
+
+
+def publish(scratch, directory):
+    """Move every entry of ``scratch`` into ``directory``, replacing what is there.
+
+    Files are moved with ``os.replace``.  A directory (such as a tile
+    pyramid) that already exists is first moved aside and deleted after
+    the new one is in place.
+
+    Returns:
+        list: The replaced paths in ``directory``.
+    """
+    scratch = Path(scratch)
+    directory = Path(directory)
+    published = []
+
+    for entry in sorted(scratch.iterdir()):
+        target = directory / entry.name
+        if entry.is_dir() and target.is_dir():
+            old = Path(tempfile.mkdtemp(dir=str(scratch.parent), prefix=SCRATCH_PREFIX))
+            os.replace(str(target), str(old / entry.name))
+            os.replace(str(entry), str(target))
+            shutil.rmtree(str(old))
+        else:
+            os.replace(str(entry), str(target))
+        published.append(target)
+
+    return published
+
+
+def start_full_render(jobs, directory):
+    """Run the ``draw`` ``jobs`` in a detached process that publishes the results into ``directory``.
+
+    Args:
+        jobs (list): ``(graph_input, attrs, name, settings)`` tuples for ``draw_graph``.
+        directory (Path): Where the finished files go.
+
+    Returns:
+        tuple: ``(pid, log_path)`` of the background process.
+    """
+    directory = Path(directory).resolve()
+    scratch = Path(tempfile.mkdtemp(dir=str(directory), prefix=SCRATCH_PREFIX))
+    job_path = scratch / JOB_FILE
+    log_path = scratch / LOG_FILE
+
+    with job_path.open(mode='wb') as out:
+        pickle.dump(Munch(directory=directory, jobs=jobs), out)
+
+    with log_path.open(mode='ab') as out:
+        proc = subprocess.Popen([sys.executable, '-m', 'easygv.preview', str(job_path)],
+                                stdin=subprocess.DEVNULL, stdout=out, stderr=out, start_new_session=True)
+    return proc.pid, log_path
+
+
+def run_full_render(job_path):
+    """Run the jobs saved by ``start_full_render`` and publish their outputs.
+
+    The scratch directory is removed on success and kept, with its log, on
+    failure.
+
+    Returns:
+        int: Exit code for the background process.
+    """
+    from easygv.cli import draw_graph
+
+    scratch = Path(job_path).parent
+    with Path(job_path).open(mode='rb') as saved:
+        job = pickle.load(saved)
+
+    output = scratch / 'out'
+    output.mkdir()
+
+    try:
+        for graph_input, attrs, name, settings in job.jobs:
+            settings = Munch(settings)
+            settings.directory = output
+            draw_graph(graph_input=graph_input, attrs=attrs, name=name, settings=settings)
+    except Exception:
+        traceback.print_exc()
+        log.error("Full render failed; the preview was kept.  Details: {p}".format(p=scratch / LOG_FILE))
+        return 1
+
+    for path in publish(scratch=output, directory=job.directory):
+        log.info("Replaced: {p}".format(p=path))
+    shutil.rmtree(str(scratch))
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(run_full_render(sys.argv[1]))
@@ -0,0 +1,433 @@
+# -*- coding: utf-8 -*-
+"""Run the graphviz programs and manage positioned (laid out) graphs.
+
+A positioned graph is the ``-Tdot`` output of a layout program: the same
+graph with ``pos``/``width``/``height`` on the nodes, spline control points
+in the edge ``pos`` and a ``bb`` bounding box on the graph and clusters.
+Rendering it with ``neato -n2`` skips the layout stage entirely.
+"""
+import os
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from logzero import logger as log
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import optimize
+from easygv import viewer
+
+
+NODE_LAYOUT_ATTRS = ('pos', 'width', 'height')
+EDGE_LAYOUT_ATTRS = ('pos', 'lp', 'xlp', 'head_lp', 'tail_lp')
+GRAPH_LAYOUT_ATTRS = ('bb', 'lp', 'lheight', 'lwidth')
+
+# Arguments telling neato to use the positions already in the graph.
+POSITIONED_ARGS = ('-n2',)
+
+# Layout attempts for ``layout_within_budget``, each cheaper than the last:
+# ``(name, prog or None for the requested one, extra args, drop edge labels)``.
+FALLBACKS = (('default', None, (), False),
+             ('reduced mclimit', None, ('-Gmclimit=0.1', '-Gnslimit=1', '-Gnslimit1=1'), False),
+             ('splines=line', None, ('-Gmclimit=0.1', '-Gnslimit=1', '-Gnslimit1=1', '-Gsplines=line'), False),
+             ('no edge labels', None, ('-Gmclimit=0.1', '-Gnslimit=1', '-Gnslimit1=1', '-Gsplines=line'), True),
+             ('sfdp', 'sfdp', ('-Gsplines=line',), True))
+
+# ``FALLBACKS`` for ``render_file_within_budget``: a graph that is only on
+# disk cannot have its edge labels dropped.
+FILE_FALLBACKS = FALLBACKS[:3] + (('sfdp', 'sfdp', ('-Gsplines=line',), False),)
+
+
+def time_left(deadline):
+    """Return the seconds left before the ``time.monotonic()`` ``deadline``, or `None` if there is none.
+
+    Raises:
+        subprocess.TimeoutExpired: if the deadline has passed.
+    """
+    if deadline is None:
+        return None
+    remaining = deadline - time.monotonic()
+    if remaining <= 0:
+        raise subprocess.TimeoutExpired(cmd='easygv', timeout=0)
+    return remaining
+
+
+def _attempts(fallbacks, deadline):
+    """Yield ``(i, strategy, timeout)`` for the ``fallbacks`` tried while time is left before ``deadline``.
+
+    Every attempt but the last may use half of the time left.
+    """
+    for i, strategy in enumerate(fallbacks):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            return
+        yield i, strategy, remaining if i == len(fallbacks) - 1 else remaining / 2.0
+
+
+def graphviz_cmd(prog, fmt, args=None, output=None, source_path=None):
+    """Return the command line running graphviz ``prog`` to produce ``fmt``."""
+    cmd = [prog, '-T{fmt}'.format(fmt=fmt)]
+    cmd.extend(args or ())
+    if output is not None:
+        cmd.append('-o{output}'.format(output=output))
+    if source_path is not None:
+        cmd.append(str(source_path))
+    return cmd
+
+
+def run_graphviz(source, prog='dot', fmt='dot', args=None, output=None, timeout=None):
+    """Run graphviz ``prog`` on the DOT text ``source``.
+
+    Args:
+        source (str): DOT text.
+        prog (str): Layout program (``dot``, ``neato``, ...).
+        fmt (str): Output format passed as ``-T``.
+        args (list): Extra command line arguments.
+        output (Path): Write the result here instead of returning it.
+        timeout (float): Seconds to wait before killing the process.
+
+    Returns:
+        bytes: The program's standard output (empty if ``output`` is given).
+
+    Raises:
+        subprocess.CalledProcessError: if the program fails.
+        subprocess.TimeoutExpired: if it runs longer than ``timeout``.
+    """
+    cmd = graphviz_cmd(prog=prog, fmt=fmt, args=args, output=output)
+    log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+
+    proc = subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    try:
+        out, err = proc.communicate(input=source.encode('utf-8'), timeout=timeout)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.communicate()
+        raise
+
+    if proc.returncode != 0:
+        raise subprocess.CalledProcessError(proc.returncode, cmd, output=err.decode('utf-8', 'replace'))
+
+    return out
+
+
+def compute_layout(source, prog='dot', args=None, timeout=None):
+    """Return the positioned DOT text that ``prog`` computes for ``source``."""
+    return run_graphviz(source=source, prog=prog, fmt='dot', args=args, timeout=timeout).decode('utf-8')
+
+
+def drop_edge_labels(source):
+    """Return ``source`` without any edge labels."""
+    g = pgv.AGraph(string=source)
+    for u, v in g.edges():
+        attr = g.get_edge(u, v).attr
+        for key in ('label', 'xlabel', 'headlabel', 'taillabel'):
+            if attr.get(key):
+                attr[key] = ''
+    return g.string()
+
+
+def layout_within_budget(source, prog='dot', budget=60.0, fallbacks=FALLBACKS):
+    """Lay out ``source`` within ``budget`` seconds, falling back to cheaper strategies on timeout.
+
+    Every attempt but the last may use half of the time left; a timed out
+    layout program is killed before the next attempt starts.  The name of
+    the strategy that succeeded is stored in the ``easygv_strategy`` graph
+    attribute of the result.
+
+    Args:
+        source (str): DOT text.
+        prog (str): Layout program of the first attempts.
+        budget (float): Total seconds for all attempts.
+        fallbacks (tuple): Strategies as in ``FALLBACKS``.
+
+    Returns:
+        tuple: ``(positioned, strategy)``
+
+    Raises:
+        subprocess.TimeoutExpired: if no strategy finished in time.
+    """
+    unlabelled = None
+
+    for i, (name, fallback_prog, args, drop_labels), timeout in _attempts(fallbacks, time.monotonic() + budget):
+        if drop_labels and unlabelled is None:
+            unlabelled = drop_edge_labels(source)
+
+        args = list(args) + ['-Geasygv_strategy={name}'.format(name=name)]
+        try:
+            positioned = compute_layout(source=unlabelled if drop_labels else source,
+                                        prog=fallback_prog or prog, args=args, timeout=timeout)
+        except subprocess.TimeoutExpired:
+            log.warning("Layout strategy '{name}' did not finish in {t:.1f}s.".format(name=name, t=timeout))
+            continue
+
+        if i:
+            log.warning("Laid out with fallback strategy '{name}'.".format(name=name))
+        return positioned, name
+
+    raise subprocess.TimeoutExpired(cmd=prog, timeout=budget)
+
+
+def layout_path(directory, name):
+    """Return where the positioned DOT for figure ``name`` is saved."""
+    return Path(directory) / '{name}.layout.gv'.format(name=name)
+
+
+def save_text(text, path):
+    """Write ``text`` to ``path`` and return ``path``."""
+    with Path(path).open(mode='w') as out:
+        out.write(text)
+    return path
+
+
+def render_to(gv_path, output, fmt, prog='dot', args=None, timeout=None):
+    """Render the DOT file ``gv_path`` to ``output`` and return ``output``.
+
+    The ``optimize.STREAMED_FORMATS`` are rendered as SVG and minified on
+    the way to ``output``.
+    """
+    if fmt in optimize.STREAMED_FORMATS:
+        cmd = graphviz_cmd(prog=prog, fmt='svg', args=args, source_path=gv_path)
+        optimize.render_svg(cmd=cmd, output=output, compress=fmt == 'svgz', timeout=timeout)
+        return output
+
+    cmd = graphviz_cmd(prog=prog, fmt=fmt, args=args, output=output, source_path=gv_path)
+    log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+    subprocess.check_call(cmd, timeout=timeout)
+    return output
+
+
+def render_file(gv_path, fmt, prog='dot', args=None, timeout=None):
+    """Render the DOT file ``gv_path`` to ``<gv_path>.<suffix>`` and return that path.
+
+    The output name matches what ``graphviz.Source.render`` produces; the
+    suffix is ``fmt`` except for ``optimize.FORMAT_SUFFIXES``.
+    """
+    fig_path = '{gv_path}.{suffix}'.format(gv_path=gv_path, suffix=optimize.suffix(fmt))
+    return render_to(gv_path=gv_path, output=fig_path, fmt=fmt, prog=prog, args=args, timeout=timeout)
+
+
+def _start_format(fmt, gv_path, prog, args):
+    """Start graphviz producing ``fmt`` from its standard input and return the run's bookkeeping."""
+    fig_path = '{gv_path}.{suffix}'.format(gv_path=gv_path, suffix=optimize.suffix(fmt))
+
+    if fmt not in optimize.STREAMED_FORMATS:
+        cmd = graphviz_cmd(prog=prog, fmt=fmt, args=args, output=fig_path)
+        log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+        return Munch(fmt=fmt, fig_path=fig_path, cmd=cmd, open=True, thread=None, sizes=None, error=None,
+                     proc=subprocess.Popen(cmd, stdin=subprocess.PIPE))
+
+    cmd = graphviz_cmd(prog=prog, fmt='svg', args=args)
+    log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+    run = Munch(fmt=fmt, fig_path=fig_path, cmd=cmd, open=True, sizes=None, error=None,
+                proc=subprocess.Popen(cmd, stdin=subprocess.PIPE, stdout=subprocess.PIPE))
+
+    def minify():
+        with run.proc.stdout:
+            try:
+                run.sizes = optimize.stream_svg(stream=run.proc.stdout, output=fig_path, compress=fmt == 'svgz')
+            except Exception as exc:
+                # raised again by render_concurrently once the thread is joined
+                run.error = exc
+
+    run.thread = threading.Thread(target=minify)
+    run.thread.start()
+    return run
+
+
+def render_concurrently(chunks, gv_path, formats, prog='dot', args=None, timeout=None, jobs=None):
+    """Render ``formats`` in parallel from DOT text as it is produced.
+
+    One graphviz process for each of the first ``jobs`` formats is started
+    up front.  Each chunk of ``chunks`` is appended to ``gv_path`` and
+    written to the standard input of every process as soon as it is
+    produced, so serializing the graph overlaps with graphviz reading it,
+    and those formats are laid out and written to disk in parallel.  Any
+    further formats are rendered from ``gv_path`` afterwards, ``jobs`` at a
+    time.
+
+    Args:
+        chunks (iterable): Consecutive pieces of DOT text (e.g. ``dotwriter.iter_dot``).
+        gv_path (Path): Where the DOT text is saved; outputs go to ``<gv_path>.<suffix>``.
+        formats (list): Output formats, including ``optimize.STREAMED_FORMATS``.
+        prog (str): Layout program.
+        args (list): Extra command line arguments.
+        timeout (float): Seconds all of it may take, producing ``chunks`` included.
+        jobs (int): Number of graphviz processes run at once (default: number of CPUs).
+
+    Returns:
+        list: Paths of the rendered files.
+
+    Raises:
+        subprocess.CalledProcessError: if a program fails.
+        subprocess.TimeoutExpired: if they run longer than ``timeout``.
+    """
+    jobs = jobs or os.cpu_count() or 1
+    deadline = None if timeout is None else time.monotonic() + timeout
+    runs = []
+    try:
+        for fmt in formats[:jobs]:
+            runs.append(_start_format(fmt=fmt, gv_path=gv_path, prog=prog, args=args))
+
+        with Path(gv_path).open(mode='w') as saved:
+            for chunk in chunks:
+                time_left(deadline)
+                saved.write(chunk)
+                data = chunk.encode('utf-8')
+                for run in runs:
+                    if run.open:
+                        try:
+                            run.proc.stdin.write(data)
+                        except BrokenPipeError:
+                            # the process failed; its exit code is reported below
+                            run.open = False
+
+        for run in runs:
+            try:
+                run.proc.stdin.close()
+            except BrokenPipeError:
+                pass
+
+        for run in runs:
+            run.proc.wait(timeout=time_left(deadline))
+            if run.thread is not None:
+                run.thread.join()
+                if run.error is not None:
+                    raise run.error
+    except BaseException:
+        for run in runs:
+            if run.proc.poll() is None:
+                run.proc.kill()
+                run.proc.wait()
+        raise
+
+    for run in runs:
+        if run.proc.returncode != 0:
+            raise subprocess.CalledProcessError(run.proc.returncode, run.cmd)
+        if run.sizes is not None:
+            optimize.report(path=run.fig_path, before=run.sizes.svg, after=run.sizes.written)
+
+    fig_paths = [run.fig_path for run in runs]
+    if formats[jobs:]:
+        with ThreadPoolExecutor(max_workers=jobs) as pool:
+            fig_paths.extend(pool.map(lambda f: render_file(gv_path=gv_path, fmt=f, prog=prog, args=args,
+                                                            timeout=time_left(deadline)),
+                                      formats[jobs:]))
+    return fig_paths
+
+
+def render_file_within_budget(gv_path, formats, prog='dot', timeout=60.0, jobs=None, fallbacks=FILE_FALLBACKS):
+    """Render the DOT file ``gv_path`` to ``formats`` within ``timeout`` seconds, laying it out with fallbacks.
+
+    The file is laid out into ``<gv_path>.layout`` like ``layout_within_budget``
+    would, without ever holding the graph in memory, and the positioned graph
+    is then rendered with ``neato -n2`` by ``render_concurrently``, replacing
+    ``gv_path``.
+
+    Returns:
+        list: Paths of the rendered files.
+
+    Raises:
+        subprocess.TimeoutExpired: if no strategy finished in time or the
+            rendering did not.
+    """
+    deadline = time.monotonic() + timeout
+    layout = Path('{gv_path}.layout'.format(gv_path=gv_path))
+
+    try:
+        for i, (name, fallback_prog, args, _), attempt_timeout in _attempts(fallbacks, deadline):
+            args = list(args) + ['-Geasygv_strategy={name}'.format(name=name)]
+            cmd = graphviz_cmd(prog=fallback_prog or prog, fmt='dot', args=args, output=layout, source_path=gv_path)
+            log.debug("running: {cmd}".format(cmd=' '.join(cmd)))
+            try:
+                subprocess.check_call(cmd, timeout=attempt_timeout)
+            except subprocess.TimeoutExpired:
+                log.warning("Layout strategy '{name}' did not finish in {t:.1f}s.".format(
+                    name=name, t=attempt_timeout))
+                continue
+
+            if i:
+                log.warning("Laid out with fallback strategy '{name}'.".format(name=name))
+            break
+        else:
+            raise subprocess.TimeoutExpired(cmd=prog, timeout=timeout)
+
+        with layout.open() as positioned:
+            return render_concurrently(chunks=positioned, gv_path=gv_path, formats=formats, prog='neato',
+                                       args=POSITIONED_ARGS, timeout=time_left(deadline), jobs=jobs)
+    finally:
+        if layout.exists():
+            layout.unlink()
+
+
+def render_positioned(positioned, gv_path, formats, timeout=None, jobs=None):
+    """Save the positioned DOT text to ``gv_path`` and render ``formats`` from it with ``neato -n2``.
+
+    The ``html`` format is the interactive viewer from ``viewer.render_html``.
+
+    Returns:
+        list: Paths of the rendered files.
+    """
+    fig_paths = render_concurrently(chunks=[positioned], gv_path=gv_path, formats=[f for f in formats if f != 'html'],
+                                    prog='neato', args=POSITIONED_ARGS, timeout=timeout, jobs=jobs)
+
+    if 'html' in formats:
+        fig_paths.append(viewer.render_html(positioned=positioned, path='{gv_path}.html'.format(gv_path=gv_path),
+                                            title=Path(gv_path).stem))
+    return fig_paths
+
+
+def copy_layout_attrs(target, source, keys):
+    """Copy the ``keys`` present on ``source`` (an attribute object) onto ``target``."""
+    for key in keys:
+        value = source.get(key)
+        if value:
+            target[key] = value
+
+
+def transfer_layout(source, layout):
+    """Return ``source`` positioned with the coordinates saved in ``layout``.
+
+    Only geometry is taken from ``layout``; every styling attribute comes
+    from ``source``, so a restyled graph with the same topology can be
+    rendered with ``neato -n2`` without running the layout again.
+
+    Args:
+        source (str): DOT text of the (re)styled graph.
+        layout (str): Positioned DOT text from ``compute_layout``.
+
+    Returns:
+        str: Positioned DOT text, or `None` if ``source`` has nodes or
+        edges missing from ``layout``.
+    """
+    g = pgv.AGraph(string=source)
+    positioned = pgv.AGraph(string=layout)
+
+    missing_nodes = set(g.nodes()) - set(positioned.nodes())
+    missing_edges = set(g.edges()) - set(positioned.edges())
+    if missing_nodes or missing_edges:
+        log.warning("Saved layout does not match the graph ({n} nodes, {e} edges missing).".format(
+            n=len(missing_nodes), e=len(missing_edges)))
+        return None
+
+    copy_layout_attrs(target=g.graph_attr, source=positioned.graph_attr, keys=GRAPH_LAYOUT_ATTRS)
+
+    for name in g.nodes():
+        copy_layout_attrs(target=g.get_node(name).attr, source=positioned.get_node(name).attr, keys=NODE_LAYOUT_ATTRS)
+
+    for u, v in g.edges():
+        copy_layout_attrs(target=g.get_edge(u, v).attr, source=positioned.get_edge(u, v).attr, keys=EDGE_LAYOUT_ATTRS)
+
+    for cluster in g.subgraphs():
+        if not cluster.name:
+            # anonymous scopes such as dotwriter's class blocks carry no geometry
+            continue
+        saved = positioned.get_subgraph(cluster.name)
+        if saved is not None:
+            copy_layout_attrs(target=cluster.graph_attr, source=saved.graph_attr, keys=GRAPH_LAYOUT_ATTRS)
+
+    return g.string()
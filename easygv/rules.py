@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Compile and evaluate rule-based styling selectors.
+
+Rules live in the ``RULES`` section of the attribute config and style every
+element of a table that matches their ``where`` clause::
+
+    RULES:
+        - name: busy_nodes
+          applies_to: nodes
+          priority: 10
+          where:
+              degree: {gt: 50}
+              label: {matches: '^core'}
+          attrs:
+              penwidth: 4
+        - applies_to: edges
+          where:
+              u_node_class: analysis
+          inherits_from: important
+          attrs:
+              color: '#B83545'
+
+Each rule is compiled once into a list of selectors; evaluating a rule
+produces a single boolean mask over the whole Nodes, Edges or Clusters table,
+so the cost of styling grows with the number of rules rather than with
+``rules * elements``.
+"""
+import re
+import operator
+
+from logzero import logger as log
+
+import numpy as np
+import pandas as pd
+
+from munch import Munch
+
+
+ELEMENT_KINDS = ('nodes', 'edges', 'clusters')
+# The graph_input table holding each element kind.
+KIND_TABLES = {'nodes': 'Nodes', 'edges': 'Edges', 'clusters': 'Clusters'}
+
+# Columns that rules may use but that are derived from other tables.
+DERIVED_COLUMNS = {'nodes': ('degree', 'in_degree', 'out_degree'),
+                   'edges': ('u_node_class', 'v_node_class', 'u_label', 'v_label'),
+                   'clusters': ('size',)}
+
+COMPARISONS = {'eq': operator.eq,
+               'ne': operator.ne,
+               'gt': operator.gt,
+               'ge': operator.ge,
+               'lt': operator.lt,
+               'le': operator.le}
+
+
+def compile_selector(column, spec):
+    """Return a compiled selector for one ``where`` entry.
+
+    Args:
+        column (str): The table column the selector tests.
+        spec: A scalar (equality), a list (membership) or a mapping of
+            operator names (``eq``, ``ne``, ``gt``, ``ge``, ``lt``, ``le``,
+            ``in``, ``not_in``, ``matches``, ``contains``) to operands.
+
+    Returns:
+        list: One ``Munch(column, op, value)`` per operator in ``spec``.
+    """
+    if isinstance(spec, dict):
+        items = spec.items()
+    elif isinstance(spec, (list, tuple, set)):
+        items = [('in', spec)]
+    else:
+        items = [('eq', spec)]
+
+    selectors = []
+    for op, value in items:
+        if op == 'matches':
+            value = re.compile(str(value))
+        elif op in ('in', 'not_in'):
+            value = list(value)
+        elif op not in COMPARISONS and op != 'contains':
+            raise ValueError("Unknown rule operator '{op}' for column '{column}'.".format(op=op, column=column))
+
+        selectors.append(Munch(column=column, op=op, value=value))
+
+    return selectors
+
+
+def compile_rule(rule, position, class_attrs=None):
+    """Return a compiled rule ready for evaluation.
+
+    Args:
+        rule (dict-like): One entry of the ``RULES`` list.
+        position (int): Position of the rule in the config, used to break
+            priority ties.
+        class_attrs (dict-like): The processed attributes for the rule's
+            element kind; used to resolve ``inherits_from``.
+
+    Returns:
+        Munch
+    """
+    applies_to = str(rule.get('applies_to', 'nodes')).lower()
+    if applies_to not in ELEMENT_KINDS:
+        raise ValueError("Rule applies_to must be one of {kinds}, not '{kind}'.".format(
+            kinds=ELEMENT_KINDS, kind=applies_to))
+
+    name = rule.get('name', 'rule_{position}'.format(position=position))
+
+    attrs = Munch()
+    inherits_from = rule.get('inherits_from')
+    if inherits_from:
+        for parent in str(inherits_from).split(','):
+            try:
+                attrs.update(class_attrs[parent.strip()])
+            except (KeyError, TypeError):
+                raise ValueError("Rule '{name}' inherits from unknown {kind} class '{parent}'.".format(
+                    name=name, kind=applies_to, parent=parent))
+
+    attrs.update(rule.get('attrs') or {})
+
+    selectors = []
+    where = rule.get('where') or {}
+    for column, spec in where.items():
+        selectors.extend(compile_selector(column=column, spec=spec))
+
+    return Munch(name=name,
+                 applies_to=applies_to,
+                 priority=rule.get('priority', 0),
+                 position=position,
+                 selectors=selectors,
+                 columns=set(s.column for s in selectors),
+                 attrs=attrs)
+
+
+def compile_rules(rules, attrs=None):
+    """Compile the ``RULES`` config section, grouped and ordered by element kind.
+
+    Rules are sorted by ``priority`` then config order; later rules win
+    where they set the same attribute, and every rule wins over the
+    ``BASE``/``ACTUAL`` class attributes.
+
+    Args:
+        rules (list): The ``RULES`` config section.
+        attrs (dict-like): The attribute tree being built by ``process_attrs``.
+
+    Returns:
+        Munch: ``nodes``, ``edges`` and ``clusters`` lists of compiled rules.
+    """
+    compiled = Munch({kind: [] for kind in ELEMENT_KINDS})
+
+    if not rules:
+        return compiled
+
+    if attrs is None:
+        attrs = Munch()
+
+    for position, rule in enumerate(rules):
+        kind = str(rule.get('applies_to', 'nodes')).lower()
+        c = compile_rule(rule=rule, position=position, class_attrs=attrs.get(kind))
+        compiled[c.applies_to].append(c)
+        log.debug("compiled rule {name} for {kind}.".format(name=c.name, kind=c.applies_to))
+
+    for kind in ELEMENT_KINDS:
+        compiled[kind].sort(key=lambda r: (r.priority, r.position))
+
+    return compiled
+
+
+def selector_mask(series, selector):
+    """Return a boolean mask of ``series`` values satisfying ``selector``."""
+    op = selector.op
+    value = selector.value
+
+    if op == 'matches':
+        return series.astype(str).str.contains(value.pattern, flags=value.flags, regex=True, na=False)
+    elif op == 'contains':
+        return series.astype(str).str.contains(str(value), regex=False, na=False)
+    elif op == 'in':
+        return series.isin(value)
+    elif op == 'not_in':
+        return ~series.isin(value)
+    elif op in ('eq', 'ne'):
+        return COMPARISONS[op](series, value)
+    else:
+        numbers = pd.to_numeric(series, errors='coerce')
+        return COMPARISONS[op](numbers, value).fillna(False).astype(bool)
+
+
+def rule_mask(rule, table):
+    """Return the boolean mask of ``table`` rows matched by ``rule``.
+
+    A rule without selectors matches every row; selectors on columns that
+    the table lacks match nothing.
+    """
+    mask = np.ones(len(table), dtype=bool)
+
+    for selector in rule.selectors:
+        if selector.column not in table.columns:
+            log.warning("Rule {name} uses missing column '{column}'.".format(name=rule.name, column=selector.column))
+            return np.zeros(len(table), dtype=bool)
+
+        mask &= np.asarray(selector_mask(series=table[selector.column], selector=selector), dtype=bool)
+
+    return mask
+
+
+def needed_columns(rules):
+    """Return the set of columns referenced by a list of compiled rules."""
+    columns = set()
+    for rule in rules:
+        columns.update(rule.columns)
+    return columns
+
+
+def rule_columns(compiled):
+    """Return the stored columns the compiled rules read, by table name.
+
+    Loaders that only keep the columns ``build_graph`` uses must keep these
+    too, or the rules testing them match nothing.  Derived columns are left
+    out; they are computed after loading.
+
+    Args:
+        compiled (Munch): The output from ``compile_rules``.
+
+    Returns:
+        Munch: ``Nodes``, ``Edges`` and ``Clusters`` sorted column lists.
+    """
+    columns = Munch()
+    for kind in ELEMENT_KINDS:
+        used = needed_columns(compiled.get(kind) or []) - set(DERIVED_COLUMNS[kind])
+        columns[KIND_TABLES[kind]] = sorted(used)
+    return columns
+
+
+def with_derived_columns(kind, graph_input, columns):
+    """Return the ``kind`` table with any derived ``columns`` the rules need.
+
+    Derived columns are computed with a single vectorized pass over the
+    Edges table and only when a rule references them.
+    """
+    table = graph_input[KIND_TABLES[kind]]
+    wanted = [c for c in DERIVED_COLUMNS[kind] if c in columns and c not in table.columns]
+
+    if not wanted:
+        return table
+
+    table = table.copy()
+    nodes = graph_input.Nodes
+
+    if kind == 'nodes':
+        out_degree = graph_input.Edges['u_name'].value_counts()
+        in_degree = graph_input.Edges['v_name'].value_counts()
+        table['out_degree'] = table['name'].map(out_degree).fillna(0).astype(int)
+        table['in_degree'] = table['name'].map(in_degree).fillna(0).astype(int)
+        table['degree'] = table['out_degree'] + table['in_degree']
+
+    elif kind == 'edges':
+        lookup = nodes.drop_duplicates('name').set_index('name')
+        for end in ('u', 'v'):
+            for column in ('node_class', 'label'):
+                derived = '{end}_{column}'.format(end=end, column=column)
+                if derived in wanted and column in lookup.columns:
+                    table[derived] = table['{end}_name'.format(end=end)].map(lookup[column]).fillna('')
+
+    elif kind == 'clusters':
+        if 'cluster_name' in nodes.columns:
+            sizes = nodes['cluster_name'].value_counts()
+            table['size'] = table['name'].map(sizes).fillna(0).astype(int)
+        else:
+            log.warning("Cluster rules use 'size' but the Nodes table has no 'cluster_name' column.")
+            table['size'] = 0
+
+    return table
+
+
+def element_keys(kind, table):
+    """Return the graph keys (node name, ``(u, v)`` or cluster name) of ``table`` rows."""
+    if kind == 'edges':
+        return list(zip(table['u_name'], table['v_name']))
+    else:
+        return list(table['name'])
+
+
+def resolve_rule_attrs(kind, graph_input, rules):
+    """Return the merged rule attributes for each matched element of ``kind``.
+
+    Args:
+        kind (str): One of ``nodes``, ``edges`` or ``clusters``.
+        graph_input (dict-like): the output from ``load_graph_input``.
+        rules (list): Compiled rules for ``kind`` in precedence order.
+
+    Returns:
+        dict: Element key to ``Munch`` of attributes; unmatched elements are absent.
+    """
+    resolved = {}
+
+    if not rules:
+        return resolved
+
+    table = with_derived_columns(kind=kind, graph_input=graph_input, columns=needed_columns(rules))
+    keys = element_keys(kind=kind, table=table)
+
+    for rule in rules:
+        hits = np.flatnonzero(rule_mask(rule=rule, table=table))
+        log.debug("rule {name} matched {n} {kind}.".format(name=rule.name, n=len(hits), kind=kind))
+
+        for i in hits:
+            resolved.setdefault(keys[i], Munch()).update(rule.attrs)
+
+    return resolved
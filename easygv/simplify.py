@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+"""Simplify dense graph definitions before they reach graphviz.
+
+Every stage works on the Nodes/Edges tables from ``load_graph_input`` and
+returns new tables, so the result can be handed to ``build_graph`` or
+``dotwriter`` unchanged.
+"""
+import math
+
+from logzero import logger as log
+
+import numpy as np
+import pandas as pd
+
+from munch import Munch
+
+
+def collapse_duplicates(edges):
+    """Collapse parallel ``u_name``/``v_name`` rows into a single edge.
+
+    The first row's ``label`` and ``edge_class`` are kept.  Collapsed edges
+    get a ``count`` column and, where more than one row was merged, a
+    ``penwidth`` growing with ``log2(count)`` and a ``weight`` of ``count``
+    so that dot keeps heavy bundles short.
+
+    Args:
+        edges (DataFrame): The Edges table.
+
+    Returns:
+        DataFrame
+    """
+    grouped = edges.groupby(['u_name', 'v_name'], sort=False)
+    collapsed = grouped.first().reset_index()
+    counts = grouped.size().values
+
+    collapsed['count'] = counts
+    collapsed['penwidth'] = [round(1 + math.log(c, 2), 2) if c > 1 else '' for c in counts]
+    collapsed['weight'] = [c if c > 1 else '' for c in counts]
+
+    return collapsed
+
+
+def node_ids(nodes, edges):
+    """Return integer ids for every node name in ``nodes`` and ``edges``.
+
+    Returns:
+        tuple: ``(names, u, v)`` where ``names[i]`` is the name of id ``i``
+        and ``u``/``v`` are the integer ids of each edge's ends.
+    """
+    all_names = pd.concat([nodes['name'], edges['u_name'], edges['v_name']], ignore_index=True)
+    codes, names = pd.factorize(all_names)
+    n_nodes = len(nodes)
+    n_edges = len(edges)
+    u = codes[n_nodes:n_nodes + n_edges]
+    v = codes[n_nodes + n_edges:]
+    return np.asarray(names), u, v
+
+
+def csr(n, u, v):
+    """Return a compressed sparse row adjacency index of the edges ``u -> v``.
+
+    Returns:
+        tuple: ``(indptr, indices, edge_ids)``; the targets of node ``i`` are
+        ``indices[indptr[i]:indptr[i + 1]]`` and ``edge_ids`` holds the
+        original edge position of each entry.
+    """
+    edge_ids = np.argsort(u, kind='mergesort')
+    indptr = np.concatenate([[0], np.cumsum(np.bincount(u, minlength=n))])
+    return indptr, v[edge_ids], edge_ids
+
+
+def gather(indptr, indices, frontier):
+    """Return the concatenated CSR neighbours of every node in ``frontier``."""
+    starts = indptr[frontier]
+    lengths = indptr[frontier + 1] - starts
+    total = lengths.sum()
+    if total == 0:
+        return indices[:0]
+    offsets = np.concatenate([[0], np.cumsum(lengths)[:-1]])
+    return indices[np.repeat(starts - offsets, lengths) + np.arange(total)]
+
+
+def topological_order(n, u, v):
+    """Return a topological order of ``n`` integer nodes using Kahn's algorithm.
+
+    Each round removes the whole zero in-degree frontier at once with NumPy
+    operations over the edge arrays.
+
+    Args:
+        n (int): Number of nodes.
+        u (ndarray): Integer source id of each edge.
+        v (ndarray): Integer target id of each edge.
+
+    Returns:
+        tuple: ``(order, level)``; ``order`` is shorter than ``n`` when the
+        graph has a cycle, and ``level[i]`` is the round in which node ``i``
+        was removed (``-1`` for nodes on or behind a cycle).
+    """
+    in_degree = np.bincount(v, minlength=n)
+    indptr, targets, _ = csr(n=n, u=u, v=v)
+
+    level = np.full(n, -1, dtype=np.int64)
+    frontier = np.flatnonzero(in_degree == 0)
+    order = []
+    depth = 0
+
+    while len(frontier):
+        level[frontier] = depth
+        order.append(frontier)
+
+        reached = gather(indptr=indptr, indices=targets, frontier=frontier)
+        if len(reached) == 0:
+            break
+
+        in_degree -= np.bincount(reached, minlength=n)
+        candidates = np.unique(reached)
+        frontier = candidates[in_degree[candidates] == 0]
+        depth += 1
+
+    order = np.concatenate(order) if order else np.array([], dtype=np.int64)
+    return order, level
+
+
+def transitive_reduction(nodes, edges):
+    """Drop edges implied by longer paths in a DAG.
+
+    Reachability is tracked as one integer bitset per node, built in reverse
+    topological order, so memory grows with ``nodes ** 2 / 8`` bytes; use it
+    on graphs of up to a few tens of thousands of nodes.
+
+    Args:
+        nodes (DataFrame): The Nodes table.
+        edges (DataFrame): The Edges table without duplicate ``u``/``v`` pairs.
+
+    Returns:
+        DataFrame: ``edges`` unchanged if the graph has a cycle.
+    """
+    names, u, v = node_ids(nodes=nodes, edges=edges)
+    n = len(names)
+    order, _ = topological_order(n=n, u=u, v=v)
+
+    if len(order) < n:
+        log.warning("Graph has a cycle; skipping transitive reduction.")
+        return edges
+
+    indptr, targets, by_source = csr(n=n, u=u, v=v)
+
+    reach = [0] * n
+    redundant = np.zeros(len(edges), dtype=bool)
+
+    for node in order[::-1]:
+        children = targets[indptr[node]:indptr[node + 1]]
+        below = 0
+        for child in children:
+            below |= reach[child]
+        for i, child in enumerate(children):
+            if below >> int(child) & 1:
+                redundant[by_source[indptr[node] + i]] = True
+            below |= 1 << int(child)
+        reach[node] = below
+
+    return edges.loc[~redundant].reset_index(drop=True)
+
+
+def bundle_hubs(nodes, edges, min_fanout):
+    """Collapse a hub's fan-out to leaf nodes into one summary node per class.
+
+    A leaf is a node whose only edge comes from the hub.  Leaves of the same
+    hub that share ``node_class``, ``cluster_name`` and the ``edge_class`` of
+    their edge (those of these columns that are present) are replaced by a
+    single node labelled ``"<count> <node_class>"``, once there are at least
+    ``min_fanout`` of them.
+
+    Args:
+        nodes (DataFrame): The Nodes table.
+        edges (DataFrame): The Edges table.
+        min_fanout (int): Smallest number of leaves worth bundling.
+
+    Returns:
+        tuple: New ``(nodes, edges)`` tables.
+    """
+    degree = edges['u_name'].value_counts().add(edges['v_name'].value_counts(), fill_value=0)
+    leaves = set(degree.index[degree == 1])
+
+    # Group on whichever of the class and cluster columns the tables have
+    keys = [c for c in ('node_class', 'cluster_name') if c in nodes.columns]
+    edge_keys = ['edge_class'] if 'edge_class' in edges.columns else []
+    fan = edges.loc[edges['v_name'].isin(leaves), ['u_name', 'v_name'] + edge_keys]
+    fan = fan.merge(nodes[['name'] + keys].drop_duplicates('name'), left_on='v_name', right_on='name')
+
+    group_keys = ['u_name'] + edge_keys + keys
+    sizes = fan.groupby(group_keys)['v_name'].transform('size')
+    fan = fan.loc[sizes >= min_fanout]
+
+    if fan.empty:
+        return nodes, edges
+
+    bundles = fan.groupby(group_keys, sort=False)['v_name'].size().rename('count').reset_index()
+    kinds = bundles['node_class'] if 'node_class' in bundles.columns else pd.Series('', index=bundles.index)
+    bundles['name'] = ['{u}__{kind}__bundle{i}'.format(u=u, kind=kind, i=i)
+                       for i, (u, kind) in enumerate(zip(bundles['u_name'], kinds))]
+    bundles['label'] = ['{n} {kind}'.format(n=n, kind=kind or 'nodes').strip()
+                        for n, kind in zip(bundles['count'], kinds)]
+
+    bundled = set(fan['v_name'])
+    new_nodes = pd.concat([nodes.loc[~nodes['name'].isin(bundled)],
+                           bundles[['name', 'label'] + keys]],
+                          ignore_index=True).fillna('')
+
+    bundle_edges = bundles[['u_name', 'name'] + edge_keys + ['count']].rename(columns={'name': 'v_name'})
+    bundle_edges['label'] = ''
+    new_edges = pd.concat([edges.loc[~edges['v_name'].isin(bundled)], bundle_edges],
+                          ignore_index=True).fillna('')
+
+    return new_nodes, new_edges
+
+
+def simplify(graph_input, collapse=True, reduce=False, min_fanout=None):
+    """Return a simplified copy of ``graph_input`` and statistics on what was removed.
+
+    Args:
+        graph_input (dict-like): the output from ``load_graph_input``.
+        collapse (bool): Merge duplicate ``u_name``/``v_name`` edges.
+        reduce (bool): Apply ``transitive_reduction`` (skipped for cyclic graphs).
+        min_fanout (int): Bundle hub fan-out with ``bundle_hubs`` if given.
+
+    Returns:
+        tuple: ``(graph_input, stats)``
+    """
+    nodes = graph_input.Nodes
+    edges = graph_input.Edges
+    stats = Munch(nodes_in=len(nodes), edges_in=len(edges),
+                  duplicates_removed=0, transitive_removed=0,
+                  bundled_nodes_removed=0, bundled_edges_removed=0)
+
+    if collapse:
+        n = len(edges)
+        edges = collapse_duplicates(edges=edges)
+        stats.duplicates_removed = n - len(edges)
+
+    if reduce:
+        n = len(edges)
+        edges = transitive_reduction(nodes=nodes, edges=edges)
+        stats.transitive_removed = n - len(edges)
+
+    if min_fanout:
+        n_nodes, n_edges = len(nodes), len(edges)
+        nodes, edges = bundle_hubs(nodes=nodes, edges=edges, min_fanout=min_fanout)
+        stats.bundled_nodes_removed = n_nodes - len(nodes)
+        stats.bundled_edges_removed = n_edges - len(edges)
+
+    stats.nodes_out = len(nodes)
+    stats.edges_out = len(edges)
+    log.debug("Simplified graph: {edges_in} -> {edges_out} edges "
+              "({duplicates_removed} duplicate, {transitive_removed} transitive, "
+              "{bundled_edges_removed} bundled).".format(**stats))
+
+    simplified = Munch(graph_input)
+    simplified.Nodes = nodes
+    simplified.Edges = edges
+    return simplified, stats
@@ -0,0 +1,297 @@
+# -*- coding: utf-8 -*-
+"""Provide graph input sources other than a single Excel workbook."""
+import sqlite3
+from pathlib import Path
+
+from logzero import logger as log
+
+import pandas as pd
+
+from munch import Munch
+
+
+EDGE_COLUMNS = ('u_name', 'v_name', 'label', 'edge_class')
+# Optional Edges columns holding per-edge graphviz attributes.
+EDGE_ATTR_COLUMNS = ('penwidth', 'weight')
+# Column naming the graph a row belongs to in workbooks defining several graphs.
+GRAPH_COLUMN = 'graph'
+ARROW_SUFFIXES = ('.arrow', '.feather', '.ipc')
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+# The columns build_graph reads from each table.
+TABLE_COLUMNS = Munch(Nodes=('name', 'label', 'node_class', 'cluster_name'),
+                      Edges=EDGE_COLUMNS + EDGE_ATTR_COLUMNS,
+                      Clusters=('name', 'label', 'cluster_class'))
+
+
+def nan_to_str(x):
+    """Return empty string if pd.isnull(x): x otherwise."""
+    if pd.isnull(x):
+        return ''
+    else:
+        return x
+
+
+def recode_graph_input(data):
+    """Recode NaNs to ``''`` and prefix cluster names with ``cluster_`` in place.
+
+    Args:
+        data (Munch): ``Nodes``/``Edges``/``Clusters`` tables from any source.
+
+    Returns:
+        Munch: ``data``
+    """
+    for name, table in data.items():
+        data[name] = table.applymap(nan_to_str)
+
+    try:
+        data.Nodes["cluster_name"] = data.Nodes["cluster_name"].apply(lambda name: "cluster_{name}".format(name=name))
+        data.Clusters["name"] = data.Clusters["name"].apply(lambda name: "cluster_{name}".format(name=name))
+    except (KeyError, AttributeError):
+        pass
+
+    return data
+
+
+def split_graphs(tables):
+    """Return the tables of every graph defined by one workbook, keyed by graph name.
+
+    Sheets named ``<Table>.<graph>`` (e.g. ``Nodes.pipeline``) belong to that
+    graph.  Rows of the plain ``Nodes``/``Edges``/``Clusters`` sheets belong
+    to the graph named in their ``graph`` column, or to every graph when
+    that column is empty or missing.  A workbook with neither defines a
+    single graph keyed by `None`.
+
+    Args:
+        tables (dict-like): Sheet name to DataFrame, as read from the workbook.
+
+    Returns:
+        dict: Graph name to a ``Munch`` of tables.
+    """
+    shared = Munch()
+    own = {}
+    for sheet, table in tables.items():
+        table_name, sep, graph = sheet.partition('.')
+        if sep and table_name in TABLE_COLUMNS:
+            own.setdefault(graph, Munch())[table_name] = table
+        else:
+            shared[sheet] = table
+
+    split = {}
+    for table_name, table in shared.items():
+        if GRAPH_COLUMN not in table.columns:
+            continue
+        graph = table[GRAPH_COLUMN].fillna('').astype(str)
+        blank = (graph == '').values
+        split[table_name] = (table.loc[blank].drop(GRAPH_COLUMN, axis=1),
+                             {key: part.drop(GRAPH_COLUMN, axis=1)
+                              for key, part in table.loc[~blank].groupby(graph[~blank])})
+
+    names = list(own)
+    for _, groups in split.values():
+        names.extend(key for key in groups if key not in names)
+
+    if not names:
+        return {None: tables}
+
+    graphs = {}
+    for name in names:
+        data = Munch()
+        for table_name, table in shared.items():
+            if table_name in split:
+                common, groups = split[table_name]
+                data[table_name] = pd.concat([common, groups[name]]) if name in groups else common
+            else:
+                data[table_name] = table
+        data.update(own.get(name, {}))
+        graphs[name] = data
+
+    return graphs
+
+
+def recode_edges(chunk):
+    """Return an Edges ``chunk`` with missing columns added and NaNs recoded to ``''``."""
+    for column in EDGE_COLUMNS:
+        if column not in chunk.columns:
+            chunk[column] = ''
+    return chunk.fillna('')
+
+
+def _iter_csv_chunks(path, chunksize, keep):
+    return pd.read_csv(str(path), chunksize=chunksize, dtype=str, usecols=lambda column: column in keep)
+
+
+def _iter_arrow_chunks(path, chunksize, keep):
+    try:
+        import pyarrow as pa
+    except ImportError:
+        raise ImportError("Reading Arrow IPC edge files requires the optional 'pyarrow' package.")
+
+    source = pa.memory_map(str(path), 'r')
+    try:
+        reader = pa.ipc.open_file(source)
+        batches = (reader.get_batch(i) for i in range(reader.num_record_batches))
+    except pa.ArrowInvalid:
+        source.seek(0)
+        batches = pa.ipc.open_stream(source)
+
+    for batch in batches:
+        columns = [c for c in batch.schema.names if c in keep]
+        batch = batch.select(columns) if hasattr(batch, 'select') else batch
+        for offset in range(0, batch.num_rows, chunksize):
+            yield batch.slice(offset, chunksize).to_pandas()
+
+
+def iter_edge_chunks(path, chunksize=100000, columns=()):
+    """Yield the Edges table stored at ``path`` in chunks of at most ``chunksize`` rows.
+
+    CSV files are read with ``pandas.read_csv``; ``.arrow``, ``.feather`` and
+    ``.ipc`` files are memory-mapped and read batch by batch with ``pyarrow``.
+    Only the columns ``build_graph`` uses and ``columns`` are kept, so peak
+    memory stays bounded by the chunk size.
+
+    Args:
+        path (Path): Path to a CSV or Arrow IPC file with an Edges table.
+        chunksize (int): Maximum number of rows per chunk.
+        columns (iterable): Further columns to keep, e.g. those the edge
+            ``RULES`` test (``rules.rule_columns``).
+
+    Yields:
+        DataFrame: Recoded Edges chunks.
+    """
+    path = Path(path)
+    keep = set(EDGE_COLUMNS) | set(EDGE_ATTR_COLUMNS) | set(columns)
+
+    if path.suffix.lower() in ARROW_SUFFIXES:
+        chunks = _iter_arrow_chunks(path=path, chunksize=chunksize, keep=keep)
+    else:
+        chunks = _iter_csv_chunks(path=path, chunksize=chunksize, keep=keep)
+
+    for i, chunk in enumerate(chunks):
+        log.debug("read edge chunk {i} ({n} rows) from {path}.".format(i=i, n=len(chunk), path=path.name))
+        yield recode_edges(chunk)
+
+
+def edge_degrees(chunks):
+    """Return the in/out degree of every node seen in the Edges ``chunks``.
+
+    Args:
+        chunks (iterable): Edges tables, e.g. from ``iter_edge_chunks``.
+
+    Returns:
+        Munch: ``out_degree`` and ``in_degree`` Series indexed by node name.
+    """
+    out_degree = pd.Series(dtype='int64')
+    in_degree = pd.Series(dtype='int64')
+
+    for chunk in chunks:
+        out_degree = out_degree.add(chunk['u_name'].value_counts(), fill_value=0)
+        in_degree = in_degree.add(chunk['v_name'].value_counts(), fill_value=0)
+
+    return Munch(out_degree=out_degree, in_degree=in_degree)
+
+
+def table_query(source, columns=None, where=None):
+    """Return a SELECT over ``source`` restricted to ``columns`` and ``where``.
+
+    Args:
+        source (str): A table name or a full SELECT statement.
+        columns (list): Columns to select; all columns if `None`.
+        where (str): Optional SQL condition pushed into the query.
+
+    Returns:
+        str
+    """
+    stripped = source.strip().rstrip(';')
+    if stripped.split(None, 1)[0].lower() in ('select', 'with'):
+        relation = '({query}) AS easygv_src'.format(query=stripped)
+    else:
+        relation = '"{table}"'.format(table=stripped.replace('"', '""'))
+
+    if columns is None:
+        selected = '*'
+    else:
+        selected = ', '.join('"{c}"'.format(c=c) for c in columns)
+
+    query = 'SELECT {selected} FROM {relation}'.format(selected=selected, relation=relation)
+    if where:
+        query = '{query} WHERE {where}'.format(query=query, where=where)
+    return query
+
+
+def query_columns(connection, source):
+    """Return the column names of ``source`` without fetching any rows."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(table_query(source=source, where='1 = 0'))
+        return [d[0] for d in cursor.description]
+    finally:
+        cursor.close()
+
+
+def iter_query_batches(connection, query, batch_size=10000):
+    """Yield the result of ``query`` as DataFrames of at most ``batch_size`` rows using ``fetchmany``."""
+    cursor = connection.cursor()
+    try:
+        cursor.execute(query)
+        columns = [d[0] for d in cursor.description]
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                break
+            yield pd.DataFrame.from_records(rows, columns=columns)
+    finally:
+        cursor.close()
+
+
+def load_graph_input_sql(connection, queries=None, where=None, batch_size=10000, columns=None):
+    """Return graph_input tables read from a DB-API ``connection``.
+
+    Args:
+        connection: Any DB-API 2.0 connection (e.g. from ``sqlite3.connect``).
+        queries (dict): Table name or SELECT statement for each of ``Nodes``,
+            ``Edges`` and ``Clusters``; defaults to tables of those names.
+        where (dict): Optional SQL condition for each table.
+        batch_size (int): Rows per ``fetchmany`` call.
+        columns (dict): Further columns to select for each table, e.g. those
+            the ``RULES`` test (``rules.rule_columns``).
+
+    Returns:
+        Munch: The same recoded tables ``load_graph_input`` produces.
+    """
+    queries = dict(queries or {})
+    where = dict(where or {})
+    columns = dict(columns or {})
+    data = Munch()
+
+    for table, wanted in TABLE_COLUMNS.items():
+        source = queries.get(table, table)
+        try:
+            available = query_columns(connection=connection, source=source)
+        except Exception as exc:
+            if table == 'Clusters' and table not in queries:
+                log.debug("no Clusters table: {exc}".format(exc=exc))
+                if hasattr(connection, 'rollback'):
+                    connection.rollback()
+                continue
+            raise
+
+        wanted = list(wanted) + [c for c in columns.get(table, ()) if c not in wanted]
+        selected = [c for c in wanted if c in available]
+        query = table_query(source=source, columns=selected, where=where.get(table))
+        log.debug("{table} query: {query}".format(table=table, query=query))
+
+        batches = list(iter_query_batches(connection=connection, query=query, batch_size=batch_size))
+        data[table] = pd.concat(batches, ignore_index=True) if batches else pd.DataFrame(columns=selected)
+
+    return recode_graph_input(data)
+
+
+def load_graph_input_sqlite(path, queries=None, where=None, batch_size=10000, columns=None):
+    """Return graph_input tables read from the SQLite database at ``path``."""
+    connection = sqlite3.connect(str(path))
+    try:
+        return load_graph_input_sql(connection=connection, queries=queries, where=where, batch_size=batch_size,
+                                    columns=columns)
+    finally:
+        connection.close()
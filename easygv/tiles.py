@@ -0,0 +1,310 @@
+# -*- coding: utf-8 -*-
+"""Render a positioned graph into a Deep Zoom tile pyramid.
+
+Instead of one huge raster, every zoom level is cut into fixed-size PNG
+tiles, each rendered on its own by ``neato -n2`` with a ``viewport`` onto
+the already computed layout, so no process ever holds more than one tile's
+pixels.  Each tile is given only the clusters, nodes and edges whose
+bounding box overlaps it (plus the end nodes of its edges), found by
+bucketing every element into the tile grid of each level once, so the cost
+of a pyramid grows with ``elements * levels`` rather than with
+``elements * tiles``.  Tiles are written in the Deep Zoom (``.dzi``) layout
+understood by viewers such as OpenSeadragon::
+
+    <name>.dzi
+    <name>_files/<level>/<column>_<row>.png
+"""
+import math
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from logzero import logger as log
+
+import numpy as np
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import dotwriter
+from easygv import render
+
+
+DZI_TEMPLATE = """<?xml version="1.0" encoding="UTF-8"?>
+<Image xmlns="http://schemas.microsoft.com/deepzoom/2008" Format="png" Overlap="0" TileSize="{tile_size}">
+    <Size Width="{width}" Height="{height}"/>
+</Image>
+"""
+
+# Make one point one pixel, keep graphviz from adding space around the viewport
+# and from moving the drawing to the origin, which would depend on what a tile contains.
+TILE_ARGS = ('-Gdpi=72', '-Gpad=0', '-Gmargin=0', '-Gsize=', '-Gratio=', '-Gnotranslate=true')
+
+# Points added around every element's box for pen widths and arrowheads.
+ELEMENT_MARGIN = 8.0
+# Pixels added around every tile for antialiasing.
+TILE_MARGIN = 2.0
+# Estimated glyph width and line height of a label, in font sizes.
+CHAR_WIDTH = 0.6
+LINE_HEIGHT = 1.2
+# Edge attributes holding a label position, and the attribute with its text.
+EDGE_LABELS = (('lp', 'label'), ('xlp', 'xlabel'), ('head_lp', 'headlabel'), ('tail_lp', 'taillabel'))
+
+_NUMBER = re.compile(r'-?(?:[0-9]+\.?[0-9]*|\.[0-9]+)(?:[eE][-+]?[0-9]+)?')
+
+
+def tile_jobs(bb, tile_size=256, scale=1.0):
+    """Return the full image size and one job per tile of the pyramid.
+
+    Args:
+        bb (tuple): ``(llx, lly, urx, ury)`` of the positioned graph in points.
+        tile_size (int): Tile edge in pixels.
+        scale (float): Pixels per point at the deepest level.
+
+    Returns:
+        tuple: ``((width, height), jobs)`` where each job is
+        ``(level, column, row, tile_width, tile_height, zoom, x, y)`` with
+        ``x``/``y`` the tile centre in graph coordinates.
+    """
+    llx, lly, urx, ury = bb
+    width = max(1, int(math.ceil((urx - llx) * scale)))
+    height = max(1, int(math.ceil((ury - lly) * scale)))
+    max_level = int(math.ceil(math.log(max(width, height), 2)))
+
+    jobs = []
+    for level in range(max_level + 1):
+        factor = 2 ** (max_level - level)
+        level_width = int(math.ceil(width / float(factor)))
+        level_height = int(math.ceil(height / float(factor)))
+        zoom = scale * level_width / float(width)
+
+        for column in range(int(math.ceil(level_width / float(tile_size)))):
+            for row in range(int(math.ceil(level_height / float(tile_size)))):
+                tile_width = min(tile_size, level_width - column * tile_size)
+                tile_height = min(tile_size, level_height - row * tile_size)
+                x = llx + (column * tile_size + tile_width / 2.0) / zoom
+                y = ury - (row * tile_size + tile_height / 2.0) / zoom
+                jobs.append((level, column, row, tile_width, tile_height, zoom, x, y))
+
+    return (width, height), jobs
+
+
+def _points(value):
+    """Return the ``(n, 2)`` array of points in a ``pos``, ``lp`` or ``bb`` attribute."""
+    numbers = [float(n) for n in _NUMBER.findall(value or '')]
+    return np.array(numbers[:len(numbers) // 2 * 2], dtype=float).reshape(-1, 2)
+
+
+def _label_box(lp, text, fontsize):
+    """Return an estimated box around the label ``text`` centred on ``lp``, or `None`."""
+    centre = _points(lp)
+    if not len(centre) or not text:
+        return None
+    lines = str(text).replace('\\l', '\\n').replace('\\r', '\\n').split('\\n')
+    half_width = max(len(line) for line in lines) * CHAR_WIDTH * fontsize / 2.0
+    half_height = len(lines) * LINE_HEIGHT * fontsize / 2.0
+    x, y = centre[0]
+    return (x - half_width, y - half_height, x + half_width, y + half_height)
+
+
+def _union(boxes):
+    boxes = [b for b in boxes if b is not None]
+    if not boxes:
+        return None
+    return (min(b[0] for b in boxes), min(b[1] for b in boxes), max(b[2] for b in boxes), max(b[3] for b in boxes))
+
+
+def _fontsize(attr, key='fontsize'):
+    try:
+        return float(attr.get(key) or attr.get('fontsize') or 14.0)
+    except ValueError:
+        return 14.0
+
+
+def _dot_attrs(attr):
+    """Return the DOT attribute list of the pygraphviz ``attr`` items that are set."""
+    items = []
+    for key, value in attr.items():
+        if value == '':
+            continue
+        if key in ('label', 'xlabel', 'headlabel', 'taillabel') and value.startswith('<') and value.endswith('>'):
+            # pygraphviz hands HTML-like labels back without their outer brackets
+            items.append('{k}=<{v}>'.format(k=key, v=value))
+        else:
+            items.append('{k}={v}'.format(k=dotwriter.quote(key), v=dotwriter.quote(value)))
+    return '[{items}]'.format(items=', '.join(items)) if items else ''
+
+
+def _clusters(g):
+    """Yield every cluster subgraph of ``g``, parents before their children."""
+    for sub in g.subgraphs():
+        if (sub.name or '').startswith('cluster'):
+            yield sub
+        for child in _clusters(sub):
+            yield child
+
+
+def tile_scene(positioned):
+    """Return the positioned graph split into separately placeable DOT statements.
+
+    Args:
+        positioned (str): Positioned DOT text (``render.compute_layout``).
+
+    Returns:
+        Munch: ``bb``; ``head``, the graph statement opening every tile;
+        per element (clusters, then nodes, then edges) its DOT ``statements``
+        and bounding ``boxes`` (an ``(n, 4)`` array in points); ``ends``, the
+        node element indices each edge element needs.
+    """
+    g = pgv.AGraph(string=positioned)
+    bb = tuple(float(c) for c in g.graph_attr['bb'].split(','))
+
+    statements = []
+    boxes = []
+    ends = {}
+
+    # Nested clusters become siblings: each is drawn from its own bb, parents first
+    for sub in _clusters(g):
+        statements.append('\tsubgraph {name} {{ graph {attrs}; }}\n'.format(
+            name=dotwriter.quote(sub.name), attrs=_dot_attrs(sub.graph_attr)))
+        corners = _points(sub.graph_attr.get('bb'))
+        boxes.append((corners[:, 0].min(), corners[:, 1].min(), corners[:, 0].max(), corners[:, 1].max())
+                     if len(corners) else None)
+
+    node_ids = {}
+    for name in g.nodes():
+        n = g.get_node(name)
+        node_ids[name] = len(statements)
+        statements.append('\t{name} {attrs};\n'.format(name=dotwriter.quote(name), attrs=_dot_attrs(n.attr)))
+        centre = _points(n.attr.get('pos'))
+        box = None
+        if len(centre):
+            x, y = centre[0]
+            half_width = float(n.attr.get('width') or 0.75) * 36.0
+            half_height = float(n.attr.get('height') or 0.5) * 36.0
+            box = (x - half_width, y - half_height, x + half_width, y + half_height)
+        boxes.append(_union([box, _label_box(n.attr.get('xlp'), n.attr.get('xlabel'), _fontsize(n.attr))]))
+
+    op = '->' if g.is_directed() else '--'
+    for u, v, key in g.edges(keys=True):
+        e = g.get_edge(u, v, key)
+        ends[len(statements)] = (node_ids[u], node_ids[v])
+        statements.append('\t{u} {op} {v} {attrs};\n'.format(u=dotwriter.quote(u), op=op, v=dotwriter.quote(v),
+                                                             attrs=_dot_attrs(e.attr)))
+        points = _points(e.attr.get('pos'))
+        parts = [(points[:, 0].min(), points[:, 1].min(), points[:, 0].max(), points[:, 1].max())
+                 if len(points) else None]
+        for lp, text in EDGE_LABELS:
+            fontsize = _fontsize(e.attr, key='labelfontsize' if lp in ('head_lp', 'tail_lp') else 'fontsize')
+            parts.append(_label_box(e.attr.get(lp), e.attr.get(text), fontsize))
+        boxes.append(_union(parts))
+
+    # Elements without coordinates are put in every tile
+    llx, lly, urx, ury = bb
+    boxes = np.array([b if b is not None else (llx, lly, urx, ury) for b in boxes], dtype=float).reshape(-1, 4)
+    boxes[:, :2] -= ELEMENT_MARGIN
+    boxes[:, 2:] += ELEMENT_MARGIN
+
+    graph_kind = 'digraph' if g.is_directed() else 'graph'
+    head = ['{strict}{kind} {{\n'.format(strict='strict ' if g.is_strict() else '', kind=graph_kind)]
+    for kind, attr in (('graph', g.graph_attr), ('node', g.node_attr), ('edge', g.edge_attr)):
+        attrs = _dot_attrs(attr)
+        if attrs:
+            head.append('\t{kind} {attrs};\n'.format(kind=kind, attrs=attrs))
+
+    return Munch(bb=bb, head=''.join(head), statements=statements, boxes=boxes, ends=ends)
+
+
+def level_buckets(scene, level_jobs, tile_size):
+    """Return the indices of the ``scene`` elements each tile of one level shows.
+
+    Args:
+        scene (Munch): From ``tile_scene``.
+        level_jobs (list): The ``tile_jobs`` jobs of a single level.
+        tile_size (int): Tile edge in pixels.
+
+    Returns:
+        dict: ``(column, row)`` to a sorted list of element indices, edge
+        end nodes included.
+    """
+    llx, lly, urx, ury = scene.bb
+    zoom = level_jobs[0][5]
+    columns = max(job[1] for job in level_jobs) + 1
+    rows = max(job[2] for job in level_jobs) + 1
+    pad = TILE_MARGIN / zoom
+
+    boxes = scene.boxes
+    c0 = np.clip(np.floor(((boxes[:, 0] - pad) - llx) * zoom / tile_size), 0, columns - 1).astype(int)
+    c1 = np.clip(np.floor(((boxes[:, 2] + pad) - llx) * zoom / tile_size), 0, columns - 1).astype(int)
+    r0 = np.clip(np.floor((ury - (boxes[:, 3] + pad)) * zoom / tile_size), 0, rows - 1).astype(int)
+    r1 = np.clip(np.floor((ury - (boxes[:, 1] - pad)) * zoom / tile_size), 0, rows - 1).astype(int)
+
+    buckets = {}
+    for i in range(len(boxes)):
+        needed = (i,) + scene.ends.get(i, ())
+        for column in range(c0[i], c1[i] + 1):
+            for row in range(r0[i], r1[i] + 1):
+                buckets.setdefault((column, row), set()).update(needed)
+
+    return {key: sorted(ids) for key, ids in buckets.items()}
+
+
+def tile_source(scene, ids):
+    """Return the DOT text of a tile showing the ``scene`` elements ``ids``."""
+    return ''.join([scene.head] + [scene.statements[i] for i in ids] + ['}\n'])
+
+
+def _render_tile(source, files_dir, job, deadline=None):
+    level, column, row, tile_width, tile_height, zoom, x, y = job
+    out = files_dir / str(level) / '{column}_{row}.png'.format(column=column, row=row)
+    viewport = '-Gviewport={w},{h},{z:.6f},{x:.2f},{y:.2f}'.format(w=tile_width, h=tile_height, z=zoom, x=x, y=y)
+    args = list(render.POSITIONED_ARGS) + list(TILE_ARGS) + [viewport]
+    render.run_graphviz(source=source, prog='neato', fmt='png', args=args, output=str(out),
+                        timeout=render.time_left(deadline))
+    return out
+
+
+def render_tiles(positioned, directory, name, tile_size=256, scale=1.0, jobs=None, timeout=None):
+    """Render ``positioned`` into ``<name>.dzi`` and ``<name>_files/`` inside ``directory``.
+
+    Args:
+        positioned (str): Positioned DOT text (``render.compute_layout``).
+        directory (Path): Output directory.
+        name (str): Base name of the outputs.
+        tile_size (int): Tile edge in pixels.
+        scale (float): Pixels per point at the deepest level.
+        jobs (int): Number of tiles rendered at the same time.
+        timeout (float): Seconds all tiles together may take.
+
+    Returns:
+        Path: The ``.dzi`` descriptor.
+
+    Raises:
+        subprocess.TimeoutExpired: if the tiles are not done in time.
+    """
+    deadline = None if timeout is None else time.monotonic() + timeout
+    directory = Path(directory)
+    files_dir = directory / '{name}_files'.format(name=name)
+
+    scene = tile_scene(positioned)
+    (width, height), tile_list = tile_jobs(bb=scene.bb, tile_size=tile_size, scale=scale)
+
+    levels = {}
+    for job in tile_list:
+        levels.setdefault(job[0], []).append(job)
+
+    log.info("Rendering {n} tiles for a {w}x{h} image.".format(n=len(tile_list), w=width, h=height))
+    with ThreadPoolExecutor(max_workers=jobs) as pool:
+        for level, level_jobs in sorted(levels.items()):
+            (files_dir / str(level)).mkdir(parents=True, exist_ok=True)
+            buckets = level_buckets(scene=scene, level_jobs=level_jobs, tile_size=tile_size)
+            sources = [tile_source(scene=scene, ids=buckets.get((job[1], job[2]), [])) for job in level_jobs]
+            list(pool.map(lambda item: _render_tile(source=item[0], files_dir=files_dir, job=item[1],
+                                                    deadline=deadline),
+                          zip(sources, level_jobs)))
+
+    dzi_path = directory / '{name}.dzi'.format(name=name)
+    render.save_text(text=DZI_TEMPLATE.format(tile_size=tile_size, width=width, height=height), path=dzi_path)
+    return dzi_path
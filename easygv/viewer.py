@@ -0,0 +1,449 @@
+# -*- coding: utf-8 -*-
+"""Write a positioned graph as a self-contained interactive HTML viewer.
+
+Browsers slow down on SVG files with hundreds of thousands of elements
+because every element becomes a DOM node.  The viewer instead embeds the
+layout as one compact JSON index (``geometry_index``: flat coordinate
+arrays, palette indices for colors) that the page loads into typed arrays
+and buckets into a uniform grid.  Each frame draws onto a canvas only the
+nodes, edges and clusters whose grid cells intersect the viewport, and
+skips labels and details that would be too small to see.  Nodes can be
+found by name or label, and clicking one highlights it with its neighbors.
+"""
+import html
+import json
+import re
+from string import Template
+
+from logzero import logger as log
+
+import numpy as np
+
+import pygraphviz as pgv
+
+
+# Shapes drawn as rectangles; every other shape is drawn as an ellipse.
+BOX_SHAPES = set(['box', 'rect', 'rectangle', 'square', 'plaintext', 'plain', 'none', 'note', 'tab', 'folder',
+                  'box3d', 'component', 'cylinder', 'underline', 'record', 'Mrecord'])
+POINTS_PER_INCH = 72.0
+# Digits kept for coordinates; a tenth of a point is far below a pixel at any useful zoom.
+PRECISION = 1
+
+_NUMBER = re.compile(r'-?[0-9.]+(?:e-?[0-9]+)?')
+
+VIEWER_TEMPLATE = Template("""<!DOCTYPE html>
+<html>
+<head>
+<meta charset="utf-8">
+<title>$title</title>
+<style>
+html, body { margin: 0; height: 100%; overflow: hidden; font-family: sans-serif; }
+#view { display: block; width: 100%; height: 100%; cursor: grab; background: #fff; }
+#bar { position: absolute; top: 8px; left: 8px; padding: 6px; background: rgba(255,255,255,0.9);
+       border: 1px solid #ccc; border-radius: 4px; font-size: 13px; }
+#bar input { width: 16em; }
+#info { margin-top: 4px; max-width: 32em; white-space: pre-wrap; }
+</style>
+</head>
+<body>
+<canvas id="view"></canvas>
+<div id="bar">
+<input id="search" type="search" placeholder="Find a node (Enter for next match)">
+<span id="count"></span>
+<div id="info"></div>
+</div>
+<script id="easygv-data" type="application/json">$index</script>
+<script>
+(function () {
+  "use strict";
+  var D = JSON.parse(document.getElementById("easygv-data").textContent);
+  var N = D.names.length, E = D.edges.length / 2, C = D.clabels.length;
+  var W = Math.max(D.bb[0], 1), H = Math.max(D.bb[1], 1);
+  var nodes = Float32Array.from(D.nodes), pts = Float32Array.from(D.points);
+  var off = Uint32Array.from(D.offsets), clusters = Float32Array.from(D.clusters);
+  var eu = new Uint32Array(E), ev = new Uint32Array(E), ebox = new Float32Array(4 * E);
+  var i, j, k;
+
+  // Adjacency: the ids of the edges of each node, in CSR form.
+  var start = new Uint32Array(N + 1);
+  for (i = 0; i < E; i++) {
+    eu[i] = D.edges[2 * i]; ev[i] = D.edges[2 * i + 1];
+    start[eu[i] + 1]++; start[ev[i] + 1]++;
+  }
+  for (i = 0; i < N; i++) start[i + 1] += start[i];
+  var adj = new Uint32Array(2 * E), fill = start.slice(0, N);
+  for (i = 0; i < E; i++) { adj[fill[eu[i]]++] = i; adj[fill[ev[i]]++] = i; }
+
+  // Spatial index: every element is listed in the grid cells its bounding box covers.
+  var G = Math.max(1, Math.ceil(Math.sqrt((N + E) / 8))), cw = W / G, ch = H / G;
+  var nodeCells = new Array(G * G), edgeCells = new Array(G * G), longEdges = [];
+  for (i = 0; i < G * G; i++) { nodeCells[i] = []; edgeCells[i] = []; }
+  function cellOf(v, size) { return Math.min(G - 1, Math.max(0, Math.floor(v / size))); }
+  function cover(x0, y0, x1, y1, cells, id, limit) {
+    var cx0 = cellOf(x0, cw), cx1 = cellOf(x1, cw), cy0 = cellOf(y0, ch), cy1 = cellOf(y1, ch);
+    if ((cx1 - cx0 + 1) * (cy1 - cy0 + 1) > limit) return false;
+    for (var cy = cy0; cy <= cy1; cy++) for (var cx = cx0; cx <= cx1; cx++) cells[cy * G + cx].push(id);
+    return true;
+  }
+  for (i = 0; i < N; i++) {
+    var x = nodes[4 * i], y = nodes[4 * i + 1], hw = nodes[4 * i + 2] / 2, hh = nodes[4 * i + 3] / 2;
+    cover(x - hw, y - hh, x + hw, y + hh, nodeCells, i, Infinity);
+  }
+  for (i = 0; i < E; i++) {
+    var bx0 = Infinity, by0 = Infinity, bx1 = -Infinity, by1 = -Infinity;
+    for (j = off[i]; j < off[i + 1]; j++) {
+      bx0 = Math.min(bx0, pts[2 * j]); bx1 = Math.max(bx1, pts[2 * j]);
+      by0 = Math.min(by0, pts[2 * j + 1]); by1 = Math.max(by1, pts[2 * j + 1]);
+    }
+    ebox[4 * i] = bx0; ebox[4 * i + 1] = by0; ebox[4 * i + 2] = bx1; ebox[4 * i + 3] = by1;
+    if (off[i + 1] > off[i] && !cover(bx0, by0, bx1, by1, edgeCells, i, 64)) longEdges.push(i);
+  }
+
+  var canvas = document.getElementById("view"), ctx = canvas.getContext("2d");
+  var scale = 1, ox = 0, oy = 0, cssW = 0, cssH = 0, dpr = 1, pending = false;
+  var stamp = 0, seen = new Uint32Array(Math.max(N, E));
+  var selected = -1, near = new Uint8Array(N), nearEdge = new Uint8Array(E);
+
+  function resize() {
+    dpr = window.devicePixelRatio || 1;
+    cssW = canvas.clientWidth; cssH = canvas.clientHeight;
+    canvas.width = Math.round(cssW * dpr); canvas.height = Math.round(cssH * dpr);
+    redraw();
+  }
+  function fit() {
+    scale = Math.min(cssW / W, cssH / H) * 0.95;
+    ox = (cssW - W * scale) / 2; oy = (cssH - H * scale) / 2;
+    redraw();
+  }
+  function redraw() {
+    if (!pending) { pending = true; window.requestAnimationFrame(draw); }
+  }
+
+  function visible(cells, x0, y0, x1, y1, box, extra) {
+    var cx0 = cellOf(x0, cw), cx1 = cellOf(x1, cw), cy0 = cellOf(y0, ch), cy1 = cellOf(y1, ch), out = [];
+    stamp++;
+    function take(id) {
+      if (seen[id] === stamp) return;
+      seen[id] = stamp;
+      if (box(id, x0, y0, x1, y1)) out.push(id);
+    }
+    for (var cy = cy0; cy <= cy1; cy++) for (var cx = cx0; cx <= cx1; cx++) cells[cy * G + cx].forEach(take);
+    (extra || []).forEach(take);
+    return out;
+  }
+  function nodeInView(id, x0, y0, x1, y1) {
+    var hw = nodes[4 * id + 2] / 2, hh = nodes[4 * id + 3] / 2;
+    return nodes[4 * id] + hw >= x0 && nodes[4 * id] - hw <= x1 && nodes[4 * id + 1] + hh >= y0 && nodes[4 * id + 1] - hh <= y1;
+  }
+  function edgeInView(id, x0, y0, x1, y1) {
+    return ebox[4 * id + 2] >= x0 && ebox[4 * id] <= x1 && ebox[4 * id + 3] >= y0 && ebox[4 * id + 1] <= y1;
+  }
+
+  function edgePath(id) {
+    var a = off[id], b = off[id + 1], n = b - a, m;
+    ctx.moveTo(pts[2 * a], pts[2 * a + 1]);
+    for (m = 1; m + 2 < n; m += 3) {
+      k = 2 * (a + m);
+      ctx.bezierCurveTo(pts[k], pts[k + 1], pts[k + 2], pts[k + 3], pts[k + 4], pts[k + 5]);
+    }
+    for (; m < n; m++) ctx.lineTo(pts[2 * (a + m)], pts[2 * (a + m) + 1]);
+  }
+  function arrowHead(id) {
+    var b = off[id + 1] - 1, tx = pts[2 * b], ty = pts[2 * b + 1], bx = pts[2 * b - 2], by = pts[2 * b - 1];
+    var dx = tx - bx, dy = ty - by;
+    ctx.moveTo(tx, ty);
+    ctx.lineTo(bx - dy / 3, by + dx / 3);
+    ctx.lineTo(bx + dy / 3, by - dx / 3);
+    ctx.closePath();
+  }
+  function color(index, fallback) { return index < 0 ? fallback : D.palette[index]; }
+
+  function drawEdges(ids, highlight) {
+    var groups = {};
+    ids.forEach(function (id) {
+      if (selected >= 0 && !!nearEdge[id] !== highlight) return;
+      // edges shorter than a pixel would only smear the nodes they join
+      if (!highlight && (ebox[4 * id + 2] - ebox[4 * id] + ebox[4 * id + 3] - ebox[4 * id + 1]) * scale < 1) return;
+      var c = highlight ? "#E6550D" : color(D.ecolor[id], "#000");
+      (groups[c] = groups[c] || []).push(id);
+    });
+    ctx.lineWidth = (highlight ? 2.5 : 1) / scale;
+    Object.keys(groups).forEach(function (c) {
+      ctx.strokeStyle = c; ctx.fillStyle = c;
+      ctx.beginPath(); groups[c].forEach(edgePath); ctx.stroke();
+      if (scale > 0.3) {
+        ctx.beginPath();
+        groups[c].forEach(function (id) { if (D.tips[id] && off[id + 1] - off[id] > 1) arrowHead(id); });
+        ctx.fill();
+      }
+    });
+  }
+
+  function drawNodes(ids, highlight) {
+    var labels = scale * 10 >= 6;
+    ctx.lineWidth = (highlight ? 2.5 : 1) / scale;
+    ids.forEach(function (id) {
+      if (selected >= 0 && !!near[id] !== highlight) return;
+      var x = nodes[4 * id], y = nodes[4 * id + 1], w = nodes[4 * id + 2], h = nodes[4 * id + 3];
+      if (w * scale < 2 && h * scale < 2) {
+        ctx.fillStyle = color(D.fill[id], color(D.stroke[id], "#000"));
+        ctx.fillRect(x - 1 / scale, y - 1 / scale, 2 / scale, 2 / scale);
+        return;
+      }
+      ctx.beginPath();
+      if (D.shapes[id]) ctx.rect(x - w / 2, y - h / 2, w, h);
+      else ctx.ellipse(x, y, w / 2, h / 2, 0, 0, 2 * Math.PI);
+      if (D.fill[id] >= 0) { ctx.fillStyle = D.palette[D.fill[id]]; ctx.fill(); }
+      ctx.strokeStyle = id === selected ? "#E6550D" : color(D.stroke[id], "#000");
+      if (D.stroke[id] >= 0 || id === selected || D.fill[id] < 0) ctx.stroke();
+      if (labels) {
+        var text = D.labels[id] === null ? D.names[id] : D.labels[id];
+        var size = Math.min(14, h * 0.6);
+        if (size * scale >= 6) {
+          ctx.fillStyle = color(D.fontcolor[id], "#000");
+          ctx.font = size + "px sans-serif";
+          ctx.fillText(text, x, y, w * 0.95);
+        }
+      }
+    });
+  }
+
+  function draw() {
+    pending = false;
+    ctx.setTransform(dpr, 0, 0, dpr, 0, 0);
+    ctx.clearRect(0, 0, cssW, cssH);
+    ctx.translate(ox, oy); ctx.scale(scale, scale);
+    ctx.textAlign = "center"; ctx.textBaseline = "middle";
+    var x0 = -ox / scale, y0 = -oy / scale, x1 = (cssW - ox) / scale, y1 = (cssH - oy) / scale;
+
+    ctx.lineWidth = 1 / scale; ctx.strokeStyle = "#999"; ctx.fillStyle = "#555";
+    for (i = 0; i < C; i++) {
+      var c = clusters.subarray(4 * i, 4 * i + 4);
+      if (c[2] < x0 || c[0] > x1 || c[3] < y0 || c[1] > y1) continue;
+      ctx.strokeRect(c[0], c[1], c[2] - c[0], c[3] - c[1]);
+      if (scale * 14 >= 6) { ctx.font = "14px sans-serif"; ctx.fillText(D.clabels[i], (c[0] + c[2]) / 2, c[1] + 12); }
+    }
+
+    var edgeIds = visible(edgeCells, x0, y0, x1, y1, edgeInView, longEdges);
+    var nodeIds = visible(nodeCells, x0, y0, x1, y1, nodeInView);
+    ctx.globalAlpha = selected >= 0 ? 0.15 : 1;
+    drawEdges(edgeIds, false); drawNodes(nodeIds, false);
+    if (selected >= 0) {
+      ctx.globalAlpha = 1;
+      drawEdges(edgeIds, true); drawNodes(nodeIds, true);
+    }
+  }
+
+  function select(id) {
+    near.fill(0); nearEdge.fill(0);
+    selected = id;
+    var info = "";
+    if (id >= 0) {
+      near[id] = 1;
+      var names = [];
+      for (j = start[id]; j < start[id + 1]; j++) {
+        var e = adj[j], other = eu[e] === id ? ev[e] : eu[e];
+        nearEdge[e] = 1;
+        if (!near[other]) { near[other] = 1; names.push(D.names[other]); }
+      }
+      info = D.names[id] + (D.labels[id] === null ? "" : " (" + D.labels[id] + ")") + "\\n" +
+        names.length + " neighbors: " + names.slice(0, 30).join(", ") + (names.length > 30 ? ", ..." : "");
+    }
+    document.getElementById("info").textContent = info;
+    redraw();
+  }
+  function pick(sx, sy) {
+    var x = (sx - ox) / scale, y = (sy - oy) / scale, best = -1;
+    nodeCells[cellOf(y, ch) * G + cellOf(x, cw)].forEach(function (id) {
+      if (Math.abs(nodes[4 * id] - x) <= nodes[4 * id + 2] / 2 && Math.abs(nodes[4 * id + 1] - y) <= nodes[4 * id + 3] / 2) best = id;
+    });
+    return best;
+  }
+  function show(id) {
+    var h = Math.max(nodes[4 * id + 3], 1);
+    scale = Math.max(scale, 40 / h);
+    ox = cssW / 2 - nodes[4 * id] * scale; oy = cssH / 2 - nodes[4 * id + 1] * scale;
+    select(id);
+  }
+
+  var drag = null;
+  canvas.addEventListener("pointerdown", function (ev) {
+    drag = { x: ev.clientX, y: ev.clientY, ox: ox, oy: oy, moved: false };
+    canvas.setPointerCapture(ev.pointerId);
+  });
+  canvas.addEventListener("pointermove", function (ev) {
+    if (!drag) return;
+    var dx = ev.clientX - drag.x, dy = ev.clientY - drag.y;
+    if (Math.abs(dx) + Math.abs(dy) > 3) drag.moved = true;
+    ox = drag.ox + dx; oy = drag.oy + dy;
+    redraw();
+  });
+  canvas.addEventListener("pointerup", function (ev) {
+    if (drag && !drag.moved) {
+      var r = canvas.getBoundingClientRect();
+      select(pick(ev.clientX - r.left, ev.clientY - r.top));
+    }
+    drag = null;
+  });
+  canvas.addEventListener("wheel", function (ev) {
+    ev.preventDefault();
+    var r = canvas.getBoundingClientRect(), sx = ev.clientX - r.left, sy = ev.clientY - r.top;
+    var factor = Math.exp(-ev.deltaY * 0.0015);
+    ox = sx - (sx - ox) * factor; oy = sy - (sy - oy) * factor; scale *= factor;
+    redraw();
+  }, { passive: false });
+  canvas.addEventListener("dblclick", fit);
+
+  var search = document.getElementById("search"), matches = [], current = -1;
+  search.addEventListener("input", function () {
+    var q = search.value.toLowerCase();
+    matches = []; current = -1;
+    if (q) {
+      for (i = 0; i < N && matches.length < 1000; i++) {
+        var label = D.labels[i] === null ? "" : String(D.labels[i]).toLowerCase();
+        if (String(D.names[i]).toLowerCase().indexOf(q) >= 0 || label.indexOf(q) >= 0) matches.push(i);
+      }
+    }
+    document.getElementById("count").textContent = q ? matches.length + (matches.length === 1000 ? "+" : "") + " found" : "";
+  });
+  search.addEventListener("keydown", function (ev) {
+    if (ev.key !== "Enter" || !matches.length) return;
+    current = (current + 1) % matches.length;
+    show(matches[current]);
+    document.getElementById("count").textContent = (current + 1) + " of " + matches.length;
+  });
+
+  window.addEventListener("resize", resize);
+  resize(); fit();
+})();
+</script>
+</body>
+</html>
+""")
+
+
+def _numbers(value):
+    return [float(v) for v in _NUMBER.findall(value or '')]
+
+
+def _color(value, palette):
+    """Return the palette index of the graphviz color ``value``, or ``-1`` for none."""
+    value = (value or '').split(':')[0].split(';')[0]
+    if not value or value in ('none', 'transparent', 'invis'):
+        return -1
+    return palette.setdefault(value, len(palette))
+
+
+def _subgraphs(g):
+    for sub in g.subgraphs():
+        yield sub
+        yield from _subgraphs(sub)
+
+
+def spline_points(pos):
+    """Return the points of the edge ``pos`` attribute and whether it ends in an arrow tip.
+
+    Graphviz writes ``[s,x,y] [e,x,y] x1,y1 x2,y2 ...`` for a cubic B-spline;
+    the end point (if any) is appended after the spline so that the viewer
+    can draw the arrowhead towards it.
+    """
+    points = []
+    tip = None
+    for spline in (pos or '').split(';')[:1]:
+        for token in spline.split():
+            if token.startswith('e,'):
+                tip = _numbers(token[2:])[:2]
+            elif not token.startswith('s,'):
+                points.append(_numbers(token)[:2])
+    if tip is not None and len(tip) == 2:
+        points.append(tip)
+    return points, tip is not None
+
+
+def geometry_index(positioned):
+    """Return the compact geometry index of the positioned DOT text ``positioned``.
+
+    Coordinates are in points with the origin in the top left corner.
+
+    Returns:
+        dict: ``bb`` (width, height); per node ``names``, ``labels`` (`None`
+        when equal to the name), ``nodes`` (flat ``x, y, width, height``),
+        ``shapes`` (1 for boxes), ``fill``/``stroke``/``fontcolor`` palette
+        indices; per edge ``edges`` (flat node index pairs), ``ecolor``,
+        ``tips`` and ``offsets`` into the flat ``points``; per cluster
+        ``clusters`` (flat ``x0, y0, x1, y1``) and ``clabels``; and the
+        ``palette`` of colors.
+    """
+    g = pgv.AGraph(string=positioned)
+    llx, lly, urx, ury = _numbers(g.graph_attr['bb'])
+    palette = {}
+
+    names = [str(n) for n in g.nodes()]
+    ids = {name: i for i, name in enumerate(names)}
+    labels, shapes, fill, stroke, fontcolor = [], [], [], [], []
+    nodes = np.zeros((len(names), 4))
+
+    for i, name in enumerate(names):
+        attr = g.get_node(name).attr
+        x, y = _numbers(attr.get('pos'))[:2] or (0.0, 0.0)
+        nodes[i] = (x, y, float(attr.get('width') or 0.75), float(attr.get('height') or 0.5))
+
+        label = attr.get('label') or '\\N'
+        labels.append(None if label in ('\\N', name) else label.replace('\\N', name))
+        shapes.append(1 if attr.get('shape') in BOX_SHAPES else 0)
+        style = attr.get('style') or ''
+        fill.append(_color(attr.get('fillcolor') or attr.get('color'), palette) if 'filled' in style else -1)
+        stroke.append(_color(attr.get('color') or 'black', palette))
+        fontcolor.append(_color(attr.get('fontcolor'), palette))
+
+    nodes[:, 0] -= llx
+    nodes[:, 1] = ury - nodes[:, 1]
+    nodes[:, 2:] *= POINTS_PER_INCH
+
+    edges, ecolor, tips, offsets, points = [], [], [], [0], []
+    # Each Edge carries its own handle; looking parallel edges up by (u, v) would find the first every time
+    for edge in g.edges():
+        u, v = edge
+        attr = edge.attr
+        edge_points, tip = spline_points(attr.get('pos'))
+        edges.extend((ids[str(u)], ids[str(v)]))
+        ecolor.append(_color(attr.get('color'), palette))
+        tips.append(int(tip))
+        points.extend(edge_points)
+        offsets.append(len(points))
+
+    points = np.array(points, dtype=float).reshape(-1, 2)
+    points[:, 0] -= llx
+    points[:, 1] = ury - points[:, 1]
+
+    clusters, clabels = [], []
+    for sub in _subgraphs(g):
+        bb = _numbers(sub.graph_attr.get('bb'))
+        if sub.name and sub.name.startswith('cluster') and len(bb) == 4:
+            clusters.append((bb[0] - llx, ury - bb[3], bb[2] - llx, ury - bb[1]))
+            clabels.append(sub.graph_attr.get('label') or '')
+
+    return dict(bb=[round(urx - llx, PRECISION), round(ury - lly, PRECISION)],
+                names=names, labels=labels,
+                nodes=nodes.round(PRECISION).ravel().tolist(), shapes=shapes,
+                fill=fill, stroke=stroke, fontcolor=fontcolor,
+                edges=edges, ecolor=ecolor, tips=tips, offsets=offsets,
+                points=points.round(PRECISION).ravel().tolist(),
+                clusters=np.array(clusters, dtype=float).round(PRECISION).ravel().tolist(), clabels=clabels,
+                palette=sorted(palette, key=palette.get))
+
+
+def viewer_html(index, title='easygv'):
+    """Return the viewer page for the geometry ``index``."""
+    data = json.dumps(index, separators=(',', ':')).replace('</', '<\\/')
+    return VIEWER_TEMPLATE.substitute(title=html.escape(title), index=data)
+
+
+def render_html(positioned, path, title='easygv'):
+    """Write the viewer for the positioned DOT text ``positioned`` to ``path`` and return ``path``."""
+    index = geometry_index(positioned)
+    log.info("Writing a viewer for {n} nodes and {e} edges.".format(n=len(index['names']),
+                                                                    e=len(index['edges']) // 2))
+    with open(str(path), mode='w', encoding='utf-8') as out:
+        out.write(viewer_html(index=index, title=title))
+    return path
@@ -70,7 +70,7 @@ setup(
     packages=find_packages(include=['easygv']),
     entry_points={
         'console_scripts': [
-            'easygv=easygv.cli:main'
+            'easygv=easygv.daemon:entry'
         ]
     },
     include_package_data=True,
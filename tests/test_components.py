@@ -0,0 +1,80 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.components` module."""
+import shutil
+
+import numpy as np
+import pandas as pd
+
+import pytest
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import components
+
+
+needs_graphviz = pytest.mark.skipif(shutil.which("dot") is None, reason="graphviz programs not installed")
+
+
+def forest_input():
+    """Return three components; ``c`` and ``e`` are only joined by a cluster."""
+    nodes = pd.DataFrame({"name": list("abcdef"),
+                          "label": list("ABCDEF"),
+                          "node_class": "",
+                          "cluster_name": ["cluster_", "cluster_", "cluster_k", "cluster_", "cluster_k", "cluster_"]})
+    edges = pd.DataFrame({"u_name": ["a", "c", "e"],
+                          "v_name": ["b", "d", "f"],
+                          "label": "",
+                          "edge_class": ""})
+    clusters = pd.DataFrame({"name": ["cluster_k"], "label": ["K"], "cluster_class": ""})
+    return Munch(Nodes=nodes, Edges=edges, Clusters=clusters)
+
+
+def test_component_labels():
+    """Test the vectorized union-find."""
+    u = np.array([0, 2, 3, 6])
+    v = np.array([1, 3, 4, 2])
+    labels = components.component_labels(n=7, u=u, v=v)
+    assert labels.tolist() == [0, 0, 1, 1, 1, 2, 1]
+
+
+def test_split_components_keeps_clusters_whole():
+    """Test that clusters join components and batches balance node counts."""
+    parts = components.split_components(forest_input(), batches=4)
+
+    assert len(parts) == 2
+    assert sorted(parts[0].Nodes["name"]) == ["c", "d", "e", "f"]
+    assert sorted(parts[1].Nodes["name"]) == ["a", "b"]
+    assert parts[0].Clusters["name"].tolist() == ["cluster_k"]
+    assert len(parts[1].Clusters) == 0
+
+
+def test_shift_pos():
+    """Test moving points, splines and pinned positions."""
+    assert components.shift_pos("1,2!", 1, 1) == "2.00,3.00!"
+    assert components.shift_pos("e,1,2 0,0 3,4", 10, 0) == "e,11.00,2.00 10.00,0.00 13.00,4.00"
+
+
+def test_pack():
+    """Test that packed components do not overlap."""
+    layout = 'digraph {{ graph [bb="0,0,100,50"]; {n} [pos="50,25", width=1, height=0.5]; }}'
+    packed = pgv.AGraph(string=components.pack([layout.format(n="a"), layout.format(n="b")]))
+
+    xa, ya = [float(c) for c in packed.get_node("a").attr["pos"].split(",")]
+    xb, yb = [float(c) for c in packed.get_node("b").attr["pos"].split(",")]
+    assert abs(xa - xb) >= 100 or abs(ya - yb) >= 50
+    assert packed.graph_attr["bb"].startswith("0,0,")
+
+
+@needs_graphviz
+def test_layout_by_component():
+    """Test the full parallel layout and pack."""
+    attrs = Munch(graph=Munch(label="all"), nodes=Munch(BASE=Munch()), edges=Munch(BASE=Munch()))
+    positioned = components.layout_by_component(forest_input(), attrs, jobs=2)
+    g = pgv.AGraph(string=positioned)
+
+    assert sorted(g.nodes()) == list("abcdef")
+    assert all(g.get_node(n).attr["pos"] for n in g.nodes())
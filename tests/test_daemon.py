@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.daemon` module."""
+import threading
+import time
+
+from easygv import daemon
+
+
+def test_command_name():
+    """Test finding the subcommand behind the global options."""
+    assert daemon.command_name(["-v", "debug", "draw", "a.xlsx"]) == "draw"
+    assert daemon.command_name(["--help"]) is None
+
+
+def test_stamp_cached(tmpdir):
+    """Test that results are reused until the file changes."""
+    path = tmpdir.join("conf.yaml")
+    path.write("a")
+    calls = []
+
+    def load(path):
+        calls.append(path)
+        return [len(calls)]
+
+    cached = daemon.stamp_cached(load, copy=list)
+    assert cached(str(path)) == [1]
+    assert cached(str(path)) == [1]
+
+    path.write("changed")
+    assert cached(str(path)) == [2]
+    assert len(cached.cache) == 1
+
+
+def test_serve_runs_commands(tmpdir):
+    """Test a round trip through the socket."""
+    path = tmpdir.join("d.sock")
+    server = threading.Thread(target=daemon.serve, kwargs={"path": str(path)})
+    server.start()
+    try:
+        for _ in range(100):
+            if daemon.is_ready(path=str(path)):
+                break
+            time.sleep(0.05)
+
+        answers = list(daemon.request({"argv": ["config", "--help"], "cwd": str(tmpdir)}, path=str(path)))
+        text = "".join(a.get("text", "") for a in answers)
+        assert "Manage configuration values and files." in text
+        assert answers[-1] == {"exit": 0}
+
+        # A second daemon sees the lock and leaves the running one's socket alone
+        assert daemon.is_running(path=str(path))
+        daemon.serve(path=str(path))
+        assert daemon.is_ready(path=str(path))
+    finally:
+        daemon.stop(path=str(path))
+        server.join(timeout=10)
+
+    assert not path.exists()
+    assert not daemon.is_running(path=str(path))
+
+
+def test_socket_is_private(tmpdir, monkeypatch):
+    """Test that the default socket is in a directory only its user can enter and is not shared."""
+    monkeypatch.delenv("EASYGV_SOCKET", raising=False)
+    monkeypatch.setenv("XDG_RUNTIME_DIR", str(tmpdir))
+    path = daemon.socket_path()
+    assert path.parent == tmpdir.join("easygv")
+
+    daemon.private_directory(path.parent)
+    assert path.parent.stat().st_mode & 0o777 == 0o700
+    assert daemon.forward(["draw"], path=path) is None
@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.diff` module."""
+import pandas as pd
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import diff
+
+
+def version(nodes, edges):
+    """Return graph_input tables for ``(name, label)`` nodes and ``(u, v, label)`` edges."""
+    return Munch(Nodes=pd.DataFrame(nodes, columns=["name", "label"]).assign(node_class=""),
+                 Edges=pd.DataFrame(edges, columns=["u_name", "v_name", "label"]).assign(edge_class=""))
+
+
+OLD = version(nodes=[("a", "A"), ("b", "B"), ("c", "C")],
+              edges=[("a", "b", ""), ("b", "c", ""), ("b", "c", "")])
+NEW = version(nodes=[("a", "A"), ("b", "Bee"), ("d", "D")],
+              edges=[("a", "b", "x"), ("b", "c", ""), ("b", "d", "")])
+
+
+def test_diff_graph_input():
+    """Test additions, removals and changes, parallel edges included."""
+    merged, stats = diff.diff_graph_input(old=OLD, new=NEW)
+
+    nodes = dict(zip(merged.Nodes["name"], merged.Nodes["change"]))
+    assert nodes == {"a": "unchanged", "b": "changed", "c": "removed", "d": "added"}
+    assert merged.Nodes.set_index("name").loc["c", "label"] == "C"
+
+    edges = merged.Edges.sort_values(["u_name", "v_name"])["change"].tolist()
+    assert edges == ["changed", "unchanged", "removed", "added"]
+
+    assert stats.Nodes.changed_columns.label == 1
+    assert stats.Edges.added == 1
+
+
+def test_diff_attrs():
+    """Test that the diff rules come last."""
+    attrs = diff.diff_attrs(Munch(rules=Munch(nodes=[Munch(name="mine", priority=5)], edges=[], clusters=[])))
+    assert attrs.rules.nodes[0].name == "mine"
+    assert attrs.rules.nodes[-1].name == "diff_nodes_unchanged"
+
+
+def node_boxes(g):
+    """Return the ``(llx, lly, urx, ury)`` of every positioned node of ``g``, by name."""
+    boxes = {}
+    for name in g.nodes():
+        attr = g.get_node(name).attr
+        x, y = [float(c) for c in attr["pos"].split(",")]
+        w = float(attr.get("width") or 0.75) * 72 / 2
+        h = float(attr.get("height") or 0.5) * 72 / 2
+        boxes[name] = (x - w, y - h, x + w, y + h)
+    return boxes
+
+
+def test_seed_layout():
+    """Test that old positions are kept and new nodes placed clear of every other node."""
+    merged, _ = diff.diff_graph_input(old=OLD, new=NEW)
+    merged.Edges = pd.concat([merged.Edges, pd.DataFrame({"u_name": ["b"], "v_name": ["e"]})], ignore_index=True)
+    layout = """digraph {
+        graph [bb="0,0,100,200"];
+        a [pos="50,180", width=0.75, height=0.5];
+        b [pos="50,100", width=0.75, height=0.5];
+        c [pos="50,20", width=0.75, height=0.5];
+        a -> b [pos="e,50,118 50,162 50,150 50,140 50,118"];
+    }"""
+    source = "digraph { a; b; c; d; e [width=2]; f; a -> b; b -> c; b -> d; b -> e; }"
+    g = pgv.AGraph(string=diff.seed_layout(source=source, layout=layout, graph_input=merged))
+
+    assert g.get_node("a").attr["pos"] == "50,180"
+    assert g.get_edge("a", "b").attr["pos"].startswith("e,50,118")
+    assert not g.get_edge("b", "d").attr.get("pos")
+
+    boxes = node_boxes(g)
+    names = sorted(boxes)
+    for i, u in enumerate(names):
+        for v in names[i + 1:]:
+            (ullx, ully, uurx, uury), (vllx, vlly, vurx, vury) = boxes[u], boxes[v]
+            overlap = ullx < vurx and vllx < uurx and ully < vury and vlly < uury
+            assert not overlap, "{u} overlaps {v}".format(u=u, v=v)
+
+
+def test_seed_layout_grows_joined_cluster():
+    """Test that a cluster's box is grown around a new member."""
+    merged, _ = diff.diff_graph_input(old=OLD, new=NEW)
+    layout = """digraph {
+        graph [bb="0,0,100,200"];
+        subgraph cluster_1 { graph [bb="10,70,90,200"]; a [pos="50,180", width=0.75, height=0.5];
+                             b [pos="50,100", width=0.75, height=0.5]; }
+        c [pos="50,20", width=0.75, height=0.5];
+    }"""
+    source = "digraph { subgraph cluster_1 { a; b; d; } c; subgraph cluster_2 { c; } b -> d; }"
+    g = pgv.AGraph(string=diff.seed_layout(source=source, layout=layout, graph_input=merged))
+
+    llx, lly, urx, ury = [float(c) for c in g.get_subgraph("cluster_1").graph_attr["bb"].split(",")]
+    dllx, dlly, durx, dury = node_boxes(g)["d"]
+    assert llx <= dllx and lly <= dlly and durx <= urx and dury <= ury
+    assert ury == 200.0
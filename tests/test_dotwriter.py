@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.dotwriter` module."""
+import pandas as pd
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import dotwriter
+from easygv import easygv
+
+
+def sample_input():
+    """Return a small in-memory graph definition with one cluster."""
+    nodes = pd.DataFrame({"name": ["a", "b", "c", "node"],
+                          "label": ["Alpha", 'Say "hi"', "", "Kw"],
+                          "node_class": ["analysis", "mover", "mover", ""],
+                          "cluster_name": ["cluster_x", "cluster_x", "cluster_", "cluster_"]})
+    edges = pd.DataFrame({"u_name": ["a", "b", "c"],
+                          "v_name": ["b", "c", "node"],
+                          "label": ["uses", "", ""],
+                          "edge_class": ["flow", "flow", ""]})
+    clusters = pd.DataFrame({"name": ["cluster_x"], "label": ["X"], "cluster_class": ["group"]})
+    return Munch(Nodes=nodes, Edges=edges, Clusters=clusters)
+
+
+def sample_attrs():
+    """Return an attribute tree like the one ``process_attrs`` builds."""
+    return Munch(graph=Munch(rankdir="LR"),
+                 nodes=Munch(BASE=Munch(shape="box", fontname="Cantarell"),
+                             analysis=Munch(shape="box", fillcolor="#B83545", style="filled"),
+                             mover=Munch(shape="egg", inherits_from="analysis")),
+                 edges=Munch(BASE=Munch(color="black"),
+                             flow=Munch(style="dashed")),
+                 clusters=Munch(group=Munch(color="blue")))
+
+
+def test_quote():
+    """Test DOT ID quoting."""
+    assert dotwriter.quote("abc_1") == "abc_1"
+    assert dotwriter.quote(12) == "12"
+    assert dotwriter.quote("node") == '"node"'
+    assert dotwriter.quote("#B83545") == '"#B83545"'
+    assert dotwriter.quote('say "hi"') == '"say \\"hi\\""'
+    assert dotwriter.quote("<<b>x</b>>") == '"<<b>x</b>>"'
+    assert dotwriter.quote("<<b>x</b>>", html=True) == "<<b>x</b>>"
+
+
+def test_compact_dot_html_labels():
+    """Test that HTML-like labels stay HTML labels, as in ``build_graph``."""
+    graph_input = sample_input()
+    graph_input.Nodes.loc[2, "label"] = "<<b>C</b>>"
+    attrs = sample_attrs()
+
+    full = easygv.build_graph(graph_input=graph_input, attrs=attrs)
+    compact = dotwriter.dot_string(graph_input=graph_input, attrs=attrs)
+
+    assert "label=<<b>C</b>>" in compact
+    assert "label=<<b>C</b>>" in full.string()
+    parsed = pgv.AGraph(string=compact)
+    assert parsed.get_node("c").attr["label"] == full.get_node("c").attr["label"] == "<b>C</b>"
+
+
+def test_compact_dot_matches_build_graph():
+    """Test that the compact DOT resolves to the same attributes as ``build_graph``."""
+    graph_input = sample_input()
+    attrs = sample_attrs()
+
+    full = easygv.build_graph(graph_input=graph_input, attrs=attrs)
+    compact = dotwriter.dot_string(graph_input=graph_input, attrs=attrs)
+    parsed = pgv.AGraph(string=compact)
+
+    assert compact.count("#B83545") == 1
+    assert "inherits_from" not in compact
+    assert sorted(parsed.nodes()) == sorted(full.nodes())
+    assert sorted(parsed.edges()) == sorted(full.edges())
+
+    for name in full.nodes():
+        for key in ("shape", "fillcolor", "style", "label", "fontname"):
+            assert parsed.get_node(name).attr[key] == full.get_node(name).attr[key], (name, key)
+
+    for u, v in full.edges():
+        for key in ("style", "label"):
+            assert parsed.get_edge(u, v).attr[key] == full.get_edge(u, v).attr[key], (u, v, key)
+
+    cluster = parsed.get_subgraph("cluster_x")
+    assert sorted(cluster.nodes()) == ["a", "b"]
+    assert cluster.graph_attr["color"] == "blue"
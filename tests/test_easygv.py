@@ -2,7 +2,10 @@
 # -*- coding: utf-8 -*-
 
 """Tests for `easygv` package."""
+import os
 import re
+import sqlite3
+import sys
 
 import pytest
 
@@ -63,3 +66,71 @@ def test_nan_to_str():
     assert easygv.nan_to_str(x=int_) is int_
     assert easygv.nan_to_str(x=float_) is float_
     assert easygv.nan_to_str(x=pd) is pd
+
+
+ATTRS_YAML = """
+GRAPH:
+    rankdir: LR
+NODES:
+    BASE:
+        shape: box
+    ACTUAL: {}
+EDGES:
+    BASE:
+        color: black
+    ACTUAL: {}
+"""
+
+SLOW_PROG = """#!{python}
+import time
+time.sleep(30)
+"""
+
+
+@pytest.mark.parametrize("edges", [False, True])
+def test_draw_time_budget_exceeded(tmpdir, monkeypatch, edges):
+    """Test that a layout slower than --time-budget ends the command with an error, not a traceback."""
+    bin_dir = tmpdir.mkdir("bin")
+    for prog in ("dot", "sfdp"):
+        path = bin_dir.join(prog)
+        path.write(SLOW_PROG.format(python=sys.executable))
+        path.chmod(0o755)
+    monkeypatch.setenv("PATH", "{bin}{sep}{path}".format(bin=bin_dir, sep=os.pathsep, path=os.environ["PATH"]))
+
+    definition = tmpdir.join("graph.db")
+    connection = sqlite3.connect(str(definition))
+    connection.executescript("""
+        CREATE TABLE Nodes (name TEXT, label TEXT, node_class TEXT);
+        INSERT INTO Nodes VALUES ('a', 'A', NULL), ('b', 'B', NULL), ('c', 'C', NULL);
+        CREATE TABLE Edges (u_name TEXT, v_name TEXT, label TEXT, edge_class TEXT);
+        INSERT INTO Edges VALUES ('a', 'b', 'x', NULL), ('b', 'c', NULL, NULL);
+    """)
+    connection.commit()
+    connection.close()
+    attr_config = tmpdir.join("attrs.yaml")
+    attr_config.write(ATTRS_YAML)
+
+    args = ["draw", "-d", str(tmpdir), "-f", "svg", "--time-budget", "1", str(definition), str(attr_config)]
+    if edges:
+        tmpdir.join("edges.csv").write("u_name,v_name\na,b\nb,c\n")
+        args[1:1] = ["--edges", str(tmpdir.join("edges.csv"))]
+
+    result = CliRunner().invoke(cli.main, args)
+
+    assert result.exit_code == 1
+    assert isinstance(result.exception, SystemExit)
+    assert "within 1.0 seconds" in result.output
+
+
+def test_draw_query_needs_database(tmpdir):
+    """Test that --query and --where are refused for a workbook instead of being ignored."""
+    definition = tmpdir.join("graph.xlsx")
+    definition.write("")
+    attr_config = tmpdir.join("attrs.yaml")
+    attr_config.write(ATTRS_YAML)
+
+    result = CliRunner().invoke(cli.main, ["draw", "-d", str(tmpdir), "-w", "Edges=weight > 1",
+                                           str(definition), str(attr_config)])
+
+    assert result.exit_code == 2
+    assert "--query and --where only apply to a SQLite DEFINITION" in result.output
@@ -0,0 +1,112 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.focus` module."""
+from pathlib import Path
+
+import numpy as np
+
+import pandas as pd
+
+import pytest
+
+from munch import Munch
+
+from easygv import focus
+
+
+def chain_input():
+    """Return a definition for ``a -> b -> c -> d`` plus ``x -> c`` with two clusters."""
+    nodes = pd.DataFrame({"name": ["a", "b", "c", "d", "x"],
+                          "label": ["A", "B", "C", "D", "X"],
+                          "node_class": "",
+                          "cluster_name": ["cluster_1", "cluster_1", "cluster_2", "cluster_2", "cluster_"]})
+    edges = pd.DataFrame({"u_name": ["a", "b", "c", "x"],
+                          "v_name": ["b", "c", "d", "c"],
+                          "label": "",
+                          "edge_class": ""})
+    clusters = pd.DataFrame({"name": ["cluster_1", "cluster_2"], "label": ["1", "2"], "cluster_class": ""})
+    return Munch(Nodes=nodes, Edges=edges, Clusters=clusters)
+
+
+def test_neighborhood_directions():
+    """Test the BFS depth and direction handling."""
+    graph_input = chain_input()
+    index = focus.build_index(nodes=graph_input.Nodes, edges=graph_input.Edges)
+
+    assert sorted(focus.neighborhood(index, ["b"], depth=1)) == ["a", "b", "c"]
+    assert sorted(focus.neighborhood(index, ["b"], depth=2, direction="out")) == ["b", "c", "d"]
+    assert sorted(focus.neighborhood(index, ["c"], depth=5, direction="in")) == ["a", "b", "c", "x"]
+    assert sorted(focus.neighborhood(index, ["a", "nope"], depth=0)) == ["a"]
+
+
+def test_induced_subgraph():
+    """Test that edges and clusters follow the selected nodes."""
+    sub = focus.induced_subgraph(chain_input(), ["a", "b"])
+
+    assert sub.Nodes["name"].tolist() == ["a", "b"]
+    assert sub.Edges[["u_name", "v_name"]].values.tolist() == [["a", "b"]]
+    assert sub.Clusters["name"].tolist() == ["cluster_1"]
+
+
+@pytest.fixture(autouse=True)
+def cache_dir(tmpdir, monkeypatch):
+    """Keep the focus cache of every test in its own directory."""
+    path = tmpdir.join("cache")
+    monkeypatch.setattr(focus, "CACHE_DIR", Path(str(path)))
+    return path
+
+
+def test_cached_index(tmpdir, cache_dir):
+    """Test that the index is cached in the cache directory and invalidated on change."""
+    definition = tmpdir.join("graph.xlsx")
+    definition.write("v1")
+    graph_input = chain_input()
+    graph_input.Edges["weight"] = [1, 2.5, None, 4]
+    graph_input.Edges["note"] = ["x", 3, "", "y"]
+
+    index = focus.cached_index(definition=str(definition), graph_input=graph_input)
+    assert focus.index_path(str(definition)).parent == Path(str(cache_dir))
+    assert focus.index_path(str(definition)).exists()
+    assert tmpdir.listdir(lambda p: p.basename.startswith(".")) == []
+
+    cached = focus.cached_index(definition=str(definition), graph_input=None)
+    assert list(cached["names"]) == list(index["names"])
+    assert list(cached["out_indptr"]) == list(index["out_indptr"])
+
+    tables = focus.cached_definition(definition=str(definition))
+    pd.testing.assert_frame_equal(tables.graph_input.Edges, graph_input.Edges, check_index_type=False)
+    pd.testing.assert_frame_equal(tables.graph_input.Nodes, graph_input.Nodes, check_index_type=False)
+    assert list(tables.index["names"]) == list(index["names"])
+
+    definition.write("version 2")
+    graph_input.Edges = graph_input.Edges.iloc[:1]
+    rebuilt = focus.cached_index(definition=str(definition), graph_input=graph_input)
+    assert rebuilt["out_indices"].tolist() == [1]
+
+
+def test_cached_index_key(tmpdir):
+    """Test that tables loaded with other queries do not reuse the cache."""
+    definition = tmpdir.join("graph.db")
+    definition.write("db")
+    graph_input = chain_input()
+
+    focus.cached_index(definition=str(definition), graph_input=graph_input, key="where weight > 1")
+    assert focus.cached_definition(definition=str(definition), key="where weight > 1") is not None
+    assert focus.cached_definition(definition=str(definition), key="") is None
+
+    graph_input.Edges = graph_input.Edges.iloc[:1]
+    rebuilt = focus.cached_index(definition=str(definition), graph_input=graph_input, key="")
+    assert rebuilt["out_indices"].tolist() == [1]
+
+
+def test_cache_is_not_unpickled(tmpdir):
+    """Test that a cache file holding pickled objects is ignored rather than loaded."""
+    definition = tmpdir.join("graph.xlsx")
+    definition.write("v1")
+    path = focus.index_path(str(definition))
+    path.parent.mkdir(parents=True)
+    with path.open(mode="wb") as out:
+        np.savez(out, meta=np.array([{"stamp": None}], dtype=object))
+
+    assert focus.cached_definition(definition=str(definition)) is None
@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.optimize` module."""
+import gzip
+import sys
+
+import pytest
+
+from easygv import optimize
+
+
+SVG = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<!DOCTYPE svg PUBLIC "-//W3C//DTD SVG 1.1//EN"
+ "http://www.w3.org/Graphics/SVG/1.1/DTD/svg11.dtd">
+<!-- Generated by graphviz version 2.43.0 (0)
+ -->
+<!-- Title: %3 Pages: 1 -->
+<svg width="62pt" height="44pt" viewBox="0.00 0.00 62.00 44.00" xmlns="http://www.w3.org/2000/svg">
+<g id="graph0" class="graph" transform="scale(1 1) rotate(0) translate(4 40)">
+<polygon fill="white" stroke="transparent" points="-4,4 -4,-40 58,-40 58,4 -4,4"/>
+<!-- a -->
+<g id="node1" class="node">
+<title>a</title>
+<ellipse fill="none" stroke="black" cx="27" cy="-18" rx="27" ry="18"/>
+<text text-anchor="middle" x="27" y="-14.3" font-family="Times,serif" font-size="14.00" fill="black">fill=&quot;black&quot;</text>
+</g>
+</g>
+</svg>
+"""
+
+MINIFIED = """<?xml version="1.0" encoding="UTF-8" standalone="no"?>
+<svg width="62pt" height="44pt" viewBox="0.00 0.00 62.00 44.00" xmlns="http://www.w3.org/2000/svg">
+<g id="graph0" class="graph" transform="scale(1 1) rotate(0) translate(4 40)">
+<polygon fill="white" points="-4,4 -4,-40 58,-40 58,4 -4,4"/>
+<g id="node1" class="node">
+<title>a</title>
+<ellipse fill="none" stroke="black" cx="27" cy="-18" rx="27" ry="18"/>
+<text text-anchor="middle" x="27" y="-14.3" font-family="Times,serif" font-size="14.00">fill=&quot;black&quot;</text>
+</g>
+</g>
+</svg>
+"""
+
+
+def test_minify_svg():
+    """Test that comments, the DOCTYPE and default attributes are dropped line by line."""
+    assert "".join(optimize.minify_svg(SVG.splitlines(True))) == MINIFIED
+
+
+def test_render_svg_streams_compressed_output(tmpdir):
+    """Test that the renderer's output is minified and gzipped into the file."""
+    output = tmpdir.join("g.gv.svgz")
+    cmd = [sys.executable, "-c", "import sys; sys.stdout.write({svg!r})".format(svg=SVG)]
+
+    sizes = optimize.render_svg(cmd=cmd, output=str(output), compress=True)
+
+    assert gzip.open(str(output), "rt").read() == MINIFIED
+    assert sizes.svg == len(SVG)
+    assert sizes.written == output.size()
+
+
+def test_optimize_png_requires_a_tool(tmpdir, monkeypatch):
+    """Test the error raised when no PNG optimizer is installed."""
+    monkeypatch.setattr(optimize.shutil, "which", lambda prog: None)
+    with pytest.raises(ValueError):
+        optimize.optimize_png(path=str(tmpdir.join("g.gv.png")))
@@ -0,0 +1,82 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.preview` module."""
+import pandas as pd
+
+from munch import Munch
+
+from easygv import preview
+
+
+def clustered_input():
+    """Return ``a -> b -> c -> d``, ``a -> c`` and ``x -> c`` with ``a``/``b`` and ``c``/``d`` clustered."""
+    nodes = pd.DataFrame({"name": ["a", "b", "c", "d", "x"],
+                          "label": ["A", "B", "C", "D", "X"],
+                          "node_class": "",
+                          "cluster_name": ["cluster_1", "cluster_1", "cluster_2", "cluster_2", "cluster_"]})
+    edges = pd.DataFrame({"u_name": ["a", "b", "c", "a", "x"],
+                          "v_name": ["b", "c", "d", "c", "c"],
+                          "label": "",
+                          "edge_class": ""})
+    clusters = pd.DataFrame({"name": ["cluster_1", "cluster_2"], "label": ["One", "Two"], "cluster_class": ""})
+    return Munch(Nodes=nodes, Edges=edges, Clusters=clusters)
+
+
+def test_collapse_clusters():
+    """Test that clusters become single nodes joined by merged edges."""
+    collapsed = preview.collapse_clusters(clustered_input())
+
+    assert "Clusters" not in collapsed
+    assert collapsed.Nodes["name"].tolist() == ["x", "cluster_1", "cluster_2"]
+    assert collapsed.Nodes["label"].tolist() == ["X", "One (2)", "Two (2)"]
+    edges = sorted(map(tuple, collapsed.Edges[["u_name", "v_name"]].values.tolist()))
+    assert edges == [("cluster_1", "cluster_2"), ("x", "cluster_2")]
+    assert collapsed.Edges["count"].tolist() == [2, 1]
+
+
+def test_sample_nodes():
+    """Test that the best connected nodes are kept with the edges among them."""
+    sampled = preview.sample_nodes(clustered_input(), max_nodes=2)
+
+    assert sampled.Nodes["name"].tolist() == ["a", "c"]
+    assert sampled.Edges[["u_name", "v_name"]].values.tolist() == [["a", "c"]]
+
+
+def test_sample_nodes_numeric_names():
+    """Test sampling a graph whose node names were read from Excel as integers."""
+    nodes = pd.DataFrame({"name": [1, 2, 3, 4], "label": ["A", "B", "C", "D"], "node_class": ""})
+    edges = pd.DataFrame({"u_name": [1, 2, 3, 1], "v_name": [2, 3, 4, 3], "label": "", "edge_class": ""})
+
+    sampled = preview.sample_nodes(Munch(Nodes=nodes, Edges=edges), max_nodes=2)
+
+    assert sampled.Nodes["name"].tolist() == [1, 3]
+    assert sampled.Edges[["u_name", "v_name"]].values.tolist() == [[1, 3]]
+
+
+def test_preview_graph_input_small_graph():
+    """Test that small graphs are previewed whole."""
+    graph_input = clustered_input()
+    assert preview.preview_graph_input(graph_input, max_nodes=5) is graph_input
+    assert len(preview.preview_graph_input(graph_input, max_nodes=2).Nodes) == 2
+
+
+def test_publish(tmpdir):
+    """Test that finished files and directories replace the ones in place."""
+    directory = tmpdir.mkdir("out")
+    directory.join("fig.gv.svg").write("preview")
+    directory.mkdir("fig_files").join("old.png").write("old")
+
+    scratch = directory.mkdir(".easygv-render-x").mkdir("out")
+    scratch.join("fig.gv.svg").write("full")
+    scratch.join("fig.gv.png").write("png")
+    scratch.mkdir("fig_files").join("new.png").write("new")
+
+    published = preview.publish(scratch=str(scratch), directory=str(directory))
+
+    assert sorted(p.name for p in published) == ["fig.gv.png", "fig.gv.svg", "fig_files"]
+    assert directory.join("fig.gv.svg").read() == "full"
+    assert [p.basename for p in directory.join("fig_files").listdir()] == ["new.png"]
+    assert scratch.listdir() == []
+    assert sorted(p.basename for p in directory.listdir()) == [".easygv-render-x", "fig.gv.png", "fig.gv.svg",
+                                                               "fig_files"]
@@ -0,0 +1,150 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.render` module."""
+import shutil
+import subprocess
+import sys
+
+import pytest
+
+import pygraphviz as pgv
+
+from easygv import render
+
+
+needs_graphviz = pytest.mark.skipif(shutil.which("dot") is None, reason="graphviz programs not installed")
+
+SOURCE = """digraph {
+    node [shape=box];
+    { node [color=red]; a; b; }
+    a -> b [label=x];
+    subgraph cluster_1 { graph [label=One]; a; }
+}
+"""
+
+LAYOUT = """digraph {
+    graph [bb="0,0,62,124"];
+    node [label="\\N"];
+    subgraph cluster_1 {
+        graph [bb="8,8,78,83", label=One, lp="43,71.5"];
+        a [height=0.5, pos="43,34", width=0.75];
+    }
+    b [height=0.5, pos="31,106", width=0.75, shape=egg];
+    a -> b [label=x, lp="40,70", pos="e,31,88 43,52 43,60 31,70 31,88"];
+}
+"""
+
+
+def test_transfer_layout():
+    """Test that geometry comes from the layout and styling from the source."""
+    g = pgv.AGraph(string=render.transfer_layout(source=SOURCE, layout=LAYOUT))
+
+    assert g.graph_attr["bb"] == "0,0,62,124"
+    assert g.get_node("b").attr["pos"] == "31,106"
+    assert g.get_node("b").attr["shape"] == "box"
+    assert g.get_node("b").attr["color"] == "red"
+    assert g.get_edge("a", "b").attr["pos"].startswith("e,31,88")
+    assert g.get_subgraph("cluster_1").graph_attr["bb"] == "8,8,78,83"
+
+
+def test_transfer_layout_topology_changed():
+    """Test that a layout missing nodes or edges is rejected."""
+    source = SOURCE.replace("a -> b", "a -> c")
+    assert render.transfer_layout(source=source, layout=LAYOUT) is None
+
+
+@needs_graphviz
+def test_layout_and_render_positioned(tmpdir):
+    """Test computing a layout and rendering from it with neato -n2."""
+    positioned = render.compute_layout(source=SOURCE)
+    assert "pos=" in positioned
+
+    paths = render.render_positioned(positioned=positioned, gv_path=str(tmpdir.join("g.gv")), formats=["svg"])
+    assert tmpdir.join("g.gv.svg").check()
+    assert paths == [str(tmpdir.join("g.gv.svg"))]
+
+
+def test_layout_within_budget_falls_back(monkeypatch):
+    """Test that timed out strategies are skipped and the one used is reported."""
+    calls = []
+
+    def fake_layout(source, prog, args, timeout):
+        calls.append((prog, timeout, "label=x" in source))
+        if len(calls) < 4:
+            raise subprocess.TimeoutExpired(cmd=prog, timeout=timeout)
+        return "positioned"
+
+    monkeypatch.setattr(render, "compute_layout", fake_layout)
+    positioned, strategy = render.layout_within_budget(source=SOURCE, budget=8)
+
+    assert (positioned, strategy) == ("positioned", "no edge labels")
+    assert [c[0] for c in calls] == ["dot"] * 4
+    assert calls[0][1] <= 4
+    assert calls[2][2] and not calls[3][2]
+
+
+def test_layout_within_budget_gives_up(monkeypatch):
+    """Test that running out of strategies raises TimeoutExpired."""
+    def fake_layout(source, prog, args, timeout):
+        raise subprocess.TimeoutExpired(cmd=prog, timeout=timeout)
+
+    monkeypatch.setattr(render, "compute_layout", fake_layout)
+    with pytest.raises(subprocess.TimeoutExpired):
+        render.layout_within_budget(source=SOURCE, budget=1)
+
+
+FAKE_PROG = """#!{python}
+import sys
+out = [a[2:] for a in sys.argv[1:] if a.startswith("-o")]
+sources = [a for a in sys.argv[1:] if not a.startswith("-")]
+text = open(sources[0]).read() if sources else sys.stdin.read()
+if out:
+    open(out[0], "w").write(sys.argv[1][2:] + " " + str(len(text)))
+else:
+    sys.stdout.write("<svg>\\n  <!-- comment -->\\n  <g>" + str(len(text)) + "</g>\\n</svg>\\n")
+"""
+
+
+@pytest.mark.parametrize("jobs", [3, 1])
+def test_render_concurrently(tmpdir, jobs):
+    """Test that every chunk reaches the .gv file and each format's output, streamed formats included."""
+    prog = tmpdir.join("fakeviz")
+    prog.write(FAKE_PROG.format(python=sys.executable))
+    prog.chmod(0o755)
+    chunks = ["digraph {\n", "a -> b;\n", "}\n"]
+    gv_path = str(tmpdir.join("g.gv"))
+
+    paths = render.render_concurrently(chunks=iter(chunks), gv_path=gv_path, formats=["pdf", "png", "svgmin"],
+                                       prog=str(prog), jobs=jobs)
+
+    assert paths == [gv_path + ".pdf", gv_path + ".png", gv_path + ".min.svg"]
+    assert tmpdir.join("g.gv").read() == "".join(chunks)
+    assert tmpdir.join("g.gv.pdf").read() == "pdf 20"
+    assert tmpdir.join("g.gv.png").read() == "png 20"
+    assert tmpdir.join("g.gv.min.svg").read() == "<svg>\n<g>20</g>\n</svg>\n"
+
+
+def test_render_concurrently_reports_failures(tmpdir):
+    """Test that a failing renderer raises once all processes are done."""
+    with pytest.raises(subprocess.CalledProcessError):
+        render.render_concurrently(chunks=["digraph {}"], gv_path=str(tmpdir.join("g.gv")), formats=["svg"],
+                                   prog="false")
+
+
+BAD_SVG_PROG = """#!{python}
+import sys
+sys.stdin.read()
+sys.stdout.buffer.write(b"<svg>\\n  <g>\\xff\\xfe</g>\\n</svg>\\n")
+"""
+
+
+def test_render_concurrently_reports_minify_errors(tmpdir):
+    """Test that an error while minifying is raised even though graphviz succeeded."""
+    prog = tmpdir.join("badviz")
+    prog.write(BAD_SVG_PROG.format(python=sys.executable))
+    prog.chmod(0o755)
+
+    with pytest.raises(UnicodeDecodeError):
+        render.render_concurrently(chunks=["digraph {}"], gv_path=str(tmpdir.join("g.gv")), formats=["svgmin"],
+                                   prog=str(prog))
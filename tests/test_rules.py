@@ -0,0 +1,125 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.rules` module."""
+import textwrap
+
+import pytest
+
+import pandas as pd
+
+from munch import Munch
+
+from easygv import easygv
+from easygv import rules
+
+
+ATTRS_YAML = """
+GRAPH:
+    rankdir: LR
+NODES:
+    BASE:
+        shape: box
+    ACTUAL:
+        analysis:
+            fillcolor: red
+        mover:
+            fillcolor: blue
+EDGES:
+    BASE:
+        color: black
+    ACTUAL:
+        flow:
+            style: dashed
+RULES:
+    - name: hubs
+      applies_to: nodes
+      where:
+          degree: {ge: 2}
+      attrs:
+          penwidth: 4
+    - name: late_but_weak
+      applies_to: nodes
+      priority: -1
+      where:
+          label: {matches: '^A'}
+      attrs:
+          penwidth: 1
+          shape: egg
+    - applies_to: edges
+      where:
+          u_node_class: analysis
+      inherits_from: flow
+      attrs:
+          color: red
+"""
+
+
+@pytest.fixture
+def graph_input():
+    """Return a small in-memory graph definition."""
+    nodes = pd.DataFrame({"name": ["a", "b", "c"],
+                          "label": ["Alpha", "Beta", "Gamma"],
+                          "node_class": ["analysis", "mover", "mover"]})
+    edges = pd.DataFrame({"u_name": ["a", "b", "a"],
+                          "v_name": ["b", "c", "c"],
+                          "label": ["", "", ""],
+                          "edge_class": ["flow", "flow", ""]})
+    return Munch(Nodes=nodes, Edges=edges)
+
+
+@pytest.fixture
+def attrs(tmpdir):
+    """Return processed attributes from ``ATTRS_YAML``."""
+    path = tmpdir.join("attrs.yaml")
+    path.write(textwrap.dedent(ATTRS_YAML))
+    return easygv.process_attrs(str(path))
+
+
+def test_compile_selector():
+    """Test the shorthand and operator forms of ``where`` entries."""
+    assert rules.compile_selector("node_class", "analysis")[0].op == "eq"
+    assert rules.compile_selector("node_class", ["a", "b"])[0].op == "in"
+    ops = [s.op for s in rules.compile_selector("degree", {"gt": 1, "le": 5})]
+    assert sorted(ops) == ["gt", "le"]
+
+    with pytest.raises(ValueError):
+        rules.compile_selector("degree", {"bigger": 1})
+
+
+def test_rules_precedence(graph_input, attrs):
+    """Test priority ordering and derived columns."""
+    assert [r.name for r in attrs.rules.nodes] == ["late_but_weak", "hubs"]
+
+    resolved = rules.resolve_rule_attrs(kind="nodes", graph_input=graph_input, rules=attrs.rules.nodes)
+    assert resolved["a"] == {"penwidth": 4, "shape": "egg"}
+    assert resolved["c"] == {"penwidth": 4}
+    assert "b" in resolved
+
+    resolved = rules.resolve_rule_attrs(kind="edges", graph_input=graph_input, rules=attrs.rules.edges)
+    assert set(resolved) == {("a", "b"), ("a", "c")}
+    assert resolved[("a", "c")] == {"style": "dashed", "color": "red"}
+
+
+def test_build_graph_applies_rules(graph_input, attrs):
+    """Test that rules override the class attributes in the built graph."""
+    g = easygv.build_graph(graph_input=graph_input, attrs=attrs)
+
+    assert g.get_node("a").attr["fillcolor"] == "red"
+    assert g.get_node("a").attr["shape"] == "egg"
+    assert g.get_node("c").attr["penwidth"] == "4"
+    assert g.get_edge("a", "c").attr["color"] == "red"
+    assert g.get_edge("b", "c").attr["color"] == "black"
+    assert g.get_edge("b", "c").attr["style"] == "dashed"
+
+
+def test_cluster_size_without_cluster_name():
+    """Test that cluster size is 0, not an error, when the nodes name no clusters."""
+    graph_input = Munch(Nodes=pd.DataFrame({"name": ["a"], "label": ["A"], "node_class": [""]}),
+                        Edges=pd.DataFrame(columns=["u_name", "v_name"]),
+                        Clusters=pd.DataFrame({"name": ["cluster_1"], "label": ["One"], "cluster_class": [""]}))
+    compiled = rules.compile_rules([{"applies_to": "clusters", "where": {"size": {"ge": 1}}, "attrs": {"color": "red"}},
+                                    {"applies_to": "clusters", "where": {"size": 0}, "attrs": {"color": "grey"}}])
+
+    matched = rules.resolve_rule_attrs(kind="clusters", graph_input=graph_input, rules=compiled.clusters)
+    assert matched == {"cluster_1": {"color": "grey"}}
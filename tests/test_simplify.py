@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.simplify` module."""
+import numpy as np
+import pandas as pd
+
+from munch import Munch
+
+from easygv import simplify
+
+
+def make_input(pairs, node_class=None):
+    """Return a graph definition from ``(u, v)`` pairs."""
+    names = sorted(set(n for pair in pairs for n in pair))
+    nodes = pd.DataFrame({"name": names,
+                          "label": names,
+                          "node_class": [(node_class or {}).get(n, "") for n in names]})
+    edges = pd.DataFrame({"u_name": [u for u, _ in pairs],
+                          "v_name": [v for _, v in pairs],
+                          "label": "",
+                          "edge_class": ""})
+    return Munch(Nodes=nodes, Edges=edges)
+
+
+def test_collapse_duplicates():
+    """Test that parallel edges become one weighted edge."""
+    graph_input = make_input([("a", "b"), ("a", "b"), ("a", "b"), ("a", "b"), ("b", "c")])
+    edges = simplify.collapse_duplicates(graph_input.Edges)
+
+    assert len(edges) == 2
+    ab = edges.set_index(["u_name", "v_name"]).loc[("a", "b")]
+    assert ab["count"] == 4
+    assert ab["penwidth"] == 3.0
+    assert edges.set_index(["u_name", "v_name"]).loc[("b", "c"), "penwidth"] == ""
+
+
+def test_topological_order():
+    """Test the vectorized Kahn layering and cycle detection."""
+    u = np.array([0, 0, 1, 2])
+    v = np.array([1, 2, 3, 3])
+    order, level = simplify.topological_order(n=4, u=u, v=v)
+    assert list(level) == [0, 1, 1, 2]
+    assert len(order) == 4
+
+    order, level = simplify.topological_order(n=3, u=np.array([0, 1, 2]), v=np.array([1, 2, 1]))
+    assert len(order) == 1
+    assert list(level) == [0, -1, -1]
+
+
+def test_simplify_stats():
+    """Test transitive reduction, hub bundling and the reported stats."""
+    pairs = [("a", "b"), ("b", "c"), ("a", "c"), ("a", "c")]
+    pairs += [("hub", "leaf{i}".format(i=i)) for i in range(5)]
+    classes = {"leaf{i}".format(i=i): "message" for i in range(5)}
+    graph_input = make_input(pairs, node_class=classes)
+
+    simplified, stats = simplify.simplify(graph_input, collapse=True, reduce=True, min_fanout=3)
+
+    assert stats.duplicates_removed == 1
+    assert stats.transitive_removed == 1
+    assert stats.bundled_nodes_removed == 4
+    assert stats.bundled_edges_removed == 4
+    assert stats.edges_out == 3
+
+    bundle = simplified.Nodes.loc[simplified.Nodes["name"].str.endswith("bundle0")]
+    assert bundle["label"].tolist() == ["5 message"]
+    assert ("a", "c") not in set(zip(simplified.Edges["u_name"], simplified.Edges["v_name"]))
+
+
+def test_bundle_hubs_without_class_columns():
+    """Test bundling a definition that has no node_class or edge_class columns."""
+    pairs = [("hub", "leaf{i}".format(i=i)) for i in range(4)] + [("hub", "other")]
+    graph_input = make_input(pairs)
+    nodes = graph_input.Nodes.drop("node_class", axis=1)
+    edges = graph_input.Edges.drop("edge_class", axis=1)
+
+    nodes, edges = simplify.bundle_hubs(nodes=nodes, edges=edges, min_fanout=3)
+
+    assert nodes["label"].tolist() == ["hub", "5 nodes"]
+    assert edges[["u_name", "count"]].values.tolist() == [["hub", 5]]
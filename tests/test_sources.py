@@ -0,0 +1,159 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.sources` module."""
+import functools
+import sqlite3
+
+import pandas as pd
+
+import pygraphviz as pgv
+
+from munch import Munch
+
+from easygv import dotwriter
+from easygv import rules
+from easygv import sources
+
+
+def write_edges_csv(path):
+    """Write a small Edges table to ``path`` and return it."""
+    edges = pd.DataFrame({"u_name": ["a", "a", "b", "c", "a"],
+                          "v_name": ["b", "c", "c", "a", "b"],
+                          "label": ["x", None, None, None, None],
+                          "edge_class": ["flow", "flow", "", "", "flow"],
+                          "unused": range(5)})
+    edges.to_csv(str(path), index=False)
+    return edges
+
+
+def test_iter_edge_chunks(tmpdir):
+    """Test that CSV edges are read in bounded, recoded chunks."""
+    path = tmpdir.join("edges.csv")
+    write_edges_csv(path)
+
+    chunks = list(sources.iter_edge_chunks(path=str(path), chunksize=2))
+    assert [len(c) for c in chunks] == [2, 2, 1]
+    assert set(chunks[0].columns) == set(sources.EDGE_COLUMNS)
+    assert chunks[0]["label"].tolist() == ["x", ""]
+
+    degrees = sources.edge_degrees(chunks)
+    assert degrees.out_degree["a"] == 3
+    assert degrees.in_degree["b"] == 2
+
+
+def test_write_dot_with_edge_chunks(tmpdir):
+    """Test streaming edges into the DOT writer, including degree rules."""
+    path = tmpdir.join("edges.csv")
+    write_edges_csv(path)
+    nodes = pd.DataFrame({"name": ["a", "b", "c"],
+                          "label": ["A", "B", "C"],
+                          "node_class": ["", "", ""]})
+    attrs = Munch(graph=Munch(), nodes=Munch(BASE=Munch()), edges=Munch(BASE=Munch(), flow=Munch(color="red")),
+                  rules=rules.compile_rules([{"where": {"degree": {"ge": 4}}, "attrs": {"shape": "egg"}}]))
+
+    gv_path = tmpdir.join("out.gv")
+    edge_chunks = functools.partial(sources.iter_edge_chunks, path=str(path), chunksize=2)
+    dotwriter.write_dot(graph_input=Munch(Nodes=nodes), attrs=attrs, path=str(gv_path), edge_chunks=edge_chunks)
+
+    g = pgv.AGraph(string=gv_path.read())
+    assert len(g.edges()) == 4
+    assert g.get_edge("a", "c").attr["color"] == "red"
+    assert g.get_node("a").attr["shape"] == "egg"
+    assert g.get_node("b").attr["shape"] != "egg"
+
+
+def test_edge_chunks_keep_rule_columns(tmpdir):
+    """Test that streamed edges keep the columns edge rules test."""
+    path = tmpdir.join("edges.csv")
+    write_edges_csv(path)
+    nodes = pd.DataFrame({"name": ["a", "b", "c"], "label": ["A", "B", "C"], "node_class": ["", "", ""]})
+    compiled = rules.compile_rules([{"applies_to": "edges", "where": {"unused": {"ge": 3}, "u_node_class": ""},
+                                     "attrs": {"style": "dashed"}}])
+    assert rules.rule_columns(compiled) == Munch(Nodes=[], Edges=["unused"], Clusters=[])
+    attrs = Munch(graph=Munch(), nodes=Munch(BASE=Munch()), edges=Munch(BASE=Munch()), rules=compiled)
+
+    gv_path = tmpdir.join("out.gv")
+    edge_chunks = functools.partial(sources.iter_edge_chunks, path=str(path), chunksize=2,
+                                    columns=rules.rule_columns(compiled).Edges)
+    dotwriter.write_dot(graph_input=Munch(Nodes=nodes), attrs=attrs, path=str(gv_path), edge_chunks=edge_chunks)
+
+    g = pgv.AGraph(string=gv_path.read())
+    assert g.get_edge("c", "a").attr["style"] == "dashed"
+    assert g.get_edge("a", "c").attr["style"] != "dashed"
+
+
+def make_sqlite(path):
+    """Create a small inventory database at ``path``."""
+    connection = sqlite3.connect(str(path))
+    connection.executescript("""
+        CREATE TABLE inventory (name TEXT, label TEXT, node_class TEXT, cluster_name TEXT, owner TEXT);
+        INSERT INTO inventory VALUES ('a', 'A', 'analysis', 'x', 'me'), ('b', 'B', NULL, 'x', 'you'),
+                                     ('c', 'C', 'mover', NULL, 'me');
+        CREATE TABLE Edges (u_name TEXT, v_name TEXT, label TEXT, edge_class TEXT, weight INTEGER);
+        INSERT INTO Edges VALUES ('a', 'b', NULL, 'flow', 1), ('b', 'c', 'x', '', 5);
+        CREATE TABLE Clusters (name TEXT, label TEXT, cluster_class TEXT);
+        INSERT INTO Clusters VALUES ('x', 'X', 'group');
+    """)
+    connection.commit()
+    connection.close()
+
+
+def test_table_query():
+    """Test column selection and filter pushdown into SQL."""
+    assert sources.table_query("Nodes") == 'SELECT * FROM "Nodes"'
+    query = sources.table_query("select * from t;", columns=["name"], where="x > 1")
+    assert query == 'SELECT "name" FROM (select * from t) AS easygv_src WHERE x > 1'
+
+
+def test_load_graph_input_sqlite(tmpdir):
+    """Test loading recoded tables from SQLite queries with pushed-down filters."""
+    path = tmpdir.join("graph.db")
+    make_sqlite(path)
+
+    data = sources.load_graph_input_sqlite(path=str(path),
+                                           queries={"Nodes": "SELECT * FROM inventory"},
+                                           where={"Edges": "weight > 2"},
+                                           batch_size=1)
+
+    assert list(data.Nodes.columns) == ["name", "label", "node_class", "cluster_name"]
+    assert data.Nodes["node_class"].tolist() == ["analysis", "", "mover"]
+    assert data.Nodes["cluster_name"].tolist() == ["cluster_x", "cluster_x", "cluster_"]
+    assert data.Clusters["name"].tolist() == ["cluster_x"]
+    assert data.Edges[["u_name", "v_name"]].values.tolist() == [["b", "c"]]
+    assert "weight" in data.Edges.columns
+
+
+def test_sqlite_keeps_rule_columns(tmpdir):
+    """Test that a rule on a column build_graph does not use still applies to a database definition."""
+    path = tmpdir.join("graph.db")
+    make_sqlite(path)
+    compiled = rules.compile_rules([{"where": {"owner": "me"}, "attrs": {"shape": "egg"}}])
+
+    data = sources.load_graph_input_sqlite(path=str(path), queries={"Nodes": "inventory"},
+                                           columns=rules.rule_columns(compiled))
+
+    assert data.Nodes["owner"].tolist() == ["me", "you", "me"]
+    matched = rules.resolve_rule_attrs(kind="nodes", graph_input=data, rules=compiled.nodes)
+    assert sorted(matched) == ["a", "c"]
+
+
+def test_split_graphs():
+    """Test per-graph sheets, the graph column and shared rows."""
+    tables = {"Nodes": pd.DataFrame({"name": ["a", "b", "c"], "graph": ["one", "", "two"]}),
+              "Edges": pd.DataFrame({"u_name": ["a"], "v_name": ["b"]}),
+              "Nodes.three": pd.DataFrame({"name": ["z"]})}
+    graphs = sources.split_graphs(tables)
+
+    assert list(graphs) == ["three", "one", "two"]
+    assert sorted(graphs["one"].Nodes["name"]) == ["a", "b"]
+    assert sorted(graphs["two"].Nodes["name"]) == ["b", "c"]
+    assert graphs["three"].Nodes["name"].tolist() == ["z"]
+    assert "graph" not in graphs["one"].Nodes.columns
+    assert graphs["two"].Edges is tables["Edges"]
+
+
+def test_split_graphs_single():
+    """Test that an ordinary workbook is one graph."""
+    tables = {"Nodes": pd.DataFrame({"name": ["a"]})}
+    assert sources.split_graphs(tables) == {None: tables}
@@ -0,0 +1,86 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.tiles` module."""
+import shutil
+
+import pytest
+
+import pygraphviz as pgv
+
+from easygv import tiles
+
+
+needs_graphviz = pytest.mark.skipif(shutil.which("neato") is None, reason="graphviz programs not installed")
+
+LAYOUT = """digraph {
+    graph [bb="0,0,600,300"];
+    a [height=0.5, pos="27,18", width=0.75];
+    b [height=0.5, pos="573,282", width=0.75];
+    a -> b [pos="e,560,270 40,30 300,150 400,200 560,270"];
+}
+"""
+
+SCENE = """digraph {
+    graph [bb="0,0,600,300"];
+    subgraph cluster_1 {
+        graph [bb="0,0,100,60", label=One];
+        a [height=0.5, pos="27,18", width=0.75, label=<<b>A</b>>];
+    }
+    b [height=0.5, pos="573,282", width=0.75];
+    c [height=0.5, pos="573,18", width=0.75];
+    a -> b [pos="e,100,90 40,30 60,50 80,70 100,90"];
+}
+"""
+
+
+def test_tile_jobs():
+    """Test the Deep Zoom level sizes and tile centres."""
+    (width, height), jobs = tiles.tile_jobs(bb=(0, 0, 600, 300), tile_size=256)
+
+    assert (width, height) == (600, 300)
+    levels = sorted(set(job[0] for job in jobs))
+    assert levels == list(range(11))  # 2 ** 10 >= 600
+
+    deepest = [job for job in jobs if job[0] == 10]
+    assert len(deepest) == 3 * 2
+    level, column, row, tile_width, tile_height, zoom, x, y = max(deepest)
+    assert (column, row, tile_width, tile_height) == (2, 1, 88, 44)
+    assert zoom == 1.0
+    assert (x, y) == (512 + 44, 300 - 256 - 22)
+
+    assert [job[3:5] for job in jobs if job[0] == 0] == [(1, 1)]
+
+
+def test_tile_scene():
+    """Test that a tile's DOT text holds exactly the elements overlapping it, edge ends included."""
+    scene = tiles.tile_scene(SCENE)
+    assert len(scene.statements) == 5  # cluster, a, b, c, a -> b
+
+    (width, height), jobs = tiles.tile_jobs(bb=scene.bb, tile_size=256)
+    deepest = [job for job in jobs if job[0] == 10]
+    buckets = tiles.level_buckets(scene=scene, level_jobs=deepest, tile_size=256)
+
+    # The bottom left tile shows the cluster, a and the edge, which needs b as well
+    g = pgv.AGraph(string=tiles.tile_source(scene=scene, ids=buckets[(0, 1)]))
+    assert sorted(g.nodes()) == ["a", "b"]
+    assert g.get_subgraph("cluster_1").graph_attr["label"] == "One"
+    assert g.get_node("b").attr["pos"] == "573,282"
+    assert "label=<<b>A</b>>" in tiles.tile_source(scene=scene, ids=buckets[(0, 1)])
+
+    assert buckets[(2, 1)] == [3]
+    assert (1, 1) not in buckets
+
+    # The whole graph fits into the single tile of the top level
+    top = [job for job in jobs if job[0] == 0]
+    assert tiles.level_buckets(scene=scene, level_jobs=top, tile_size=256)[(0, 0)] == [0, 1, 2, 3, 4]
+
+
+@needs_graphviz
+def test_render_tiles(tmpdir):
+    """Test that every tile and the descriptor are written."""
+    dzi_path = tiles.render_tiles(LAYOUT, directory=str(tmpdir), name="g", tile_size=256, jobs=2)
+
+    assert 'Width="600" Height="300"' in dzi_path.read_text()
+    assert (tmpdir / "g_files" / "10" / "2_1.png").exists()
+    assert (tmpdir / "g_files" / "0" / "0_0.png").exists()
@@ -0,0 +1,73 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+
+"""Tests for `easygv.viewer` module."""
+import json
+import re
+
+from easygv import viewer
+
+
+LAYOUT = """digraph {
+    graph [bb="0,0,62,124"];
+    node [label="\\N", shape=box, style=filled, fillcolor="#FFCC00"];
+    subgraph cluster_1 {
+        graph [bb="8,8,78,83", label=One];
+        a [height=0.5, pos="43,34", width=0.75];
+    }
+    b [height=0.5, pos="31,106", width=0.75, shape=egg, label="</script>"];
+    a -> b [color=red, pos="e,31,88 43,52 43,60 31,70 31,80"];
+}
+"""
+
+
+def test_spline_points():
+    """Test that the arrow tip follows the spline control points."""
+    points, tip = viewer.spline_points("e,31,88 43,52 43,60 31,70 31,80")
+    assert points == [[43.0, 52.0], [43.0, 60.0], [31.0, 70.0], [31.0, 80.0], [31.0, 88.0]]
+    assert tip
+
+    assert viewer.spline_points("s,1,2 3,4 5,6 7,8 9,10") == ([[3.0, 4.0], [5.0, 6.0], [7.0, 8.0], [9.0, 10.0]], False)
+
+
+def test_geometry_index():
+    """Test the flat, top-left based geometry of nodes, edges and clusters."""
+    index = viewer.geometry_index(LAYOUT)
+
+    assert index["bb"] == [62.0, 124.0]
+    assert index["names"] == ["a", "b"]
+    assert index["labels"] == [None, "</script>"]
+    assert index["nodes"] == [43.0, 90.0, 54.0, 36.0, 31.0, 18.0, 54.0, 36.0]
+    assert index["shapes"] == [1, 0]
+    assert index["edges"] == [0, 1]
+    assert index["offsets"] == [0, 5]
+    assert index["points"][:2] == [43.0, 72.0]
+    assert index["points"][-2:] == [31.0, 36.0]
+    assert index["clusters"] == [8.0, 41.0, 78.0, 116.0]
+    assert index["clabels"] == ["One"]
+    assert index["palette"][index["fill"][0]] == "#FFCC00"
+    assert index["palette"][index["ecolor"][0]] == "red"
+
+
+def test_geometry_index_parallel_edges():
+    """Test that each of several edges between the same nodes keeps its own geometry."""
+    layout = LAYOUT.rstrip()[:-1] + """    a -> b [color=blue, pos="e,50,88 43,52 50,60 50,70 50,80"];
+}
+"""
+    index = viewer.geometry_index(layout)
+
+    assert index["edges"] == [0, 1, 0, 1]
+    assert [index["palette"][c] for c in index["ecolor"]] == ["red", "blue"]
+    assert index["points"][:2] == [43.0, 72.0]
+    assert index["points"][10:12] == [43.0, 72.0]
+    assert index["points"][-2:] == [50.0, 36.0]
+
+
+def test_viewer_html_embeds_the_index():
+    """Test that the index survives embedding, including text that would close the script."""
+    index = viewer.geometry_index(LAYOUT)
+    page = viewer.viewer_html(index=index, title="a & b")
+
+    assert "<title>a &amp; b</title>" in page
+    data = re.search(r'<script id="easygv-data" type="application/json">(.*?)</script>', page, re.S).group(1)
+    assert json.loads(data) == index